@@ -1,3 +1,3 @@
-from . import users, runbooks, versions, credentials, execution, audit
+from . import users, runbooks, versions, credentials, execution, audit, analytics
 
-__all__ = ["users", "runbooks", "versions", "credentials", "execution", "audit"]
+__all__ = ["users", "runbooks", "versions", "credentials", "execution", "audit", "analytics"]
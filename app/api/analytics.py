@@ -0,0 +1,62 @@
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, Query
+from typing_extensions import Literal
+
+from app.models.runbook import Runbook
+from app.security import require_roles
+from app.services.analytics import (
+    FleetAnalytics,
+    RunbookAnalytics,
+    default_window,
+    fleet_analytics,
+    runbook_analytics,
+)
+
+router = APIRouter()
+
+auth = require_roles("sre", "developer")
+
+
+@router.get(
+    "/summary",
+    response_model=FleetAnalytics,
+    summary="Fleet-wide execution analytics",
+)
+async def get_fleet_analytics(
+    since: Optional[datetime] = Query(None, description="Defaults to 30 days before until"),
+    until: Optional[datetime] = Query(None, description="Defaults to now"),
+    granularity: Literal["hour", "day"] = "day",
+    _=auth,
+):
+    """
+    Success rate, p50/p95 job durations and the most failing runbooks across
+    all executions in the window, read from precomputed rollups.
+    """
+    since, until = default_window(since, until)
+    return await fleet_analytics(since, until, granularity)
+
+
+@router.get(
+    "/runbooks/{runbook_id}",
+    response_model=RunbookAnalytics,
+    summary="Execution analytics for a runbook",
+)
+async def get_runbook_analytics(
+    runbook_id: UUID,
+    since: Optional[datetime] = Query(None, description="Defaults to 30 days before until"),
+    until: Optional[datetime] = Query(None, description="Defaults to now"),
+    granularity: Literal["hour", "day"] = "day",
+    _=auth,
+):
+    """
+    Success rate and p50/p95 durations of a runbook's jobs and of each of
+    its blocks, with the failure hotspots first, read from precomputed
+    rollups.
+    """
+    if not await Runbook.get(runbook_id):
+        raise HTTPException(status_code=404, detail="Runbook not found")
+    since, until = default_window(since, until)
+    return await runbook_analytics(runbook_id, since, until, granularity)
@@ -1,34 +1,95 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing_extensions import Literal
 
 from app.models.audit import AuditLog
 from app.security import require_roles
+from app.services.audit import (
+    AUDIT_FLUSH_TIMEOUT,
+    AUDIT_SORT,
+    audit_filter,
+    audit_writer,
+    encode_cursor,
+    export_audit_logs,
+)
 
 router = APIRouter()
 
 auth = require_roles("sre")
 
 
+def _filter_or_400(**kwargs):
+    try:
+        return audit_filter(**kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("", response_model=List[AuditLog], summary="Query audit logs")
 async def get_audit_logs(
+    response: Response,
     user_id: UUID = Query(None, description="Filter by user ID"),
     action: str = Query(None, description="Filter by action type"),
     target_id: UUID = Query(None, description="Filter by target entity ID"),
+    start: Optional[datetime] = Query(None, description="Only entries at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only entries before this time"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
     limit: int = Query(100, ge=1, le=1000, description="Number of logs to return"),
     _=auth,
 ):
     """
-    Retrieve a list of audit log entries, with optional filters.
+    Retrieve a page of audit log entries, newest first, with optional
+    filters. When more entries follow, the `X-Next-Cursor` response header
+    holds the cursor for the next page.
     """
-    query = {}
-    if user_id:
-        query["user_id"] = user_id
-    if action:
-        query["action"] = action
-    if target_id:
-        query["target_id"] = target_id
-
-    logs = await AuditLog.find(query).sort("-timestamp").limit(limit).to_list()
+    query = _filter_or_400(
+        user_id=user_id,
+        action=action,
+        target_id=target_id,
+        start=start,
+        end=end,
+        cursor=cursor,
+    )
+    # Include entries still waiting in the write-behind queue.
+    await audit_writer.flush(AUDIT_FLUSH_TIMEOUT)
+    logs = await AuditLog.find(query).sort(AUDIT_SORT).limit(limit + 1).to_list()
+    if len(logs) > limit:
+        logs = logs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1])
     return logs
+
+
+@router.get(
+    "/export",
+    summary="Export audit logs",
+    response_class=StreamingResponse,
+)
+async def export_audit(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    user_id: UUID = Query(None, description="Filter by user ID"),
+    action: str = Query(None, description="Filter by action type"),
+    target_id: UUID = Query(None, description="Filter by target entity ID"),
+    start: Optional[datetime] = Query(None, description="Only entries at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only entries before this time"),
+    _=auth,
+):
+    """
+    Stream every matching audit log entry, newest first, as NDJSON or CSV.
+    Entries are read from the database cursor as they are sent, so exports
+    of any size use constant memory.
+    """
+    query = _filter_or_400(
+        user_id=user_id, action=action, target_id=target_id, start=start, end=end
+    )
+    await audit_writer.flush(AUDIT_FLUSH_TIMEOUT)
+    return StreamingResponse(
+        export_audit_logs(query, format),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="audit_logs.{format}"'
+        },
+    )
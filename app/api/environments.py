@@ -1,16 +1,20 @@
-import io
-from typing import List
+import asyncio
+from typing import List, Optional
 from uuid import UUID
 
-import docker
-from fastapi import APIRouter, Depends, HTTPException, status
-from loguru import logger
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.models import User
-from app.models.environment import ExecutionEnvironment
+from app.models.environment import BuildStatus, EnvironmentBuild, ExecutionEnvironment
 from app.security import get_current_user, require_roles
 from app.services.audit import log_action
+from app.services.builds import (
+    BUILD_TERMINAL_STATUSES,
+    build_manager,
+    release_environment_image,
+)
 
 router = APIRouter()
 
@@ -32,20 +36,15 @@ class EnvironmentRead(BaseModel):
     name: str
     description: str
     image_tag: str | None
+    status: BuildStatus
+    build_id: Optional[UUID] = None
+    build_error: Optional[str] = None
 
 
 auth = require_roles("sre")
 
-
-def get_docker_client():
-    try:
-        client = docker.from_env()
-        client.ping()
-        return client
-    except Exception:
-        raise HTTPException(
-            status_code=500, detail="Could not connect to Docker daemon."
-        )
+# How often a log stream checks for new lines of a running build.
+BUILD_LOG_POLL_INTERVAL = 1.0
 
 
 @router.post(
@@ -58,55 +57,27 @@ async def create_environment(
     data: EnvironmentCreate,
     current_user: User = Depends(get_current_user),
     _=auth,
-    docker_client: docker.DockerClient = Depends(get_docker_client),
 ):
     """
-    Create a new execution environment. This will trigger a Docker image build.
+    Create a new execution environment and queue its Docker image build.
+    The environment is returned at once with status `queued`; follow the
+    build with `GET /environments/{id}/build/logs`.
     """
     environment = ExecutionEnvironment(
         name=data.name,
         description=data.description,
         dockerfile=data.dockerfile,
         created_by=current_user.id,
+        status="queued",
     )
     await environment.insert()
-
-    image_tag = f"runbook-exec-env:{environment.id}"
-    try:
-        logger.info(f"Building Docker image {image_tag}...")
-        dockerfile_bytes = io.BytesIO(data.dockerfile.encode("utf-8"))
-        image, build_logs = docker_client.images.build(
-            fileobj=dockerfile_bytes, tag=image_tag, rm=True
-        )
-        environment.image_tag = image.tags[0]
-        await environment.save()
-        logger.info(f"Successfully built image {image_tag}")
-
-    except docker.errors.BuildError as e:
-        await environment.delete()  # Clean up the failed environment entry
-        logger.error(f"Docker build failed for environment {environment.id}: {e}")
-        raise HTTPException(status_code=400, detail=f"Docker build failed: {e}")
-    except Exception as e:
-        await environment.delete()
-        logger.error(f"An unexpected error occurred during image build: {e}")
-        if "Credentials store" in str(e):
-            raise HTTPException(
-                status_code=400,
-                detail=(
-                    "Docker credential helper error. "
-                    "This can happen if your local Docker is configured to use a "
-                    "cloud credential helper (like gcloud) and you are not logged in. "
-                    "Please check your Docker config (`~/.docker/config.json`) or "
-                    "ensure you are authenticated with your cloud provider."
-                ),
-            )
-        raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+    await build_manager.enqueue(environment, data.dockerfile)
 
     await log_action(
         current_user,
         "create_environment",
         environment.id,
-        details={"name": data.name, "image_tag": environment.image_tag},
+        details={"name": data.name, "build_id": str(environment.build_id)},
     )
 
     return EnvironmentRead(**environment.model_dump())
@@ -122,51 +93,31 @@ async def update_environment(
     data: EnvironmentUpdate,
     current_user: User = Depends(get_current_user),
     _=auth,
-    docker_client: docker.DockerClient = Depends(get_docker_client),
 ):
     """
-    Update an execution environment. If the Dockerfile is changed,
-    it will trigger a rebuild of the Docker image.
+    Update an execution environment. A changed Dockerfile queues a rebuild;
+    the current image stays in use until the new one is ready.
     """
     environment = await ExecutionEnvironment.get(environment_id)
     if not environment:
         raise HTTPException(status_code=404, detail="Environment not found")
 
-    environment.name = data.name
-    environment.description = data.description
-
-    if environment.dockerfile != data.dockerfile:
-        old_image_tag = environment.image_tag
-        new_image_tag = f"runbook-exec-env:{environment.id}"
-
-        try:
-            logger.info(f"Rebuilding Docker image {new_image_tag}...")
-            dockerfile_bytes = io.BytesIO(data.dockerfile.encode("utf-8"))
-            image, _ = docker_client.images.build(
-                fileobj=dockerfile_bytes, tag=new_image_tag, rm=True
-            )
-            environment.dockerfile = data.dockerfile
-            environment.image_tag = image.tags[0]
-            logger.info(f"Successfully rebuilt image {new_image_tag}")
-
-            # Clean up the old image if it exists and is different
-            if old_image_tag and old_image_tag != new_image_tag:
-                try:
-                    docker_client.images.remove(image=old_image_tag, force=True)
-                    logger.info(f"Removed old image {old_image_tag}")
-                except docker.errors.ImageNotFound:
-                    pass  # It's okay if it's already gone
-
-        except docker.errors.BuildError as e:
-            logger.error(f"Docker rebuild failed for environment {environment.id}: {e}")
-            raise HTTPException(status_code=400, detail=f"Docker build failed: {e}")
-        except Exception as e:
-            logger.error(f"An unexpected error occurred during image rebuild: {e}")
-            raise HTTPException(
-                status_code=500, detail="An unexpected error occurred during rebuild."
-            )
-
-    await environment.save()
+    await environment.set(
+        {
+            ExecutionEnvironment.name: data.name,
+            ExecutionEnvironment.description: data.description,
+        }
+    )
+    latest = await EnvironmentBuild.get(environment.build_id) if environment.build_id else None
+    # The Dockerfile of a build still in progress counts as current.
+    current_dockerfile = (
+        latest.dockerfile
+        if latest and latest.status not in BUILD_TERMINAL_STATUSES
+        else environment.dockerfile
+    )
+    if data.dockerfile != current_dockerfile:
+        await build_manager.enqueue(environment, data.dockerfile)
+
     await log_action(
         current_user,
         "update_environment",
@@ -177,6 +128,76 @@ async def update_environment(
     return EnvironmentRead(**environment.model_dump())
 
 
+@router.post(
+    "/{environment_id}/build",
+    response_model=EnvironmentRead,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Rebuild an execution environment's image",
+)
+async def rebuild_environment(
+    environment_id: UUID,
+    current_user: User = Depends(get_current_user),
+    _=auth,
+):
+    """
+    Queue a new build of the environment's latest Dockerfile, for example
+    after a failed or interrupted build.
+    """
+    environment = await ExecutionEnvironment.get(environment_id)
+    if not environment:
+        raise HTTPException(status_code=404, detail="Environment not found")
+    latest = await EnvironmentBuild.get(environment.build_id) if environment.build_id else None
+    await build_manager.enqueue(
+        environment, latest.dockerfile if latest else environment.dockerfile
+    )
+    await log_action(current_user, "rebuild_environment", environment.id)
+    return EnvironmentRead(**environment.model_dump())
+
+
+@router.get(
+    "/{environment_id}/build/logs",
+    summary="Stream the latest build log",
+    response_class=StreamingResponse,
+)
+async def stream_build_logs(
+    environment_id: UUID,
+    offset: int = Query(0, ge=0, description="Number of log lines already received"),
+    _=auth,
+):
+    """
+    Stream the log of the environment's latest build as plain text lines,
+    starting at line `offset`. While the build runs, new lines are sent as
+    they are written; the stream ends when the build is ready or failed.
+    """
+    environment = await ExecutionEnvironment.get(environment_id)
+    if not environment:
+        raise HTTPException(status_code=404, detail="Environment not found")
+    if not environment.build_id:
+        raise HTTPException(status_code=404, detail="Environment has no builds")
+    build_id = environment.build_id
+
+    async def log_stream():
+        sent = offset
+        while True:
+            build = await EnvironmentBuild.get(build_id)
+            if build is None:
+                return
+            for line in build.log[sent:]:
+                yield line + "\n"
+            sent = max(sent, len(build.log))
+            if build.status in BUILD_TERMINAL_STATUSES:
+                if build.error:
+                    yield f"ERROR: {build.error}\n"
+                return
+            await asyncio.sleep(BUILD_LOG_POLL_INTERVAL)
+
+    return StreamingResponse(
+        log_stream(),
+        media_type="text/plain",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get(
     "",
     response_model=List[EnvironmentRead],
@@ -214,30 +235,17 @@ async def delete_environment(
     environment_id: UUID,
     current_user: User = Depends(get_current_user),
     _=auth,
-    docker_client: docker.DockerClient = Depends(get_docker_client),
 ):
     """
-    Delete an execution environment. This will also attempt to remove the Docker image.
+    Delete an execution environment. Its Docker image is removed once no
+    other environment uses it.
     """
     environment = await ExecutionEnvironment.get(environment_id)
     if not environment:
         raise HTTPException(status_code=404, detail="Environment not found")
 
-    if environment.image_tag:
-        try:
-            logger.info(f"Removing Docker image {environment.image_tag}")
-            docker_client.images.remove(image=environment.image_tag, force=True)
-        except docker.errors.ImageNotFound:
-            logger.warning(
-                f"Image {environment.image_tag} not found, but deleting DB record."
-            )
-        except Exception as e:
-            logger.error(f"Could not remove image {environment.image_tag}: {e}")
-            # Decide if you want to prevent deletion if image removal fails
-            raise HTTPException(
-                status_code=500, detail="Failed to remove Docker image."
-            )
-
     await environment.delete()
+    await EnvironmentBuild.find(EnvironmentBuild.environment_id == environment.id).delete()
+    await release_environment_image(environment)
     await log_action(current_user, "delete_environment", environment.id)
     return None
@@ -1,10 +1,11 @@
 import asyncio
 from datetime import datetime, UTC
 from loguru import logger
-from typing import List
+from typing import Dict, List
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing_extensions import Literal
 
@@ -12,7 +13,7 @@ from app.models.block import Block
 from app.models.environment import ExecutionEnvironment
 from app.models.execution import ExecutionJob, ExecutionStep
 from app.models.runbook import Runbook, RunbookVersion
-from app.security import require_roles
+from app.security import rate_limit, require_roles
 from typing import Optional
 
 from app.services.execution import (
@@ -21,13 +22,33 @@ from app.services.execution import (
     execute_timer_block,
     execute_ssh_block,
     evaluate_condition,
+    set_job_status,
     BlockExecutionResult,
 )
+from app.services import analytics, http_cache
+from app.services.events import TERMINAL_STATUSES, event_hub
+from app.services.retention import (
+    RetentionSettings,
+    clear_executions,
+    rehydrate_execution,
+)
+from app.services.http_cache import (
+    cached_response,
+    etag_matches,
+    immutable_response,
+    make_etag,
+)
+from app.services.timing import JobTimeline, build_timeline, elapsed_ms
+from app.services.tracing import otlp_document, tracer
+from app.services.versions import load_blocks
 
 router = APIRouter()
 
 # Dependency for authorization
 auth = require_roles("sre", "developer")
+admin = require_roles("sre")
+
+SSE_KEEPALIVE_SECONDS = 15
 
 
 class ExecutionResponse(BaseModel):
@@ -36,12 +57,16 @@ class ExecutionResponse(BaseModel):
 
 class ExecutionStepRead(ExecutionStep):
     block_name: Optional[str] = None
+    # Position in the full step output at which `output` starts.
+    output_offset: int = 0
 
 
 class ExecutionStatusResponse(BaseModel):
     job_id: UUID
     status: str
     steps: List[ExecutionStepRead]
+    # Pass back as `since` to receive only steps changed after this poll.
+    cursor: Optional[datetime] = None
 
 
 class ControlRequest(BaseModel):
@@ -54,11 +79,16 @@ class BlockExecuteRequest(BaseModel):
 
 
 async def record_single_block_execution(
-    runbook: Runbook, block: Block, result: BlockExecutionResult
+    runbook: Runbook,
+    block: Block,
+    result: BlockExecutionResult,
+    started_at: datetime,
+    finished_at: datetime,
 ):
     """
     Creates ExecutionJob and ExecutionStep records for a single block run.
     """
+    duration_ms = elapsed_ms(started_at, finished_at)
     # Find the latest version to link the job to
     latest_version = (
         await RunbookVersion.find(RunbookVersion.runbook_id == runbook.id)
@@ -73,19 +103,34 @@ async def record_single_block_execution(
         runbook_id=runbook.id,
         version_id=version_id,
         status=job_status,
-        end_time=datetime.now(UTC),  # It's an instant job
+        # It's an instant job, never queued.
+        start_time=started_at,
+        started_at=started_at,
+        queue_wait_ms=0,
+        end_time=finished_at,
+        finished_at=finished_at,
+        duration_ms=duration_ms,
     )
-    await job.insert()
 
+    # The step goes first so the job is never visible as finished without it.
     step = ExecutionStep(
         job_id=job.id,
         block_id=block.id,
         status=result.status,
         output=result.output,
         exit_code=result.exit_code,
+        started_at=started_at,
+        finished_at=finished_at,
+        duration_ms=duration_ms,
     )
     await step.insert()
+    await job.insert()
     logger.info(f"Recorded single block execution for job {job.id}")
+    # Counted like queued jobs, so that rebuilt rollups match the live ones.
+    try:
+        await analytics.record_job(job)
+    except Exception:
+        logger.exception(f"Failed to record job {job.id} in analytics rollups")
 
 
 @router.post(
@@ -93,7 +138,9 @@ async def record_single_block_execution(
     response_model=BlockExecutionResult,
     summary="Execute a single block",
 )
-async def execute_block(request: BlockExecuteRequest, _=auth):
+async def execute_block(
+    request: BlockExecuteRequest, _=auth, __=rate_limit("blocks")
+):
     """
     Execute a single block, return the result immediately,
     and record the execution in the history.
@@ -113,6 +160,7 @@ async def execute_block(request: BlockExecuteRequest, _=auth):
     )
 
     # Execute the block to get the result first
+    started_at = datetime.now(UTC)
     if block.type == "command":
         result = await execute_command_block(block, environment)
     elif block.type == "api":
@@ -140,7 +188,11 @@ async def execute_block(request: BlockExecuteRequest, _=auth):
         )
 
     # Now, create the history records in the background
-    asyncio.create_task(record_single_block_execution(runbook, block, result))
+    asyncio.create_task(
+        record_single_block_execution(
+            runbook, block, result, started_at, datetime.now(UTC)
+        )
+    )
 
     return result
 
@@ -151,7 +203,7 @@ async def execute_block(request: BlockExecuteRequest, _=auth):
     status_code=status.HTTP_202_ACCEPTED,
     summary="Enqueue a new execution job",
 )
-async def enqueue_execution(runbook_id: UUID, _=auth):
+async def enqueue_execution(runbook_id: UUID, _=auth, __=rate_limit("jobs")):
     """
     Enqueue a new execution job for the latest version of a runbook.
     """
@@ -212,36 +264,205 @@ async def list_all_executions(_=auth):
     return results
 
 
+def parse_output_offsets(offsets: Optional[str]) -> Dict[UUID, int]:
+    """
+    Parse an `offsets` query value of the form `step_id:offset,step_id:offset`.
+    """
+    if not offsets:
+        return {}
+    parsed = {}
+    try:
+        for pair in offsets.split(","):
+            step_id, offset = pair.split(":")
+            parsed[UUID(step_id)] = max(int(offset), 0)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid offsets. Expected 'step_id:offset' pairs separated by commas.",
+        )
+    return parsed
+
+
 @router.get(
     "/executions/{job_id}",
     response_model=ExecutionStatusResponse,
     summary="Get job status and step outputs",
 )
-async def get_execution_status(job_id: UUID, _=auth):
+async def get_execution_status(
+    job_id: UUID,
+    request: Request,
+    response: Response,
+    since: Optional[datetime] = Query(
+        None, description="Cursor from a previous poll; only newer step changes are returned"
+    ),
+    offsets: Optional[str] = Query(
+        None,
+        description="Comma-separated 'step_id:offset' pairs; output before the offset is omitted",
+    ),
+    _=auth,
+):
     """
     Get the status and output of an execution job.
+
+    Without parameters every step is returned with its full output. Pollers
+    should pass back the returned `cursor` as `since`, together with the
+    output length they already hold per step, to receive only the delta.
+    Responses carry an ETag and `If-None-Match` is answered with 304.
     """
+    output_offsets = parse_output_offsets(offsets)
+
+    # Finished jobs never change once their worker let go of them; full
+    # reads of them are served from cache.
+    cache_key = ("job", job_id) if since is None and not output_offsets else None
+    if cache_key:
+        cached = cached_response(request, cache_key)
+        if cached:
+            return cached
+
     job = await ExecutionJob.get(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Execution job not found")
 
-    # Fetch the version to get block names
-    version = await RunbookVersion.get(job.version_id) if job.version_id else None
+    step_query = ExecutionStep.find(ExecutionStep.job_id == job.id)
+    if since is not None:
+        # Inclusive bound: Mongo stores milliseconds, so a step written in the
+        # same millisecond as the previous poll must not be skipped.
+        step_query = step_query.find(ExecutionStep.updated_at >= since)
+    steps = await step_query.to_list()
+
+    # Block names are only needed when there are steps to label.
+    version = (
+        await RunbookVersion.get(job.version_id)
+        if steps and job.version_id
+        else None
+    )
     block_id_to_name_map = (
-        {str(b.id): b.name for b in version.blocks} if version else {}
+        {str(b.id): b.name for b in await load_blocks(version)} if version else {}
     )
 
-    steps = await ExecutionStep.find(ExecutionStep.job_id == job.id).to_list()
     enriched_steps = []
     for step in steps:
         step_dict = step.model_dump()
         step_dict["block_name"] = block_id_to_name_map.get(str(step.block_id))
+        offset = output_offsets.get(step.id, 0)
+        if offset > len(step.output):
+            # The client is ahead of what we have; resend the whole output.
+            offset = 0
+        step_dict["output"] = step.output[offset:]
+        step_dict["output_offset"] = offset
         enriched_steps.append(ExecutionStepRead(**step_dict))
 
-    return ExecutionStatusResponse(
+    cursor = max((step.updated_at for step in steps), default=since)
+
+    result = ExecutionStatusResponse(
         job_id=job.id,
         status=job.status,
         steps=enriched_steps,
+        cursor=cursor,
+    )
+
+    if cache_key and job.status in TERMINAL_STATUSES and not job.worker_active:
+        return immutable_response(request, cache_key, result)
+
+    etag = make_etag(result.model_dump_json().encode())
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return result
+
+
+@router.get(
+    "/executions/{job_id}/timeline",
+    response_model=JobTimeline,
+    summary="Get a job's timing breakdown",
+)
+async def get_execution_timeline(job_id: UUID, _=auth):
+    """
+    Return when the job was enqueued, claimed and finished, and the start
+    offset and duration of each step for a Gantt-style view, with the
+    slowest steps flagged.
+    """
+    job = await ExecutionJob.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Execution job not found")
+
+    steps = await ExecutionStep.find(ExecutionStep.job_id == job.id).to_list()
+    version = await RunbookVersion.get(job.version_id) if job.version_id else None
+    blocks = await load_blocks(version) if version else []
+    return build_timeline(job, steps, blocks)
+
+
+@router.get("/executions/{job_id}/trace", summary="Get a job's trace")
+async def get_execution_trace(job_id: UUID, _=admin):
+    """
+    Return the spans recorded while the job ran, from queueing to its
+    last MongoDB write, as an OTLP/JSON `ExportTraceServiceRequest` that
+    trace viewers can import. A running job returns the spans finished so
+    far. Traces of the most recent jobs are kept in memory, and older ones
+    are read back from `TRACE_EXPORT_FILE` when it is set.
+    """
+    spans = tracer.get_spans(job_id.hex)
+    if spans is not None:
+        return otlp_document(spans)
+    document = await asyncio.to_thread(tracer.read_exported, job_id.hex)
+    if document is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this job")
+    return document
+
+
+@router.get(
+    "/executions/{job_id}/events",
+    summary="Stream live job events",
+    response_class=StreamingResponse,
+)
+async def stream_execution_events(
+    job_id: UUID,
+    after: Optional[int] = Query(
+        None, description="Resume after this event sequence number"
+    ),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+    _=auth,
+):
+    """
+    Stream step state changes and output chunks for a job as Server-Sent
+    Events. The stream starts with a `snapshot` event unless it resumes from
+    a sequence number still held in the replay buffer, and ends when the job
+    completes or fails.
+    """
+    if not await ExecutionJob.get(job_id):
+        raise HTTPException(status_code=404, detail="Execution job not found")
+
+    last_seq = after if after is not None else last_event_id
+
+    async def event_stream():
+        events = event_hub.subscribe(job_id, last_seq).__aiter__()
+        next_event = asyncio.ensure_future(events.__anext__())
+        try:
+            while True:
+                done, _ = await asyncio.wait({next_event}, timeout=SSE_KEEPALIVE_SECONDS)
+                if not done:
+                    # Keep idle connections open through proxies.
+                    yield ": keep-alive\n\n"
+                    continue
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield event.to_sse()
+                next_event = asyncio.ensure_future(events.__anext__())
+        finally:
+            if not next_event.done():
+                next_event.cancel()
+                try:
+                    await next_event
+                except (asyncio.CancelledError, StopAsyncIteration):
+                    pass
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -260,14 +481,13 @@ async def control_execution(job_id: UUID, request: ControlRequest, _=auth):
 
     if request.action == "stop":
         if job.status in ["running", "pending"]:
-            job.status = "failed"  # Treat stopped jobs as failed for now
-            await job.save()
-            return {"message": "Job stop request accepted."}
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Cannot stop a job in '{job.status}' state.",
-            )
+            # Treat stopped jobs as failed for now
+            if await set_job_status(job, "failed"):
+                return {"message": "Job stop request accepted."}
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot stop a job in '{job.status}' state.",
+        )
     return {"message": "Action not yet implemented."}
 
 
@@ -278,8 +498,38 @@ async def control_execution(job_id: UUID, request: ControlRequest, _=auth):
 )
 async def clear_all_executions(_=auth):
     """
-    Delete all execution jobs and steps.
+    Delete all execution jobs and steps, in bounded batches.
     """
-    await ExecutionJob.delete_all()
-    await ExecutionStep.delete_all()
+    await clear_executions(RetentionSettings.from_env().batch_size)
+    http_cache.invalidate("job")
     return None
+
+
+@router.post(
+    "/executions/{job_id}/rehydrate",
+    response_model=ExecutionJob,
+    summary="Restore an archived job",
+)
+async def rehydrate_archived_execution(job_id: UUID, _=auth):
+    """
+    Restore a job and its steps that were removed by the retention pruner
+    from the archive, so it can be viewed again. Restoring a job that is
+    already present is a no-op. A restored job is pruned again once a full
+    retention period has passed since it was restored.
+    """
+    job = await ExecutionJob.get(job_id)
+    if job:
+        return job
+    archive_dir = RetentionSettings.from_env().archive_dir
+    try:
+        job = await rehydrate_execution(job_id, archive_dir) if archive_dir else None
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="The archive file of this execution job no longer exists",
+        )
+    except LookupError:
+        job = None
+    if not job:
+        raise HTTPException(status_code=404, detail="No archived execution job found")
+    return job
@@ -1,15 +1,35 @@
 from datetime import datetime, UTC
-from typing import List, Optional
+from typing import List, Literal, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from beanie.operators import All, In
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pymongo.errors import DuplicateKeyError
 
 
-from app.models.block import Block
+from app.models.block import Block, BlockOperation
 from app.models.runbook import Runbook, RunbookVersion
+from app.models.search import RunbookSearchHit
 from app.models.user import User
 from app.security import get_current_user, require_roles
+from app.services import http_cache, search
 from app.services.audit import log_action
+from app.services.tags import TagFacet, tag_facets, update_tag_counts
+from app.services.transfer import (
+    ConflictPolicy,
+    ImportSummary,
+    export_runbooks,
+    import_runbooks,
+)
+from app.services.versions import (
+    apply_block_operations,
+    create_version,
+    get_latest_version,
+    get_latest_versions,
+    load_blocks,
+    load_blocks_many,
+)
 from pydantic import BaseModel
 
 
@@ -33,6 +53,15 @@ class RunbookUpdate(BaseModel):
     environment_id: Optional[UUID] = None
 
 
+class RunbookPatch(BaseModel):
+    base_version: int
+    operations: List[BlockOperation] = []
+    title: Optional[str] = None
+    description: Optional[str] = None
+    tags: Optional[List[str]] = None
+    environment_id: Optional[UUID] = None
+
+
 class RunbookRead(BaseModel):
     id: UUID
     title: str
@@ -46,6 +75,14 @@ class RunbookRead(BaseModel):
     environment_id: Optional[UUID] = None
 
 
+class RunbookSearchPage(BaseModel):
+    query: str
+    total: int
+    skip: int
+    limit: int
+    items: List[RunbookSearchHit]
+
+
 # Dependency for authorization
 auth = require_roles("sre", "developer")
 
@@ -73,12 +110,12 @@ async def create_runbook(
     )
     await runbook.insert()
 
-    version = RunbookVersion(
-        runbook_id=runbook.id,
-        version_number=1,
-        blocks=data.blocks,
+    version = await create_version(
+        runbook.id, data.blocks, current_user, version_number=1
     )
-    await version.insert()
+    blocks = await load_blocks(version)
+    await search.index_runbook(runbook, version.version_number, blocks)
+    await update_tag_counts(new_tags=runbook.tags)
 
     await log_action(
         current_user,
@@ -90,7 +127,7 @@ async def create_runbook(
     return RunbookRead(
         **runbook.model_dump(),
         version=version.version_number,
-        blocks=version.blocks,
+        blocks=blocks,
     )
 
 
@@ -99,38 +136,131 @@ async def create_runbook(
     response_model=List[RunbookRead],
     summary="List all runbooks",
 )
-async def list_runbooks(_=auth):
+async def list_runbooks(
+    tags: Optional[str] = Query(None, description="Comma-separated tags"),
+    match: Literal["all", "any"] = "all",
+    _=auth,
+):
     """
-    Retrieve a list of all runbooks with their latest version.
+    Retrieve a list of all runbooks with their latest version. With `tags`,
+    only runbooks carrying all (or with `match=any`, any) of them are listed.
     """
-    runbooks = await Runbook.find_all().to_list()
+    wanted = [tag.strip() for tag in (tags or "").split(",") if tag.strip()]
+    if not wanted:
+        query = Runbook.find_all()
+    elif match == "all":
+        query = Runbook.find(All(Runbook.tags, wanted))
+    else:
+        query = Runbook.find(In(Runbook.tags, wanted))
+    runbooks = await query.to_list()
+    latest_versions = await get_latest_versions(rb.id for rb in runbooks)
+    # One batched block lookup for every listed runbook.
+    blocks = dict(
+        zip(latest_versions.keys(), await load_blocks_many(latest_versions.values()))
+    )
     result = []
     for rb in runbooks:
-        latest_version = (
-            await RunbookVersion.find(RunbookVersion.runbook_id == rb.id)
-            .sort("-version_number")
-            .first_or_none()
-        )
-
-        if latest_version:
-            result.append(
-                RunbookRead(
-                    **rb.model_dump(),
-                    version=latest_version.version_number,
-                    blocks=latest_version.blocks,
-                )
-            )
-        else:  # Should not happen for runbooks created via API
-            result.append(
-                RunbookRead(
-                    **rb.model_dump(),
-                    version=0,
-                    blocks=[],
-                )
+        latest_version = latest_versions.get(rb.id)
+        result.append(
+            RunbookRead(
+                **rb.model_dump(),
+                # Runbooks created through the API always have a version.
+                version=latest_version.version_number if latest_version else 0,
+                blocks=blocks.get(rb.id, []),
             )
+        )
     return result
 
 
+@router.get(
+    "/export",
+    summary="Export all runbooks",
+    response_class=StreamingResponse,
+)
+async def export_all_runbooks(
+    gzip: bool = Query(False, description="Compress the stream with gzip"), _=auth
+):
+    """
+    Stream every runbook with its full version history as NDJSON, one
+    runbook per line. The output can be fed to `POST /runbooks/import`.
+    """
+    filename = "runbooks.ndjson.gz" if gzip else "runbooks.ndjson"
+    return StreamingResponse(
+        export_runbooks(compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post(
+    "/import",
+    response_model=ImportSummary,
+    summary="Import runbooks from an export",
+)
+async def import_all_runbooks(
+    request: Request,
+    on_conflict: ConflictPolicy = Query(
+        "skip", description="What to do when a runbook id already exists"
+    ),
+    current_user: User = Depends(get_current_user),
+    _=auth,
+):
+    """
+    Import runbooks and their version history from an NDJSON stream, plain
+    or gzipped, as produced by `GET /runbooks/export`. Runbooks whose id
+    already exists are skipped, imported under a new id (`remap`) or replace
+    the existing runbook (`overwrite`). A single audit entry summarizes the
+    import.
+    """
+    summary = await import_runbooks(request.stream(), on_conflict)
+    await log_action(
+        current_user,
+        "import_runbooks",
+        summary.import_id,
+        details={
+            "imported": summary.imported,
+            "skipped": summary.skipped,
+            "overwritten": summary.overwritten,
+            "remapped": len(summary.remapped),
+            "errors": len(summary.errors),
+        },
+    )
+    return summary
+
+
+@router.get(
+    "/tags",
+    response_model=List[TagFacet],
+    summary="Count runbooks per tag",
+)
+async def list_tag_facets(limit: Optional[int] = Query(None, ge=1), _=auth):
+    """
+    Return every tag with the number of runbooks carrying it, most used
+    first. Counts are maintained as runbooks change.
+    """
+    return await tag_facets(limit)
+
+
+@router.get(
+    "/search",
+    response_model=RunbookSearchPage,
+    summary="Search runbooks",
+)
+async def search_runbooks(
+    q: str = Query(..., min_length=1),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    _=auth,
+):
+    """
+    Search the title, description, tags, block names and block text of the
+    latest version of every runbook. Every word of `q` must match a word in
+    the runbook or the start of one; results are ranked by relevance.
+    """
+    total, items = await search.search_runbooks(q, skip=skip, limit=limit)
+    return RunbookSearchPage(query=q, total=total, skip=skip, limit=limit, items=items)
+
+
 @router.get(
     "/{runbook_id}",
     response_model=RunbookRead,
@@ -158,7 +288,7 @@ async def get_runbook(runbook_id: UUID, _=auth):
     return RunbookRead(
         **runbook.model_dump(),
         version=latest_version.version_number,
-        blocks=latest_version.blocks,
+        blocks=await load_blocks(latest_version),
     )
 
 
@@ -180,27 +310,24 @@ async def update_runbook(
     if not runbook:
         raise HTTPException(status_code=404, detail="Runbook not found")
 
-    latest_version = (
-        await RunbookVersion.find(RunbookVersion.runbook_id == runbook.id)
-        .sort("-version_number")
-        .first_or_none()
-    )
-
-    new_version_number = (latest_version.version_number + 1) if latest_version else 1
-
-    new_version = RunbookVersion(
-        runbook_id=runbook.id,
-        version_number=new_version_number,
-        blocks=data.blocks,
-    )
-    await new_version.insert()
+    try:
+        new_version = await create_version(runbook.id, data.blocks, current_user)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The runbook is being saved concurrently; retry the update",
+        )
 
+    old_tags = runbook.tags
     runbook.title = data.title
     runbook.description = data.description
     runbook.tags = data.tags
     runbook.environment_id = data.environment_id
     runbook.updated_at = datetime.now(UTC)
     await runbook.save()
+    blocks = await load_blocks(new_version)
+    await search.index_runbook(runbook, new_version.version_number, blocks)
+    await update_tag_counts(old_tags, runbook.tags)
 
     await log_action(
         current_user,
@@ -212,7 +339,85 @@ async def update_runbook(
     return RunbookRead(
         **runbook.model_dump(),
         version=new_version.version_number,
-        blocks=new_version.blocks,
+        blocks=blocks,
+    )
+
+
+@router.patch(
+    "/{runbook_id}",
+    response_model=RunbookRead,
+    summary="Apply block-level edits to a runbook",
+)
+async def patch_runbook(
+    runbook_id: UUID,
+    data: RunbookPatch,
+    current_user: User = Depends(get_current_user),
+    _=auth,
+):
+    """
+    Apply insert, update, delete and move operations to the blocks of
+    `base_version` and store the result as a new version. Fails with 409 if
+    `base_version` is no longer the latest version. Metadata fields that are
+    omitted are left unchanged, and no version is created when there are no
+    block operations.
+    """
+    runbook = await Runbook.get(runbook_id)
+    if not runbook:
+        raise HTTPException(status_code=404, detail="Runbook not found")
+
+    latest_version = await get_latest_version(runbook.id)
+    latest_number = latest_version.version_number if latest_version else 0
+    if data.base_version != latest_number:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Version {data.base_version} is stale; latest is {latest_number}",
+        )
+
+    version = latest_version
+    blocks = await load_blocks(latest_version) if latest_version else []
+    if data.operations:
+        try:
+            blocks = apply_block_operations(blocks, data.operations)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            version = await create_version(
+                runbook.id, blocks, current_user, version_number=latest_number + 1
+            )
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Version {data.base_version} is stale; a newer version was saved",
+            )
+
+    old_tags = runbook.tags
+    for field in ("title", "description", "tags"):
+        if getattr(data, field) is not None:
+            setattr(runbook, field, getattr(data, field))
+    # An explicit null detaches the runbook from its environment.
+    if "environment_id" in data.model_fields_set:
+        runbook.environment_id = data.environment_id
+    runbook.updated_at = datetime.now(UTC)
+    await runbook.save()
+    await search.index_runbook(
+        runbook, version.version_number if version else 0, blocks
+    )
+    await update_tag_counts(old_tags, runbook.tags)
+
+    await log_action(
+        current_user,
+        "update_runbook",
+        runbook.id,
+        details={
+            "new_version": version.version_number if version else 0,
+            "operations": len(data.operations),
+        },
+    )
+
+    return RunbookRead(
+        **runbook.model_dump(),
+        version=version.version_number if version else 0,
+        blocks=blocks,
     )
 
 
@@ -233,6 +438,9 @@ async def delete_runbook(
 
     await RunbookVersion.find(RunbookVersion.runbook_id == runbook.id).delete()
     await runbook.delete()
+    await search.remove_runbook(runbook.id)
+    await update_tag_counts(old_tags=runbook.tags)
+    http_cache.invalidate("runbook", runbook.id)
 
     await log_action(current_user, "delete_runbook", runbook.id)
 
@@ -4,6 +4,12 @@ from pydantic import BaseModel, Field
 
 from app.models import User
 from app.security import get_current_role
+from app.services.passwords import (
+    hash_password,
+    needs_rehash,
+    verify_password,
+    verify_unknown_user,
+)
 
 router = APIRouter()
 
@@ -52,7 +58,7 @@ async def signup(data: SignupRequest):
     api_key = secrets.token_hex(16)
     user = User(
         username=data.username,
-        password=data.password,  # In a real app, hash this
+        password=await hash_password(data.password),
         api_key=api_key,
         role=data.role,
     )
@@ -67,11 +73,18 @@ async def signup(data: SignupRequest):
 )
 async def login(data: LoginRequest):
     """
-    Authenticate and retrieve an API key.
+    Authenticate and retrieve an API key. Passwords stored in plaintext or
+    hashed with older cost parameters are rehashed.
     """
     user = await User.find_one({"username": data.username})
-    if not user or user.password != data.password:  # In a real app, verify hash
+    if not user:
+        await verify_unknown_user(data.password)
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if not await verify_password(data.password, user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if needs_rehash(user.password):
+        user.password = await hash_password(data.password)
+        await user.save()
     return {"api_key": user.api_key}
 
 
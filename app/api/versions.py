@@ -1,19 +1,70 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from beanie.operators import In
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
 
 from app.api.runbooks import RunbookRead
-from app.models.runbook import Runbook, RunbookVersion
+from app.models.block import Block
+from app.models.runbook import Runbook, RunbookVersion, RunbookVersionSummary
 from app.models.user import User
 from app.security import get_current_user, require_roles
+from app.services import search
 from app.services.audit import log_action
+from app.services.http_cache import (
+    REVALIDATE_CACHE_CONTROL,
+    cached_response,
+    immutable_response,
+)
+from app.services.versions import (
+    BlockChange,
+    create_version,
+    diff_versions,
+    load_blocks,
+    load_blocks_many,
+)
 
 router = APIRouter()
 
 auth = require_roles("sre", "developer")
 
 
+class VersionSummaryRead(BaseModel):
+    version: int
+    created_at: datetime
+    created_by: Optional[UUID] = None
+    author: Optional[str] = None
+    block_count: int
+    content_hash: Optional[str] = None
+
+
+class VersionRead(BaseModel):
+    runbook_id: UUID
+    version: int
+    created_at: datetime
+    created_by: Optional[UUID] = None
+    content_hash: Optional[str] = None
+    blocks: List[Block]
+
+
+class VersionDiff(BaseModel):
+    runbook_id: UUID
+    from_version: int
+    to_version: int
+    changes: List[BlockChange]
+
+
+class VersionHistoryPage(BaseModel):
+    runbook_id: UUID
+    total: int
+    skip: int
+    limit: int
+    items: List[VersionSummaryRead]
+
+
 @router.get(
     "/{runbook_id}/versions",
     response_model=List[RunbookRead],
@@ -23,7 +74,8 @@ async def list_versions(runbook_id: UUID, _=auth):
     """
     Retrieve a list of all historical versions for a specific runbook.
     """
-    if not await Runbook.get(runbook_id):
+    runbook = await Runbook.get(runbook_id)
+    if not runbook:
         raise HTTPException(status_code=404, detail="Runbook not found")
 
     versions = (
@@ -32,21 +84,165 @@ async def list_versions(runbook_id: UUID, _=auth):
         .to_list()
     )
 
-    if not versions:
-        return []
-
-    # This is inefficient, but simple. A better implementation would avoid N+1 queries.
-    result = []
-    for version in versions:
-        runbook = await Runbook.get(version.runbook_id)
-        result.append(
-            RunbookRead(
-                **runbook.model_dump(),
-                version=version.version_number,
-                blocks=version.blocks,
-            )
+    return [
+        RunbookRead(
+            **runbook.model_dump(),
+            version=version.version_number,
+            blocks=blocks,
+        )
+        for version, blocks in zip(versions, await load_blocks_many(versions))
+    ]
+
+
+@router.get(
+    "/{runbook_id}/versions/summary",
+    response_model=VersionHistoryPage,
+    summary="List version summaries for a runbook",
+)
+async def list_version_summaries(
+    runbook_id: UUID,
+    skip: int = Query(0, ge=0, description="Number of versions to skip"),
+    limit: int = Query(50, ge=1, le=500, description="Number of versions to return"),
+    _=auth,
+):
+    """
+    Retrieve a page of the version history, newest first, without block
+    contents. Use `GET /runbooks/{id}/versions/{version_number}` to load the
+    blocks of a single version.
+    """
+    if not await Runbook.get(runbook_id):
+        raise HTTPException(status_code=404, detail="Runbook not found")
+
+    total = await RunbookVersion.find(RunbookVersion.runbook_id == runbook_id).count()
+    summaries = await (
+        RunbookVersion.find(RunbookVersion.runbook_id == runbook_id)
+        .sort("-version_number")
+        .skip(skip)
+        .limit(limit)
+        .aggregate(
+            [
+                {
+                    "$project": {
+                        "_id": 0,
+                        "version_number": 1,
+                        "created_at": 1,
+                        "created_by": 1,
+                        "content_hash": 1,
+                        "block_count": {
+                            "$add": [
+                                {"$size": {"$ifNull": ["$blocks", []]}},
+                                {"$size": {"$ifNull": ["$block_refs", []]}},
+                            ]
+                        },
+                    }
+                }
+            ],
+            projection_model=RunbookVersionSummary,
         )
-    return result
+        .to_list()
+    )
+
+    author_ids = {s.created_by for s in summaries if s.created_by}
+    authors = (
+        {u.id: u.username for u in await User.find(In(User.id, list(author_ids))).to_list()}
+        if author_ids
+        else {}
+    )
+
+    return VersionHistoryPage(
+        runbook_id=runbook_id,
+        total=total,
+        skip=skip,
+        limit=limit,
+        items=[
+            VersionSummaryRead(
+                version=s.version_number,
+                created_at=s.created_at,
+                created_by=s.created_by,
+                author=authors.get(s.created_by),
+                block_count=s.block_count,
+                content_hash=s.content_hash,
+            )
+            for s in summaries
+        ],
+    )
+
+
+@router.get(
+    "/{runbook_id}/versions/{version_number}",
+    response_model=VersionRead,
+    summary="Fetch a single version of a runbook",
+)
+async def get_version(runbook_id: UUID, version_number: int, request: Request, _=auth):
+    """
+    Fetch the blocks of one specific version. The response is cached in
+    memory and served with a strong ETag. Clients must revalidate, as an
+    overwriting import can replace the version.
+    """
+    cache_key = ("runbook", runbook_id, "version", version_number)
+    cached = cached_response(request, cache_key)
+    if cached:
+        return cached
+
+    version = await RunbookVersion.find_one(
+        RunbookVersion.runbook_id == runbook_id,
+        RunbookVersion.version_number == version_number,
+    )
+    if not version:
+        raise HTTPException(status_code=404, detail="Version not found")
+
+    return immutable_response(
+        request,
+        cache_key,
+        VersionRead(
+            runbook_id=runbook_id,
+            version=version.version_number,
+            created_at=version.created_at,
+            created_by=version.created_by,
+            content_hash=version.content_hash,
+            blocks=await load_blocks(version),
+        ),
+        REVALIDATE_CACHE_CONTROL,
+    )
+
+
+@router.get(
+    "/{runbook_id}/versions/{from_version}/diff/{to_version}",
+    response_model=VersionDiff,
+    summary="Diff the blocks of two versions",
+)
+async def diff_runbook_versions(
+    runbook_id: UUID, from_version: int, to_version: int, request: Request, _=auth
+):
+    """
+    Compare two versions of a runbook block by block. Only added, removed,
+    reordered and changed blocks are returned; for changed blocks only the
+    differing fields and config keys are included.
+    """
+    cache_key = ("runbook", runbook_id, "diff", from_version, to_version)
+    cached = cached_response(request, cache_key)
+    if cached:
+        return cached
+
+    versions = await RunbookVersion.find(
+        RunbookVersion.runbook_id == runbook_id,
+        In(RunbookVersion.version_number, [from_version, to_version]),
+    ).to_list()
+    by_number = {v.version_number: v for v in versions}
+    if from_version not in by_number or to_version not in by_number:
+        raise HTTPException(status_code=404, detail="Version not found")
+
+    return immutable_response(
+        request,
+        cache_key,
+        VersionDiff(
+            runbook_id=runbook_id,
+            from_version=from_version,
+            to_version=to_version,
+            changes=await diff_versions(by_number[from_version], by_number[to_version]),
+        ),
+        REVALIDATE_CACHE_CONTROL,
+    )
 
 
 @router.post(
@@ -76,21 +272,18 @@ async def rollback_to_version(
     if not target_version:
         raise HTTPException(status_code=404, detail="Version not found")
 
-    latest_version = (
-        await RunbookVersion.find(RunbookVersion.runbook_id == runbook.id)
-        .sort("-version_number")
-        .first_or_none()
-    )
-
-    new_version_number = (latest_version.version_number + 1) if latest_version else 1
-
     # Create a new version with the content of the version we are rolling back to
-    new_version = RunbookVersion(
-        runbook_id=runbook.id,
-        version_number=new_version_number,
-        blocks=target_version.blocks,
-    )
-    await new_version.insert()
+    try:
+        new_version = await create_version(
+            runbook.id, await load_blocks(target_version), current_user
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The runbook is being saved concurrently; retry the rollback",
+        )
+    blocks = await load_blocks(new_version)
+    await search.index_runbook(runbook, new_version.version_number, blocks)
 
     await log_action(
         current_user,
@@ -105,5 +298,5 @@ async def rollback_to_version(
     return RunbookRead(
         **runbook.model_dump(),
         version=new_version.version_number,
-        blocks=new_version.blocks,
+        blocks=blocks,
     )
@@ -1,9 +1,12 @@
+import asyncio
 import os
 from typing import Iterable
 
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 
+from app.services.db_metrics import command_listener
+
 
 def get_connection_string() -> str:
     """Build the MongoDB connection string from environment variables."""
@@ -17,13 +20,24 @@ def get_connection_string() -> str:
     return f"mongodb://{user}:{password}@{host}"
 
 
-def create_init_beanie(models: Iterable[type]):
+def create_init_beanie(models: Iterable[type], create_indexes: bool = True):
     """Return a startup handler that initializes Beanie."""
 
     async def init() -> None:
         connection = get_connection_string()
         db_name = os.getenv("DB_NAME")
-        client = AsyncIOMotorClient(connection, uuidRepresentation="standard")
-        await init_beanie(database=client[db_name], document_models=list(models))
+        client = AsyncIOMotorClient(
+            connection, uuidRepresentation="standard", event_listeners=[command_listener]
+        )
+        command_listener.bind(client, asyncio.get_running_loop())
+        if create_indexes:
+            from app.services.indexes import upgrade_unique_indexes
+
+            await upgrade_unique_indexes(client[db_name])
+        await init_beanie(
+            database=client[db_name],
+            document_models=list(models),
+            skip_indexes=not create_indexes,
+        )
 
     return init
@@ -1,4 +1,5 @@
 import asyncio
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
@@ -17,6 +18,7 @@ from app.api import (
     execution,
     audit,
     environments,
+    analytics,
 )
 from app.db import create_init_beanie
 from app.models import (
@@ -28,8 +30,24 @@ from app.models import (
     Credential,
     AuditLog,
     ExecutionEnvironment,
+    EnvironmentBuild,
+    EnvironmentImage,
+    BlockContent,
+    RunbookSearchEntry,
+    RunbookTagCount,
+    ArchivedExecution,
+    ExecutionRollup,
+    RateLimitState,
 )
-from app.services.execution import execution_worker
+from app.services.audit import audit_writer
+from app.services.builds import build_manager
+from app.services.execution import (
+    EXECUTION_METRICS_INTERVAL,
+    execution_worker,
+    queue_depth_sampler,
+)
+from app.services.indexes import report_indexes
+from app.services.retention import RetentionSettings, retention_worker
 
 from contextlib import asynccontextmanager
 
@@ -41,11 +59,23 @@ setup_logging()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Initialize the database and start the background worker.
+    Initialize the database and start the background workers. Queued
+    audit entries are written, and unfinished image builds recorded as
+    failed, before shutdown completes.
     """
     await init_db()
+    if os.getenv("INDEX_CHECK_ON_STARTUP", "true").lower() == "true":
+        await report_indexes(document_models)
+    await audit_writer.start()
     asyncio.create_task(execution_worker())
+    if EXECUTION_METRICS_INTERVAL > 0:
+        asyncio.create_task(queue_depth_sampler(EXECUTION_METRICS_INTERVAL))
+    retention = RetentionSettings.from_env()
+    if retention.enabled:
+        asyncio.create_task(retention_worker(retention))
     yield
+    await build_manager.stop()
+    await audit_writer.stop()
 
 
 app = FastAPI(
@@ -76,6 +106,14 @@ document_models = [
     Credential,
     AuditLog,
     ExecutionEnvironment,
+    EnvironmentBuild,
+    EnvironmentImage,
+    BlockContent,
+    RunbookSearchEntry,
+    RunbookTagCount,
+    ArchivedExecution,
+    ExecutionRollup,
+    RateLimitState,
 ]
 init_db = create_init_beanie(document_models)
 
@@ -103,3 +141,4 @@ app.include_router(credentials.router, prefix="/credentials", tags=["Credentials
 app.include_router(execution.router, tags=["Execution"])
 app.include_router(audit.router, prefix="/audit", tags=["Audit"])
 app.include_router(environments.router, prefix="/environments", tags=["Environments"])
+app.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
@@ -0,0 +1,68 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Exposed on /metrics alongside the HTTP metrics of the instrumentator.
+
+AUTH_CACHE_LOOKUPS = Counter(
+    "auth_cache_lookups_total",
+    "API key lookups by cache outcome: hit, negative_hit (known invalid key) or miss.",
+    ["result"],
+)
+
+RATE_LIMIT_DECISIONS = Counter(
+    "rate_limit_decisions_total",
+    "Rate-limited requests by scope, role and result: allowed or throttled.",
+    ["scope", "role", "result"],
+)
+
+# --- Execution engine ---
+
+# Seconds; from sub-second blocks to hour-long runbooks.
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+EXECUTION_QUEUE_DEPTH = Gauge(
+    "execution_jobs",
+    "Unfinished jobs by status, sampled every EXECUTION_METRICS_INTERVAL seconds.",
+    ["status"],
+)
+
+EXECUTION_QUEUE_WAIT = Histogram(
+    "execution_queue_wait_seconds",
+    "Time from enqueueing a job to a worker claiming it.",
+    buckets=DURATION_BUCKETS,
+)
+
+EXECUTION_JOB_DURATION = Histogram(
+    "execution_job_duration_seconds",
+    "Time from claiming a job to it completing or failing.",
+    # Not by runbook: every runbook would add series that are never
+    # dropped. Per-runbook durations come from the analytics rollups.
+    ["status"],
+    buckets=DURATION_BUCKETS,
+)
+
+EXECUTION_BLOCK_DURATION = Histogram(
+    "execution_block_duration_seconds",
+    "Time spent running one block in a job, by block type and outcome.",
+    ["block_type", "outcome"],
+    buckets=DURATION_BUCKETS,
+)
+
+EXECUTION_JOBS_IN_FLIGHT = Gauge(
+    "execution_jobs_in_flight",
+    "Jobs this worker process is running.",
+)
+
+EXECUTION_RESOURCES_IN_USE = Gauge(
+    "execution_resources_in_use",
+    "Local subprocesses, containers, SSH connections and HTTP clients held by blocks.",
+    ["resource"],
+)
+
+# --- MongoDB ---
+
+MONGODB_COMMAND_DURATION = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command round trips by collection and command, from driver monitoring.",
+    ["collection", "command"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 10),
+)
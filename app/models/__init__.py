@@ -1,19 +1,34 @@
-from .block import Block
+from .analytics import BlockRollup, ExecutionRollup
+from .block import Block, BlockContent, BlockRef
 from .credential import Credential
-from .execution import ExecutionJob, ExecutionStep
-from .runbook import Runbook, RunbookVersion
+from .execution import ArchivedExecution, ExecutionJob, ExecutionStep
+from .rate_limit import RateLimitState
+from .runbook import Runbook, RunbookTagCount, RunbookVersion, RunbookVersionSummary
+from .search import RunbookSearchEntry, RunbookSearchHit
 from .user import User
 from .audit import AuditLog
-from .environment import ExecutionEnvironment
+from .environment import EnvironmentBuild, EnvironmentImage, ExecutionEnvironment
 
 __all__ = [
+    "BlockRollup",
+    "ExecutionRollup",
+    "ArchivedExecution",
     "Block",
+    "BlockContent",
+    "BlockRef",
     "Credential",
     "ExecutionJob",
     "ExecutionStep",
+    "RateLimitState",
     "Runbook",
+    "RunbookTagCount",
     "RunbookVersion",
+    "RunbookVersionSummary",
+    "RunbookSearchEntry",
+    "RunbookSearchHit",
     "User",
     "AuditLog",
+    "EnvironmentBuild",
+    "EnvironmentImage",
     "ExecutionEnvironment",
 ]
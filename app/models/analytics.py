@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Dict, Optional
+from uuid import UUID
+
+from beanie import Document
+from pydantic import BaseModel
+from pymongo import IndexModel, ASCENDING
+from typing_extensions import Literal
+
+
+class BlockRollup(BaseModel):
+    runs: int = 0
+    failures: int = 0
+    total_duration_ms: float = 0
+    max_duration_ms: float = 0
+    # Count of runs per duration bucket, keyed by the bucket's upper bound
+    # in milliseconds ("inf" for the last one).
+    duration_buckets: Dict[str, int] = {}
+
+
+class ExecutionRollup(Document):
+    """
+    Execution counts and duration histograms for one runbook, or the whole
+    fleet when `runbook_id` is None, over one hour or one day. Updated with
+    atomic increments as jobs finish.
+    """
+
+    id: str  # "<granularity>:<bucket>:<runbook id or 'fleet'>"
+    granularity: Literal["hour", "day"]
+    bucket: datetime
+    runbook_id: Optional[UUID] = None
+    jobs: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    total_duration_ms: float = 0
+    max_duration_ms: float = 0
+    duration_buckets: Dict[str, int] = {}
+    # Keyed by block id.
+    blocks: Dict[str, BlockRollup] = {}
+
+    class Settings:
+        name = "execution_rollups"
+        indexes = [
+            IndexModel(
+                [("granularity", ASCENDING), ("runbook_id", ASCENDING), ("bucket", ASCENDING)]
+            ),
+        ]
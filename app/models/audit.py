@@ -4,6 +4,7 @@ from uuid import UUID, uuid4
 
 from beanie import Document
 from pydantic import Field
+from pymongo import IndexModel, ASCENDING, DESCENDING
 
 
 class AuditLog(Document):
@@ -16,3 +17,17 @@ class AuditLog(Document):
 
     class Settings:
         name = "audit_logs"
+        # Each filter is followed by the (timestamp, _id) sort key that
+        # audit queries page through.
+        indexes = [
+            IndexModel([("timestamp", DESCENDING), ("_id", DESCENDING)]),
+            IndexModel(
+                [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]
+            ),
+            IndexModel(
+                [("action", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]
+            ),
+            IndexModel(
+                [("target_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]
+            ),
+        ]
@@ -1,8 +1,9 @@
 from uuid import UUID, uuid4
 
+from beanie import Document
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
-from typing_extensions import Literal
+from typing import Dict, Any, Optional, Union
+from typing_extensions import Annotated, Literal
 
 
 class Block(BaseModel):
@@ -11,3 +12,63 @@ class Block(BaseModel):
     type: Literal["instruction", "command", "api", "condition", "timer", "ssh"]
     config: Dict[str, Any]
     order: int
+
+
+class BlockContent(Document):
+    """
+    A block stored once, keyed by the sha256 of its content. Its position
+    in a runbook lives on the version that references it.
+    """
+
+    id: str  # content hash
+    block_id: UUID
+    name: Optional[str] = None
+    type: Literal["instruction", "command", "api", "condition", "timer", "ssh"]
+    config: Dict[str, Any]
+
+    class Settings:
+        name = "block_contents"
+
+
+class BlockRef(BaseModel):
+    """Reference from a runbook version to a stored block."""
+
+    hash: str
+    order: int
+
+
+class InsertBlockOperation(BaseModel):
+    op: Literal["insert"]
+    block: Block
+    # Index in the ordered block list; appended when omitted.
+    position: Optional[int] = None
+
+
+class UpdateBlockOperation(BaseModel):
+    op: Literal["update"]
+    block_id: UUID
+    name: Optional[str] = None
+    # Merged into the existing config; keys set to null are removed.
+    config: Dict[str, Any] = {}
+
+
+class DeleteBlockOperation(BaseModel):
+    op: Literal["delete"]
+    block_id: UUID
+
+
+class MoveBlockOperation(BaseModel):
+    op: Literal["move"]
+    block_id: UUID
+    position: int
+
+
+BlockOperation = Annotated[
+    Union[
+        InsertBlockOperation,
+        UpdateBlockOperation,
+        DeleteBlockOperation,
+        MoveBlockOperation,
+    ],
+    Field(discriminator="op"),
+]
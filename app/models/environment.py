@@ -1,19 +1,68 @@
 from datetime import datetime, UTC
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID, uuid4
 
 from beanie import Document
 from pydantic import Field
+from pymongo import IndexModel, ASCENDING
+from typing_extensions import Literal
+
+BuildStatus = Literal["queued", "building", "ready", "failed"]
 
 
 class ExecutionEnvironment(Document):
     id: UUID = Field(default_factory=uuid4)
     name: str
     description: str
+    # The Dockerfile `image_tag` was built from; a new one is kept on the
+    # build until it succeeds.
     dockerfile: str
     image_tag: Optional[str] = None
+    # Hash of the normalized Dockerfile `image_tag` was built from. Unset
+    # for images built per environment before images were shared.
+    dockerfile_hash: Optional[str] = None
+    # State of the latest build. Environments from before builds ran in the
+    # background are ready.
+    status: BuildStatus = "ready"
+    build_id: Optional[UUID] = None
+    build_error: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
     created_by: UUID
 
     class Settings:
         name = "execution_environments"
+
+
+class EnvironmentBuild(Document):
+    """One image build of an environment, with its log."""
+
+    id: UUID = Field(default_factory=uuid4)
+    environment_id: UUID
+    dockerfile: str
+    dockerfile_hash: str
+    status: BuildStatus = "queued"
+    log: List[str] = []
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Settings:
+        name = "environment_builds"
+        # Builds are deleted with their environment.
+        indexes = [IndexModel([("environment_id", ASCENDING)])]
+
+
+class EnvironmentImage(Document):
+    """
+    A built image, shared by every environment whose normalized Dockerfile
+    has the same hash. The image is removed when no environment uses it.
+    """
+
+    id: str  # Dockerfile hash
+    image_tag: str
+    ref_count: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    class Settings:
+        name = "environment_images"
@@ -2,9 +2,9 @@ from datetime import datetime, UTC
 from typing import Optional
 from uuid import UUID, uuid4
 
-from beanie import Document
+from beanie import Document, Insert, Replace, Save, SaveChanges, before_event
 from pydantic import Field
-from pymongo import IndexModel, ASCENDING
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from typing_extensions import Literal
 
 
@@ -13,14 +13,29 @@ class ExecutionJob(Document):
     runbook_id: UUID
     version_id: UUID
     status: Literal["pending", "running", "completed", "failed"]
+    # When the job was enqueued.
     start_time: datetime = Field(default_factory=lambda: datetime.now(UTC))
     end_time: Optional[datetime] = None
+    # When the worker claimed the job, and the time it spent queued before.
+    started_at: Optional[datetime] = None
+    queue_wait_ms: Optional[float] = None
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None  # claim to finish
+    # Set while a worker runs the job. A job stopped through the API is
+    # finished at once, but its worker may still write the current step.
+    worker_active: bool = False
+    # When the job was restored from the archive; retention counts from
+    # here rather than from `start_time`.
+    rehydrated_at: Optional[datetime] = None
 
     class Settings:
         name = "execution_jobs"
         indexes = [
             IndexModel([("version_id", ASCENDING)]),
             IndexModel([("runbook_id", ASCENDING)]),
+            # The worker polls for the oldest pending job.
+            IndexModel([("status", ASCENDING), ("start_time", ASCENDING)]),
+            IndexModel([("start_time", DESCENDING)]),
         ]
 
 
@@ -32,9 +47,39 @@ class ExecutionStep(Document):
     output: str  # stdout+stderr
     exit_code: int
     timestamp: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+    # Bumped on every write; used as the polling cursor for incremental status.
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    @before_event(Insert, Replace, Save, SaveChanges)
+    def touch(self):
+        self.updated_at = datetime.now(UTC)
 
     class Settings:
         name = "execution_steps"
         indexes = [
-            IndexModel([("job_id", ASCENDING)]),
+            # Also serves lookups by job_id alone.
+            IndexModel([("job_id", ASCENDING), ("updated_at", ASCENDING)]),
+        ]
+
+
+class ArchivedExecution(Document):
+    """
+    Where a pruned job was archived, so it can be rehydrated on demand.
+    The job and its steps live only in the archive file.
+    """
+
+    id: UUID  # job id
+    runbook_id: UUID
+    status: str
+    start_time: datetime
+    archive: str  # file name within the archive directory
+    archived_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    class Settings:
+        name = "archived_executions"
+        indexes = [
+            IndexModel([("runbook_id", ASCENDING), ("start_time", DESCENDING)]),
         ]
@@ -0,0 +1,15 @@
+from beanie import Document
+
+
+class RateLimitState(Document):
+    """
+    Shared state of one token bucket, used when rate limits are enforced
+    across processes. `tat` is the bucket's theoretical arrival time in
+    epoch seconds: the bucket is full again once the clock passes it.
+    """
+
+    id: str  # "scope:user id"
+    tat: float
+
+    class Settings:
+        name = "rate_limit_state"
@@ -3,10 +3,10 @@ from typing import List, Optional
 from uuid import UUID, uuid4
 
 from beanie import Document
-from pydantic import Field
-from pymongo import IndexModel, ASCENDING
+from pydantic import BaseModel, Field
+from pymongo import IndexModel, ASCENDING, DESCENDING
 
-from app.models.block import Block
+from app.models.block import Block, BlockRef
 
 
 class Runbook(Document):
@@ -21,17 +21,56 @@ class Runbook(Document):
 
     class Settings:
         name = "runbooks"
+        indexes = [
+            # Multikey; serves tag-filtered listings.
+            IndexModel([("tags", ASCENDING)]),
+        ]
+
+
+class RunbookTagCount(Document):
+    """
+    Number of runbooks carrying a tag, maintained as runbooks change so
+    the tag facets never need to scan the runbooks collection.
+    """
+
+    id: str  # tag
+    runbook_count: int = 0
+
+    class Settings:
+        name = "runbook_tag_counts"
+        indexes = [
+            IndexModel([("runbook_count", DESCENDING)]),
+        ]
 
 
 class RunbookVersion(Document):
     id: UUID = Field(default_factory=uuid4)
     runbook_id: UUID
     version_number: int
-    blocks: List[Block]  # Embedded documents
+    # Versions written before the block store embed their blocks; newer
+    # versions leave this empty and reference BlockContent by hash instead.
+    blocks: List[Block] = []
+    block_refs: List[BlockRef] = []
     created_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+    created_by: Optional[UUID] = None
+    content_hash: Optional[str] = None  # sha256 of the canonical block list
 
     class Settings:
         name = "runbook_versions"
         indexes = [
-            IndexModel([("runbook_id", ASCENDING)]),
+            # Also serves lookups by runbook_id alone.
+            IndexModel(
+                [("runbook_id", ASCENDING), ("version_number", DESCENDING)],
+                unique=True,
+            ),
         ]
+
+
+class RunbookVersionSummary(BaseModel):
+    """Projection of a version used by the history listing; carries no blocks."""
+
+    version_number: int
+    created_at: datetime
+    created_by: Optional[UUID] = None
+    block_count: int
+    content_hash: Optional[str] = None
@@ -0,0 +1,41 @@
+from datetime import datetime, UTC
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from beanie import Document
+from pydantic import BaseModel, Field
+from pymongo import IndexModel, ASCENDING
+
+
+class RunbookSearchEntry(Document):
+    """
+    Search index entry for the latest version of a runbook. `terms` holds
+    every distinct token and `weights` how strongly each token is tied to
+    the runbook.
+    """
+
+    id: UUID  # runbook id
+    title: str
+    description: str
+    tags: List[str] = []
+    version: int = 0
+    terms: List[str] = []
+    weights: Dict[str, float] = {}
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    class Settings:
+        name = "runbook_search"
+        indexes = [
+            # Multikey; anchored prefix regexes on terms use it too.
+            IndexModel([("terms", ASCENDING)]),
+        ]
+
+
+class RunbookSearchHit(BaseModel):
+    id: UUID
+    title: str
+    description: str
+    tags: List[str] = []
+    version: int
+    score: float
+    updated_at: Optional[datetime] = None
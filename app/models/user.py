@@ -1,14 +1,33 @@
 from uuid import UUID, uuid4
 
-from beanie import Document, Indexed
+from beanie import (
+    Delete,
+    Document,
+    Indexed,
+    Insert,
+    Replace,
+    Save,
+    SaveChanges,
+    Update,
+    after_event,
+)
 from pydantic import Field
 
+from app.services.auth_cache import invalidate_user
+
 
 class User(Document):
     """User account stored in MongoDB."""
 
     id: UUID = Field(default_factory=uuid4)
-    username: Indexed(str)
+    username: Indexed(str, unique=True)
     password: str
-    api_key: str
+    # Looked up on every authenticated request.
+    api_key: Indexed(str, unique=True)
     role: str
+
+    @after_event(Insert, Replace, Save, SaveChanges, Update, Delete)
+    def invalidate_auth_cache(self):
+        # Bulk updates through queries bypass this hook; the cache TTL
+        # bounds how long they go unnoticed.
+        invalidate_user(self.id, self.api_key)
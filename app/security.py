@@ -1,9 +1,13 @@
+import math
 import os
 from functools import lru_cache
 
 from cryptography.fernet import Fernet
 from fastapi import Header, HTTPException, status, Depends
+from .metrics import AUTH_CACHE_LOOKUPS
 from .models import User
+from .services.auth_cache import invalid_key_cache, user_cache
+from .services.rate_limit import rate_limiter
 
 
 @lru_cache()
@@ -30,19 +34,36 @@ def decrypt_secret(encrypted_secret: str) -> str:
 async def get_current_user(
     x_api_key: str | None = Header(None, alias="X-API-KEY"),
 ) -> User:
-    """Validate API key from database and return associated user."""
+    """
+    Validate the API key and return the associated user. Known keys and
+    known invalid keys are answered from in-process caches.
+    """
     if x_api_key is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing API key"
         )
 
+    user = user_cache.get(x_api_key)
+    if user is not None:
+        AUTH_CACHE_LOOKUPS.labels("hit").inc()
+        # A copy, so handlers cannot change the cached user.
+        return user.model_copy()
+    if invalid_key_cache.get(x_api_key):
+        AUTH_CACHE_LOOKUPS.labels("negative_hit").inc()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key"
+        )
+
+    AUTH_CACHE_LOOKUPS.labels("miss").inc()
     # Retrieve user with given API key
     user = await User.find_one({"api_key": x_api_key})
     if user is None:
+        invalid_key_cache.put(x_api_key, True)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key"
         )
-    return user
+    user_cache.put(x_api_key, user)
+    return user.model_copy()
 
 
 async def get_current_role(user: User = Depends(get_current_user)) -> str:
@@ -61,3 +82,21 @@ def require_roles(*allowed_roles: str):
             )
 
     return Depends(dependency)
+
+
+def rate_limit(scope: str):
+    """
+    Dependency taking a token from the current user's bucket for `scope`,
+    answering 429 with `Retry-After` when it is empty.
+    """
+
+    async def dependency(user: User = Depends(get_current_user)) -> None:
+        retry_after = await rate_limiter.check(scope, user.id, user.role)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    return Depends(dependency)
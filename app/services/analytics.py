@@ -0,0 +1,341 @@
+import asyncio
+import sys
+from datetime import datetime, timedelta, UTC
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+from beanie.operators import In
+from loguru import logger
+from pydantic import BaseModel
+
+from app.models.analytics import BlockRollup, ExecutionRollup
+from app.models.execution import ExecutionJob, ExecutionStep
+from app.services.timing import as_utc, elapsed_ms
+
+# Upper bounds of the duration histogram buckets, in milliseconds.
+DURATION_BUCKETS_MS = [
+    100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000, 900000, 3600000
+]
+
+GRANULARITIES = ("hour", "day")
+
+
+class BlockStats(BaseModel):
+    block_id: UUID
+    runs: int
+    failures: int
+    success_rate: Optional[float] = None
+    mean_ms: Optional[float] = None
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+
+
+class SeriesPoint(BaseModel):
+    bucket: datetime
+    jobs: int
+    succeeded: int
+    failed: int
+
+
+class ExecutionStats(BaseModel):
+    jobs: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    success_rate: Optional[float] = None
+    mean_ms: Optional[float] = None
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+
+
+class RunbookAnalytics(ExecutionStats):
+    runbook_id: UUID
+    since: datetime
+    until: datetime
+    granularity: str
+    series: List[SeriesPoint] = []
+    # Blocks ordered by failures, then by p95 duration: the hotspots first.
+    blocks: List[BlockStats] = []
+
+
+class RunbookHotspot(BaseModel):
+    runbook_id: UUID
+    jobs: int
+    failed: int
+    failure_rate: float
+
+
+class FleetAnalytics(ExecutionStats):
+    since: datetime
+    until: datetime
+    granularity: str
+    series: List[SeriesPoint] = []
+    hotspots: List[RunbookHotspot] = []
+
+
+def duration_bucket(duration_ms: float) -> str:
+    for bound in DURATION_BUCKETS_MS:
+        if duration_ms <= bound:
+            return str(bound)
+    return "inf"
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    moment = moment.astimezone(UTC) if moment.tzinfo else moment.replace(tzinfo=UTC)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_id(granularity: str, bucket: datetime, runbook_id: Optional[UUID]) -> str:
+    return f"{granularity}:{bucket.strftime('%Y-%m-%dT%H')}:{runbook_id or 'fleet'}"
+
+
+def percentile(buckets: Dict[str, int], max_ms: float, q: float) -> Optional[float]:
+    """
+    Estimates a percentile from a duration histogram as the upper bound of
+    the bucket it falls in, capped at the largest duration seen.
+    """
+    total = sum(buckets.values())
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for bound in [str(b) for b in DURATION_BUCKETS_MS] + ["inf"]:
+        seen += buckets.get(bound, 0)
+        if seen >= rank:
+            return max_ms if bound == "inf" else min(float(bound), max_ms)
+    return max_ms
+
+
+async def record_job(job: ExecutionJob, finished_at: Optional[datetime] = None) -> None:
+    """
+    Adds a finished job and its steps to the hourly and daily rollups of
+    its runbook and of the fleet.
+    """
+    finished_at = finished_at or job.finished_at or datetime.now(UTC)
+    if job.duration_ms is not None:
+        duration_ms = job.duration_ms
+    else:
+        # Jobs recorded before claim times were kept.
+        duration_ms = elapsed_ms(job.start_time, finished_at)
+    succeeded = job.status == "completed"
+    steps = await ExecutionStep.find(ExecutionStep.job_id == job.id).to_list()
+
+    increments: Dict[str, float] = {
+        "jobs": 1,
+        "succeeded": int(succeeded),
+        "failed": int(not succeeded),
+        "total_duration_ms": duration_ms,
+        f"duration_buckets.{duration_bucket(duration_ms)}": 1,
+    }
+    block_increments: Dict[str, float] = {}
+    block_maxima: Dict[str, float] = {}
+    for step in steps:
+        step_ms = (
+            step.duration_ms
+            if step.duration_ms is not None
+            else elapsed_ms(step.timestamp, step.updated_at)
+        )
+        prefix = f"blocks.{step.block_id}"
+        for field, value in (
+            ("runs", 1),
+            ("failures", int(step.status == "error")),
+            ("total_duration_ms", step_ms),
+            (f"duration_buckets.{duration_bucket(step_ms)}", 1),
+        ):
+            key = f"{prefix}.{field}"
+            block_increments[key] = block_increments.get(key, 0) + value
+        key = f"{prefix}.max_duration_ms"
+        block_maxima[key] = max(block_maxima.get(key, 0.0), step_ms)
+
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(finished_at, granularity)
+        for runbook_id in (job.runbook_id, None):
+            update = {
+                "$setOnInsert": {
+                    "granularity": granularity,
+                    "bucket": bucket,
+                    "runbook_id": runbook_id,
+                },
+                "$inc": dict(increments),
+                "$max": {"max_duration_ms": duration_ms},
+            }
+            # Per-block figures only matter within a runbook.
+            if runbook_id:
+                update["$inc"].update(block_increments)
+                update["$max"].update(block_maxima)
+            # Through Beanie so UUIDs are encoded like everywhere else.
+            await ExecutionRollup.find_one(
+                ExecutionRollup.id == rollup_id(granularity, bucket, runbook_id)
+            ).update(update, upsert=True)
+
+
+async def _rollups(
+    runbook_id: Optional[UUID], since: datetime, until: datetime, granularity: str
+) -> List[ExecutionRollup]:
+    return await ExecutionRollup.find(
+        ExecutionRollup.granularity == granularity,
+        ExecutionRollup.runbook_id == runbook_id,
+        ExecutionRollup.bucket >= bucket_start(since, granularity),
+        ExecutionRollup.bucket < until,
+    ).sort("+bucket").to_list()
+
+
+def _merge(rollups: List[ExecutionRollup]) -> Tuple[ExecutionStats, Dict[str, BlockRollup]]:
+    buckets: Dict[str, int] = {}
+    total_ms = 0.0
+    max_ms = 0.0
+    stats = ExecutionStats()
+    blocks: Dict[str, BlockRollup] = {}
+    for rollup in rollups:
+        stats.jobs += rollup.jobs
+        stats.succeeded += rollup.succeeded
+        stats.failed += rollup.failed
+        total_ms += rollup.total_duration_ms
+        max_ms = max(max_ms, rollup.max_duration_ms)
+        for bound, count in rollup.duration_buckets.items():
+            buckets[bound] = buckets.get(bound, 0) + count
+        for block_id, block in rollup.blocks.items():
+            merged = blocks.setdefault(block_id, BlockRollup())
+            merged.runs += block.runs
+            merged.failures += block.failures
+            merged.total_duration_ms += block.total_duration_ms
+            merged.max_duration_ms = max(merged.max_duration_ms, block.max_duration_ms)
+            for bound, count in block.duration_buckets.items():
+                merged.duration_buckets[bound] = merged.duration_buckets.get(bound, 0) + count
+    if stats.jobs:
+        stats.success_rate = stats.succeeded / stats.jobs
+        stats.mean_ms = total_ms / stats.jobs
+        stats.p50_ms = percentile(buckets, max_ms, 0.5)
+        stats.p95_ms = percentile(buckets, max_ms, 0.95)
+    return stats, blocks
+
+
+def _series(rollups: List[ExecutionRollup]) -> List[SeriesPoint]:
+    return [
+        SeriesPoint(
+            bucket=rollup.bucket,
+            jobs=rollup.jobs,
+            succeeded=rollup.succeeded,
+            failed=rollup.failed,
+        )
+        for rollup in rollups
+    ]
+
+
+def default_window(
+    since: Optional[datetime], until: Optional[datetime]
+) -> Tuple[datetime, datetime]:
+    until = as_utc(until) if until else datetime.now(UTC)
+    since = as_utc(since) if since else until - timedelta(days=30)
+    return since, until
+
+
+async def runbook_analytics(
+    runbook_id: UUID, since: datetime, until: datetime, granularity: str = "day"
+) -> RunbookAnalytics:
+    """Summarizes one runbook's executions from its rollups."""
+    rollups = await _rollups(runbook_id, since, until, granularity)
+    stats, blocks = _merge(rollups)
+    block_stats = [
+        BlockStats(
+            block_id=UUID(block_id),
+            runs=block.runs,
+            failures=block.failures,
+            success_rate=(block.runs - block.failures) / block.runs if block.runs else None,
+            mean_ms=block.total_duration_ms / block.runs if block.runs else None,
+            p50_ms=percentile(block.duration_buckets, block.max_duration_ms, 0.5),
+            p95_ms=percentile(block.duration_buckets, block.max_duration_ms, 0.95),
+        )
+        for block_id, block in blocks.items()
+    ]
+    block_stats.sort(key=lambda b: (-b.failures, -(b.p95_ms or 0)))
+    return RunbookAnalytics(
+        **stats.model_dump(),
+        runbook_id=runbook_id,
+        since=since,
+        until=until,
+        granularity=granularity,
+        series=_series(rollups),
+        blocks=block_stats,
+    )
+
+
+async def fleet_analytics(
+    since: datetime, until: datetime, granularity: str = "day", hotspots: int = 10
+) -> FleetAnalytics:
+    """
+    Summarizes all executions from the fleet rollups, with the runbooks
+    that failed most often in the window.
+    """
+    rollups = await _rollups(None, since, until, granularity)
+    stats, _ = _merge(rollups)
+    failing = await ExecutionRollup.find(
+        ExecutionRollup.granularity == granularity,
+        ExecutionRollup.runbook_id != None,  # noqa: E711
+        ExecutionRollup.bucket >= bucket_start(since, granularity),
+        ExecutionRollup.bucket < until,
+        ExecutionRollup.failed > 0,
+    ).aggregate(
+        [
+            {"$group": {"_id": "$runbook_id", "failed": {"$sum": "$failed"}, "jobs": {"$sum": "$jobs"}}},
+            {"$sort": {"failed": -1}},
+            {"$limit": hotspots},
+        ]
+    ).to_list()
+    return FleetAnalytics(
+        **stats.model_dump(),
+        since=since,
+        until=until,
+        granularity=granularity,
+        series=_series(rollups),
+        hotspots=[
+            RunbookHotspot(
+                runbook_id=entry["_id"],
+                jobs=entry["jobs"],
+                failed=entry["failed"],
+                failure_rate=entry["failed"] / entry["jobs"],
+            )
+            for entry in failing
+        ],
+    )
+
+
+async def rebuild_rollups(batch_size: int = 500) -> int:
+    """
+    Recomputes every rollup from the finished jobs still in the database.
+    Returns the number of jobs counted.
+    """
+    await ExecutionRollup.find_all().delete()
+    counted = 0
+    last_id = None
+    while True:
+        query = ExecutionJob.find(In(ExecutionJob.status, ["completed", "failed"]))
+        if last_id:
+            query = query.find(ExecutionJob.id > last_id)
+        jobs = await query.sort("+_id").limit(batch_size).to_list()
+        if not jobs:
+            break
+        for job in jobs:
+            await record_job(job, job.finished_at or job.end_time or job.start_time)
+        counted += len(jobs)
+        last_id = jobs[-1].id
+    logger.info(f"Execution rollups rebuilt from {counted} jobs.")
+    return counted
+
+
+async def main() -> int:
+    """
+    Command-line rebuild: `python -m app.services.analytics`. Needed once
+    for history recorded before rollups existed.
+    """
+    from app.db import create_init_beanie
+    from app.main import document_models
+
+    await create_init_beanie(document_models)()
+    print(f"Rolled up {await rebuild_rollups()} jobs.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
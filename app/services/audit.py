@@ -1,9 +1,210 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from pathlib import Path
 from uuid import UUID
-from typing import Dict, Any, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pymongo.errors import BulkWriteError
 
 from app.models.audit import AuditLog
 from app.models.user import User
 
+# Newest first; `_id` breaks ties between entries logged in the same instant.
+AUDIT_SORT = [("timestamp", -1), ("_id", -1)]
+
+CSV_COLUMNS = ["id", "timestamp", "user_id", "action", "target_id", "details"]
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Longest a read waits for queued entries to be written before it runs.
+AUDIT_FLUSH_TIMEOUT = float(os.getenv("AUDIT_FLUSH_TIMEOUT", "2"))
+
+
+class AuditWriter:
+    """
+    Write-behind buffer for audit entries. Requests enqueue entries and
+    return; a background task writes them with `insert_many` in batches.
+    When the bounded queue is full, submitters either wait for room
+    (`block`) or append the entry to a local NDJSON spill file (`spill`),
+    which is replayed into MongoDB on the next start. Entries are never
+    dropped.
+    """
+
+    def __init__(
+        self,
+        queue_size: int,
+        batch_size: int,
+        flush_interval: float,
+        overflow_policy: str,
+        spill_path: str,
+    ):
+        if overflow_policy not in ("block", "spill"):
+            raise ValueError(f"Unknown audit overflow policy: {overflow_policy}")
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = Path(spill_path)
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flushing = 0
+        # Entries queued and entries written since start. The queue is FIFO
+        # with one writer, so an entry is written once `_written` passes the
+        # value `_queued` had when it was queued.
+        self._queued = 0
+        self._written = 0
+        self._progress: Optional[asyncio.Condition] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self) -> None:
+        """Replays any spilled entries and starts the background writer."""
+        await self.replay_spill()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._wakeup = asyncio.Event()
+        self._progress = asyncio.Condition()
+        self._queued = self._written = 0
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Writes every queued entry, then stops the background writer."""
+        if not self.running:
+            return
+        await self.flush()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self.queue = None
+
+    async def submit(self, entry: AuditLog) -> None:
+        if not self.running:
+            # Outside the application (scripts, tests) write straight away.
+            await entry.insert()
+            return
+        if self.queue.full() and self.overflow_policy == "spill":
+            self._spill([entry])
+            return
+        await self.queue.put(entry)
+        self._queued += 1
+        if self.queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every entry submitted before the call is written, but
+        not for entries submitted meanwhile, and at most `timeout` seconds.
+        Returns whether they were written in time.
+        """
+        if not self.running:
+            return True
+        target = self._queued
+        self._flushing += 1
+        try:
+            self._wakeup.set()
+            async with self._progress:
+                await asyncio.wait_for(
+                    self._progress.wait_for(lambda: self._written >= target), timeout
+                )
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"Audit flush timed out after {timeout}s")
+            return False
+        finally:
+            self._flushing -= 1
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            # Give the batch a moment to fill unless it is already full or
+            # someone is waiting for it.
+            if not self._flushing and self.queue.qsize() < self.batch_size - 1:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+                async with self._progress:
+                    self._written += len(batch)
+                    self._progress.notify_all()
+
+    async def _write(self, batch: List[AuditLog]) -> None:
+        try:
+            await AuditLog.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            if any(
+                error["code"] != DUPLICATE_KEY_ERROR
+                for error in e.details.get("writeErrors", [])
+            ):
+                logger.error(f"Audit write failed, spilling {len(batch)} entries: {e}")
+                self._spill(batch)
+        except Exception as e:
+            logger.error(f"Audit write failed, spilling {len(batch)} entries: {e}")
+            self._spill(batch)
+
+    def _spill(self, entries: List[AuditLog]) -> None:
+        with self.spill_path.open("a", encoding="utf-8") as spill:
+            for entry in entries:
+                spill.write(entry.model_dump_json(by_alias=True) + "\n")
+
+    async def replay_spill(self) -> int:
+        """
+        Inserts entries from the spill file and removes it. Entries that
+        were already written are skipped. Returns the number replayed.
+        """
+        if not self.spill_path.exists():
+            return 0
+        replaying = self.spill_path.with_name(self.spill_path.name + ".replaying")
+        self.spill_path.replace(replaying)
+        entries = [
+            AuditLog.model_validate_json(line)
+            for line in replaying.read_text(encoding="utf-8").splitlines()
+            if line.strip()
+        ]
+        for start in range(0, len(entries), self.batch_size):
+            try:
+                await AuditLog.insert_many(
+                    entries[start : start + self.batch_size], ordered=False
+                )
+            except BulkWriteError as e:
+                if any(
+                    error["code"] != DUPLICATE_KEY_ERROR
+                    for error in e.details.get("writeErrors", [])
+                ):
+                    # Keep the file for the next attempt.
+                    replaying.replace(self.spill_path)
+                    raise
+        replaying.unlink()
+        logger.info(f"Replayed {len(entries)} spilled audit entries.")
+        return len(entries)
+
+
+audit_writer = AuditWriter(
+    queue_size=int(os.getenv("AUDIT_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("AUDIT_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5")),
+    overflow_policy=os.getenv("AUDIT_OVERFLOW_POLICY", "block"),
+    spill_path=os.getenv("AUDIT_SPILL_PATH", "audit_spill.ndjson"),
+)
+
 
 async def log_action(
     user: User,
@@ -12,7 +213,7 @@ async def log_action(
     details: Optional[Dict[str, Any]] = None,
 ):
     """
-    Creates and saves an audit log entry.
+    Creates an audit log entry and hands it to the write-behind queue.
     """
     log_entry = AuditLog(
         user_id=user.id,
@@ -20,4 +221,95 @@ async def log_action(
         target_id=target_id,
         details=details,
     )
-    await log_entry.insert()
+    await audit_writer.submit(log_entry)
+
+
+def encode_cursor(log: AuditLog) -> str:
+    """Returns an opaque cursor pointing just past `log`."""
+    raw = f"{log.timestamp.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Reverses `encode_cursor`. Raises ValueError for a malformed cursor."""
+    try:
+        timestamp, log_id = (
+            base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        )
+        return datetime.fromisoformat(timestamp), UUID(log_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def audit_filter(
+    user_id: Optional[UUID] = None,
+    action: Optional[str] = None,
+    target_id: Optional[UUID] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Builds the Mongo filter for an audit query. `start` is inclusive and
+    `end` exclusive. With a cursor, only entries after it in `AUDIT_SORT`
+    order match, so pages are read by seeking the index instead of skipping.
+    """
+    query: Dict[str, Any] = {}
+    if user_id:
+        query["user_id"] = user_id
+    if action:
+        query["action"] = action
+    if target_id:
+        query["target_id"] = target_id
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lt"] = end
+    if cursor:
+        timestamp, log_id = decode_cursor(cursor)
+        query = {
+            "$and": [
+                query,
+                {
+                    "$or": [
+                        {"timestamp": {"$lt": timestamp}},
+                        {"timestamp": timestamp, "_id": {"$lt": log_id}},
+                    ]
+                },
+            ]
+        }
+    return query
+
+
+async def export_audit_logs(
+    query: Dict[str, Any], format: str = "ndjson"
+) -> AsyncIterator[str]:
+    """
+    Streams the matching audit entries as NDJSON or CSV straight from the
+    cursor, one entry at a time.
+    """
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        yield buffer.getvalue()
+    async for log in AuditLog.find(query).sort(AUDIT_SORT):
+        if format == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(
+                [
+                    log.id,
+                    log.timestamp.isoformat(),
+                    log.user_id,
+                    log.action,
+                    log.target_id,
+                    json.dumps(log.details) if log.details is not None else "",
+                ]
+            )
+            yield buffer.getvalue()
+        else:
+            # Same shape as the entries returned by GET /audit.
+            yield log.model_dump_json(by_alias=True) + "\n"
@@ -0,0 +1,27 @@
+import os
+from typing import Any
+from uuid import UUID
+
+from app.services.cache import TTLCache
+
+# API key -> User. Entries live for at most AUTH_CACHE_TTL seconds, which
+# bounds how stale another process's view of a changed user can be.
+user_cache: TTLCache[Any] = TTLCache(
+    int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    float(os.getenv("AUTH_CACHE_TTL", "60")),
+)
+
+# API keys that matched no user, so repeated guesses do not reach MongoDB.
+invalid_key_cache: TTLCache[bool] = TTLCache(
+    int(os.getenv("AUTH_NEGATIVE_CACHE_SIZE", "10000")),
+    float(os.getenv("AUTH_NEGATIVE_CACHE_TTL", "10")),
+)
+
+
+def invalidate_user(user_id: UUID, api_key: str) -> None:
+    """
+    Forgets a user, under its current and any previous API key, and clears
+    a negative entry for its key.
+    """
+    user_cache.pop_matching(lambda key, user: key == api_key or user.id == user_id)
+    invalid_key_cache.pop(api_key)
@@ -0,0 +1,360 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+from datetime import datetime, UTC
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import docker
+from beanie import UpdateResponse
+from loguru import logger
+
+from app.models.environment import (
+    EnvironmentBuild,
+    EnvironmentImage,
+    ExecutionEnvironment,
+)
+
+# Image builds run at once in this process; further builds wait queued.
+BUILD_CONCURRENCY = int(os.getenv("ENVIRONMENT_BUILD_CONCURRENCY", "2"))
+# Longest a build log line waits before it is written to MongoDB.
+BUILD_LOG_FLUSH_INTERVAL = float(os.getenv("ENVIRONMENT_BUILD_LOG_FLUSH_INTERVAL", "0.5"))
+
+BUILD_TERMINAL_STATUSES = ("ready", "failed")
+
+IMAGE_REPOSITORY = "runbook-exec-env"
+
+# Parser directives such as `# syntax=` are only honoured at the very top.
+DIRECTIVE_PATTERN = re.compile(r"^#\s*\w+\s*=")
+# Here-documents such as `RUN <<EOF` or `COPY <<-"FILE" /dest`; the body
+# that follows the instruction is file or script content.
+HEREDOC_PATTERN = re.compile(r"<<(-?)([\"']?)(\w+)\2")
+
+CREDENTIALS_HINT = (
+    "Docker credential helper error. "
+    "This can happen if your local Docker is configured to use a "
+    "cloud credential helper (like gcloud) and you are not logged in. "
+    "Please check your Docker config (`~/.docker/config.json`) or "
+    "ensure you are authenticated with your cloud provider."
+)
+
+
+class BuildFailed(Exception):
+    pass
+
+
+def normalize_dockerfile(dockerfile: str) -> str:
+    """
+    Drops what cannot change the built image: comments, blank lines,
+    trailing whitespace and the case of instruction keywords. Here-document
+    bodies are kept exactly as written.
+    """
+    lines = []
+    directives = True
+    # Here-documents of the current instruction: (strip tabs, end marker).
+    heredocs: List[Tuple[bool, str]] = []
+    body: Optional[Tuple[bool, str]] = None
+    for raw_line in dockerfile.splitlines():
+        if body is not None:
+            lines.append(raw_line)
+            strip_tabs, marker = body
+            if (raw_line.lstrip("\t") if strip_tabs else raw_line) == marker:
+                body = heredocs.pop(0) if heredocs else None
+            continue
+        line = raw_line.strip()
+        if directives and DIRECTIVE_PATTERN.match(line):
+            lines.append(re.sub(r"\s+", "", line).lower())
+            continue
+        directives = False
+        if not line or line.startswith("#"):
+            continue
+        keyword, _, rest = line.partition(" ")
+        # Continuation lines are not instructions.
+        if lines and lines[-1].endswith("\\"):
+            lines.append(line)
+        else:
+            lines.append(f"{keyword.upper()} {rest.strip()}".rstrip())
+        heredocs += [
+            (bool(dash), marker) for dash, _, marker in HEREDOC_PATTERN.findall(line)
+        ]
+        # Bodies start once the instruction, with its continuations, ends.
+        if heredocs and not line.endswith("\\"):
+            body = heredocs.pop(0)
+    return "\n".join(lines)
+
+
+def dockerfile_hash(dockerfile: str) -> str:
+    return hashlib.sha256(normalize_dockerfile(dockerfile).encode("utf-8")).hexdigest()
+
+
+def image_tag_for(content_hash: str) -> str:
+    return f"{IMAGE_REPOSITORY}:{content_hash}"
+
+
+def docker_build(dockerfile: str, tag: str, emit: Callable[[str], None]) -> str:
+    """
+    Builds an image from a Dockerfile, passing each log line to `emit` as
+    Docker reports it. Blocking; runs in a worker thread.
+    """
+    client = docker.from_env()
+    try:
+        for chunk in client.api.build(
+            fileobj=io.BytesIO(dockerfile.encode("utf-8")),
+            tag=tag,
+            rm=True,
+            decode=True,
+        ):
+            if "stream" in chunk:
+                for line in chunk["stream"].splitlines():
+                    if line.strip():
+                        emit(line)
+            elif "error" in chunk:
+                raise BuildFailed(chunk["error"].strip())
+            elif "status" in chunk:
+                emit(chunk["status"])
+    finally:
+        client.close()
+    return tag
+
+
+def remove_image(image_tag: str) -> None:
+    """Removes an image from the local Docker host. Blocking."""
+    client = docker.from_env()
+    try:
+        client.images.remove(image=image_tag, force=True)
+        logger.info(f"Removed image {image_tag}")
+    except docker.errors.ImageNotFound:
+        pass
+    finally:
+        client.close()
+
+
+async def acquire_image(content_hash: str, image_tag: str) -> None:
+    """Adds an environment's reference to a shared image."""
+    await EnvironmentImage.find_one(EnvironmentImage.id == content_hash).update(
+        {
+            "$inc": {"ref_count": 1},
+            "$setOnInsert": {"image_tag": image_tag, "created_at": datetime.now(UTC)},
+        },
+        upsert=True,
+    )
+
+
+async def release_image(content_hash: str) -> None:
+    """
+    Drops one environment's reference to a shared image, removing the
+    image once nothing references it. A failed removal is logged; the
+    image is then left for garbage collection.
+    """
+    await EnvironmentImage.find_one(EnvironmentImage.id == content_hash).update(
+        {"$inc": {"ref_count": -1}}
+    )
+    unused = EnvironmentImage.find(
+        EnvironmentImage.id == content_hash, EnvironmentImage.ref_count <= 0
+    )
+    image = await unused.first_or_none()
+    # Conditional, so a reference taken in between keeps the image.
+    if image is None or not (await unused.delete()).deleted_count:
+        return
+    try:
+        await asyncio.to_thread(remove_image, image.image_tag)
+    except Exception as e:
+        logger.warning(f"Could not remove unused image {image.image_tag}: {e}")
+
+
+async def release_environment_image(environment: ExecutionEnvironment) -> None:
+    """Releases the image an environment uses, if any."""
+    if environment.dockerfile_hash:
+        await release_image(environment.dockerfile_hash)
+    elif environment.image_tag:
+        # Built for this environment alone, before images were shared.
+        try:
+            await asyncio.to_thread(remove_image, environment.image_tag)
+        except Exception as e:
+            logger.warning(f"Could not remove image {environment.image_tag}: {e}")
+
+
+class BuildManager:
+    """
+    Runs environment image builds as background tasks, at most
+    `concurrency` at a time, and records their progress and logs. Images
+    are shared by Dockerfile hash: a Dockerfile that was built before is
+    not built again.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[UUID, asyncio.Task] = {}
+        # Builds running in this process by Dockerfile hash, so identical
+        # Dockerfiles submitted together are built once.
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def enqueue(
+        self, environment: ExecutionEnvironment, dockerfile: str
+    ) -> EnvironmentBuild:
+        """
+        Queues a build of `dockerfile` and marks it the environment's
+        latest. An image already built from the same Dockerfile is used
+        at once.
+        """
+        content_hash = dockerfile_hash(dockerfile)
+        build = EnvironmentBuild(
+            environment_id=environment.id,
+            dockerfile=dockerfile,
+            dockerfile_hash=content_hash,
+        )
+        image = await EnvironmentImage.get(content_hash)
+        if image:
+            build.log = [f"Using image {image.image_tag} built from an identical Dockerfile"]
+        await build.insert()
+        await environment.set(
+            {
+                ExecutionEnvironment.status: "queued",
+                ExecutionEnvironment.build_id: build.id,
+                ExecutionEnvironment.build_error: None,
+            }
+        )
+        if image:
+            await self._finish(build, environment.id, image_tag=image.image_tag)
+            await environment.sync()
+            return build
+        task = asyncio.create_task(self._run(build, environment.id))
+        self._tasks[build.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(build.id, None))
+        return build
+
+    async def _set_environment(
+        self, environment_id: UUID, build_id: UUID, fields: Dict
+    ) -> Optional[ExecutionEnvironment]:
+        """
+        Updates the environment if `build_id` is still its latest build, and
+        returns it as it was before the update.
+        """
+        return await ExecutionEnvironment.find_one(
+            ExecutionEnvironment.id == environment_id,
+            ExecutionEnvironment.build_id == build_id,
+        ).update({"$set": fields}, response_type=UpdateResponse.OLD_DOCUMENT)
+
+    async def _append_log(self, build: EnvironmentBuild, lines: List[str]) -> None:
+        await EnvironmentBuild.find_one(EnvironmentBuild.id == build.id).update(
+            {"$push": {"log": {"$each": lines}}}
+        )
+
+    async def _run(self, build: EnvironmentBuild, environment_id: UUID) -> None:
+        try:
+            image_tag = await self._image_for(build, environment_id)
+        except asyncio.CancelledError:
+            await self._finish(build, environment_id, error="Build interrupted by shutdown")
+            raise
+        except BuildFailed as e:
+            await self._finish(build, environment_id, error=f"Docker build failed: {e}")
+        except Exception as e:
+            logger.exception(f"Build {build.id} of environment {environment_id} failed")
+            error = CREDENTIALS_HINT if "Credentials store" in str(e) else str(e)
+            await self._finish(build, environment_id, error=error)
+        else:
+            await self._finish(build, environment_id, image_tag=image_tag)
+
+    async def _image_for(self, build: EnvironmentBuild, environment_id: UUID) -> str:
+        """Builds the image, or waits for an identical build running here."""
+        inflight = self._inflight.get(build.dockerfile_hash)
+        if inflight:
+            await self._append_log(build, ["Waiting for an identical build"])
+        else:
+            inflight = asyncio.create_task(self._build(build, environment_id))
+            self._inflight[build.dockerfile_hash] = inflight
+            inflight.add_done_callback(
+                lambda _: self._inflight.pop(build.dockerfile_hash, None)
+            )
+        # Shielded, so a waiting build that is cancelled leaves the shared one.
+        return await asyncio.shield(inflight)
+
+    async def _build(self, build: EnvironmentBuild, environment_id: UUID) -> str:
+        """Runs the Docker build in one of the build slots. Returns the tag."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            await build.set(
+                {
+                    EnvironmentBuild.status: "building",
+                    EnvironmentBuild.started_at: datetime.now(UTC),
+                }
+            )
+            await self._set_environment(environment_id, build.id, {"status": "building"})
+            loop = asyncio.get_running_loop()
+            lines: asyncio.Queue = asyncio.Queue()
+            tag = image_tag_for(build.dockerfile_hash)
+            logger.info(f"Building Docker image {tag} (build {build.id})...")
+            result = loop.run_in_executor(
+                None,
+                docker_build,
+                build.dockerfile,
+                tag,
+                lambda line: loop.call_soon_threadsafe(lines.put_nowait, line),
+            )
+            while not (result.done() and lines.empty()):
+                await asyncio.wait([result], timeout=BUILD_LOG_FLUSH_INTERVAL)
+                batch = []
+                while not lines.empty():
+                    batch.append(lines.get_nowait())
+                if batch:
+                    await self._append_log(build, batch)
+            image_tag = result.result()
+
+        logger.info(f"Successfully built image {image_tag}")
+        return image_tag
+
+    async def _finish(
+        self,
+        build: EnvironmentBuild,
+        environment_id: UUID,
+        image_tag: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        status = "failed" if error else "ready"
+        await build.set(
+            {
+                EnvironmentBuild.status: status,
+                EnvironmentBuild.error: error,
+                EnvironmentBuild.finished_at: datetime.now(UTC),
+            }
+        )
+        if error:
+            logger.error(f"Build {build.id} of environment {environment_id}: {error}")
+            # A previous image, if any, stays in use.
+            await self._set_environment(
+                environment_id, build.id, {"status": status, "build_error": error}
+            )
+            return
+
+        # Take the reference first, so the image cannot be removed in between.
+        await acquire_image(build.dockerfile_hash, image_tag)
+        previous = await self._set_environment(
+            environment_id,
+            build.id,
+            {
+                "status": status,
+                "build_error": None,
+                "image_tag": image_tag,
+                "dockerfile": build.dockerfile,
+                "dockerfile_hash": build.dockerfile_hash,
+            },
+        )
+        if previous is None:
+            # Superseded or deleted meanwhile.
+            await release_image(build.dockerfile_hash)
+        else:
+            await release_environment_image(previous)
+
+    async def stop(self) -> None:
+        """Cancels running and queued builds, recording them as failed."""
+        tasks = list(self._tasks.values()) + list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+build_manager = BuildManager(BUILD_CONCURRENCY)
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """
+    A small in-process least-recently-used cache. Not thread-safe; it is
+    meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, V]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def put(self, key: Hashable, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        return self._data.pop(key, default)
+
+    def pop_matching(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Removes every entry whose key satisfies the predicate."""
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def items(self) -> List[Tuple[Hashable, V]]:
+        return list(self._data.items())
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TTLCache(Generic[V]):
+    """
+    An LRU cache whose entries also expire `ttl` seconds after they were
+    stored. Expired entries are dropped when next read.
+    """
+
+    def __init__(
+        self, maxsize: int, ttl: float, timer: Callable[[], float] = time.monotonic
+    ):
+        self.ttl = ttl
+        self._timer = timer
+        self._entries: LRUCache[Tuple[float, V]] = LRUCache(maxsize)
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires <= self._timer():
+            self._entries.pop(key)
+            return default
+        return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        self._entries.put(key, (self._timer() + self.ttl, value))
+
+    def pop(self, key: Hashable, default: Any = None) -> Optional[V]:
+        entry = self._entries.pop(key)
+        return default if entry is None else entry[1]
+
+    def pop_matching(self, predicate: Callable[[Hashable, V], bool]) -> None:
+        """Removes every entry whose key and value satisfy the predicate."""
+        for key, (_, value) in self._entries.items():
+            if predicate(key, value):
+                self._entries.pop(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
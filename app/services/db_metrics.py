@@ -0,0 +1,193 @@
+import asyncio
+import os
+import random
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+from pymongo import monitoring
+
+from app.metrics import MONGODB_COMMAND_DURATION
+from app.services.cache import TTLCache
+
+# Commands slower than this are logged with the shape of their filter.
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+# Share of slow commands whose plan is also explained; 0 disables explain.
+DB_EXPLAIN_SAMPLE_RATE = float(os.getenv("DB_EXPLAIN_SAMPLE_RATE", "0"))
+# A filter shape is explained at most once per this many seconds.
+DB_EXPLAIN_INTERVAL = float(os.getenv("DB_EXPLAIN_INTERVAL", "3600"))
+
+# Where each command keeps the filter that decides which documents it reads.
+FILTER_PATHS = {
+    "find": ("filter",),
+    "count": ("query",),
+    "distinct": ("query",),
+    "findAndModify": ("query",),
+    "update": ("updates", 0, "q"),
+    "delete": ("deletes", 0, "q"),
+}
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+
+
+def filter_shape(value: Any) -> Any:
+    """
+    Replaces the values of a filter with placeholders, keeping field
+    names and operators, so queries that differ only in values group.
+    """
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # `$in` lists and the like: one placeholder regardless of length.
+        shapes = [filter_shape(item) for item in value]
+        return [shapes[0]] if shapes and all(s == shapes[0] for s in shapes) else shapes
+    return "?"
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Any:
+    if command_name == "aggregate":
+        return [
+            {stage: filter_shape(spec) if stage == "$match" else "..."}
+            for entry in command.get("pipeline", [])
+            for stage, spec in entry.items()
+        ]
+    path = FILTER_PATHS.get(command_name)
+    if not path:
+        return None
+    value: Any = command
+    for key in path:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return filter_shape(value)
+
+
+def command_collection(command_name: str, command: Dict[str, Any]) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    Times every MongoDB command for the `mongodb_command_duration_seconds`
+    histogram, logs slow ones with their filter shape and optionally
+    explains a sample of them. PyMongo calls it from its own threads, so
+    explain runs are handed to the event loop.
+    """
+
+    def __init__(
+        self,
+        slow_ms: float = DB_SLOW_QUERY_MS,
+        explain_sample_rate: float = DB_EXPLAIN_SAMPLE_RATE,
+        explain_interval: float = DB_EXPLAIN_INTERVAL,
+    ):
+        self.slow_ms = slow_ms
+        self.explain_sample_rate = explain_sample_rate
+        # Shapes explained recently. Driver threads share it, hence the lock.
+        self._explained: TTLCache[bool] = TTLCache(1000, explain_interval)
+        self._explained_lock = threading.Lock()
+        self._started: Dict[Tuple[Any, int], Tuple[str, str, Dict[str, Any]]] = {}
+        # Set by `bind` once the client and event loop exist.
+        self.client = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, client, loop: asyncio.AbstractEventLoop) -> None:
+        self.client = client
+        self.loop = loop
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = command_collection(event.command_name, event.command)
+        self._started[(event.connection_id, event.request_id)] = (
+            collection,
+            event.database_name,
+            # Kept only for commands that may be logged or explained.
+            event.command if event.command_name in EXPLAINABLE else {},
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event)
+
+    def _finished(self, event) -> None:
+        collection, database, command = self._started.pop(
+            (event.connection_id, event.request_id), ("", "", {})
+        )
+        duration_ms = event.duration_micros / 1000
+        MONGODB_COMMAND_DURATION.labels(collection, event.command_name).observe(
+            duration_ms / 1000
+        )
+        if duration_ms < self.slow_ms or not command:
+            return
+        shape = command_shape(event.command_name, command)
+        logger.bind(
+            collection=collection,
+            command=event.command_name,
+            duration_ms=round(duration_ms, 1),
+            filter_shape=shape,
+        ).warning(f"Slow MongoDB {event.command_name} on {collection}")
+        self._maybe_explain(database, collection, event.command_name, command, shape)
+
+    def _maybe_explain(
+        self,
+        database: str,
+        collection: str,
+        command_name: str,
+        command: Dict[str, Any],
+        shape: Any,
+    ) -> None:
+        if (
+            not self.explain_sample_rate
+            or self.client is None
+            or self.loop is None
+            or random.random() >= self.explain_sample_rate
+        ):
+            return
+        key = (collection, command_name, repr(shape))
+        with self._explained_lock:
+            if self._explained.get(key):
+                return
+            self._explained.put(key, True)
+        # Drop session and cluster fields the driver adds to each command.
+        explained = {
+            name: value
+            for name, value in command.items()
+            if not name.startswith("$") and name not in ("lsid", "txnNumber")
+        }
+        self.loop.call_soon_threadsafe(
+            lambda: self.loop.create_task(
+                self._explain(database, collection, command_name, explained, shape)
+            )
+        )
+
+    async def _explain(
+        self,
+        database: str,
+        collection: str,
+        command_name: str,
+        command: Dict[str, Any],
+        shape: Any,
+    ) -> None:
+        from app.services.indexes import plan_stages
+
+        try:
+            explanation = await self.client[database].command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+        except Exception as e:
+            logger.warning(f"Could not explain slow {command_name} on {collection}: {e}")
+            return
+        plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        logger.bind(
+            collection=collection,
+            command=command_name,
+            filter_shape=shape,
+            plan_stages=[stage for stage in plan_stages(plan) if stage],
+            winning_plan=plan,
+        ).warning(f"Plan of slow MongoDB {command_name} on {collection}")
+
+
+command_listener = CommandMetricsListener()
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set
+from uuid import UUID
+
+from loguru import logger
+from pydantic import BaseModel
+
+from app.models.execution import ExecutionJob, ExecutionStep
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class JobEvent(BaseModel):
+    seq: int
+    type: str  # "snapshot", "status", "step" or "output"
+    data: Dict[str, Any]
+
+    def to_sse(self) -> str:
+        return f"id: {self.seq}\nevent: {self.type}\ndata: {json.dumps(self.data, default=str)}\n\n"
+
+
+def step_state(step: ExecutionStep) -> Dict[str, Any]:
+    """The step fields sent in `step` events; output travels as `output` events."""
+    return {
+        "step_id": str(step.id),
+        "block_id": str(step.block_id),
+        "status": step.status,
+        "exit_code": step.exit_code,
+        "output_length": len(step.output),
+    }
+
+
+class JobChannel:
+    """
+    Fan-out point for a single job. Keeps a bounded replay buffer so that
+    reconnecting clients can resume from their last sequence number.
+    """
+
+    def __init__(self, job_id: UUID, buffer_size: int, queue_size: int):
+        self.job_id = job_id
+        self.seq = 0
+        self.buffer: Deque[JobEvent] = deque(maxlen=buffer_size)
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.upstream: Optional[asyncio.Task] = None
+        # Set once the worker in this process publishes for the job, which
+        # makes polling Mongo for it unnecessary.
+        self.local = False
+        self.finished = False
+
+    def publish(self, type: str, data: Dict[str, Any]) -> JobEvent:
+        self.seq += 1
+        event = JobEvent(seq=self.seq, type=type, data=data)
+        self.buffer.append(event)
+        if type == "status" and data.get("status") in TERMINAL_STATUSES:
+            self.finished = True
+        for queue in list(self.subscribers):
+            if queue.qsize() >= self.queue_size:
+                # A slow client is cut off; it reconnects with Last-Event-ID.
+                self.subscribers.discard(queue)
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(event)
+        return event
+
+    def replay_after(self, seq: int) -> Optional[List[JobEvent]]:
+        """Buffered events after `seq`, or None if the buffer no longer covers it."""
+        if self.seq == 0 or seq > self.seq:
+            return None
+        if self.buffer and self.buffer[0].seq > seq + 1:
+            return None
+        return [event for event in self.buffer if event.seq > seq]
+
+
+class ExecutionEventHub:
+    """
+    In-process hub for live execution events. The worker publishes into it;
+    every viewer of a job shares one channel, and for jobs run by another
+    process a single Mongo poller per job feeds the channel.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int | None = None,
+        queue_size: int = 1000,
+        poll_interval: float | None = None,
+    ):
+        self.buffer_size = buffer_size or int(os.getenv("EXECUTION_EVENTS_BUFFER", "1000"))
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval or float(
+            os.getenv("EXECUTION_EVENTS_POLL_INTERVAL", "1.0")
+        )
+        self.channels: Dict[UUID, JobChannel] = {}
+
+    def _channel(self, job_id: UUID) -> JobChannel:
+        channel = self.channels.get(job_id)
+        if channel is None:
+            channel = JobChannel(job_id, self.buffer_size, self.queue_size)
+            self.channels[job_id] = channel
+        return channel
+
+    def _release(self, channel: JobChannel) -> None:
+        if channel.subscribers:
+            return
+        if channel.upstream and not channel.upstream.done():
+            channel.upstream.cancel()
+        if channel.finished or not channel.local:
+            self.channels.pop(channel.job_id, None)
+
+    # --- Publishing (worker side) ---
+
+    def publish_status(self, job: ExecutionJob) -> None:
+        channel = self._channel(job.id)
+        channel.local = True
+        channel.publish("status", {"status": job.status})
+        if channel.finished and not channel.subscribers:
+            self.channels.pop(job.id, None)
+
+    def publish_step(self, step: ExecutionStep, previous_output: str = "") -> None:
+        channel = self._channel(step.job_id)
+        channel.local = True
+        self._publish_step(channel, step, previous_output)
+
+    def _publish_step(
+        self, channel: JobChannel, step: ExecutionStep, previous_output: str
+    ) -> None:
+        channel.publish("step", step_state(step))
+        if step.output == previous_output:
+            return
+        if step.output.startswith(previous_output):
+            offset = len(previous_output)
+        else:
+            offset = 0
+        channel.publish(
+            "output",
+            {"step_id": str(step.id), "offset": offset, "chunk": step.output[offset:]},
+        )
+
+    # --- Subscribing (viewer side) ---
+
+    async def snapshot(self, job_id: UUID) -> Optional[Dict[str, Any]]:
+        job = await ExecutionJob.get(job_id)
+        if not job:
+            return None
+        steps = await ExecutionStep.find(ExecutionStep.job_id == job_id).to_list()
+        return {
+            "status": job.status,
+            "steps": [{**step_state(step), "output": step.output} for step in steps],
+        }
+
+    async def subscribe(
+        self, job_id: UUID, last_seq: Optional[int] = None
+    ) -> AsyncIterator[JobEvent]:
+        """
+        Yield events for a job, starting after `last_seq` when the replay
+        buffer still covers it and from a Mongo snapshot otherwise. The
+        iterator ends once the job reaches a terminal status.
+        """
+        channel = self._channel(job_id)
+        queue: asyncio.Queue = asyncio.Queue()
+        channel.subscribers.add(queue)
+        snapshot = None
+        try:
+            replay = channel.replay_after(last_seq) if last_seq is not None else None
+            if replay is None:
+                snapshot = await self.snapshot(job_id)
+                if snapshot is None:
+                    return
+                yield JobEvent(seq=channel.seq, type="snapshot", data=snapshot)
+                if snapshot["status"] in TERMINAL_STATUSES:
+                    return
+            else:
+                for event in replay:
+                    yield event
+                    if event.type == "status" and event.data["status"] in TERMINAL_STATUSES:
+                        return
+
+            if not channel.local and (channel.upstream is None or channel.upstream.done()):
+                channel.upstream = asyncio.create_task(
+                    self._poll_upstream(channel, snapshot)
+                )
+
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+                if event.type == "status" and event.data["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            channel.subscribers.discard(queue)
+            self._release(channel)
+
+    async def _poll_upstream(
+        self, channel: JobChannel, snapshot: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Feed a channel from Mongo for jobs that are not run by this process.
+        One poller serves every subscriber of the job.
+        """
+        cursor: Optional[datetime] = None
+        states: Dict[str, Dict[str, Any]] = {}
+        outputs: Dict[str, str] = {}
+        status: Optional[str] = None
+        if snapshot:
+            # Start from what the first subscriber has already been sent.
+            status = snapshot["status"]
+            for step in snapshot["steps"]:
+                state = dict(step)
+                outputs[step["step_id"]] = state.pop("output")
+                states[step["step_id"]] = state
+        try:
+            while channel.subscribers and not channel.local:
+                job = await ExecutionJob.get(channel.job_id)
+                if job is None:
+                    return
+                query = ExecutionStep.find(ExecutionStep.job_id == channel.job_id)
+                if cursor is not None:
+                    query = query.find(ExecutionStep.updated_at >= cursor)
+                for step in await query.to_list():
+                    if channel.local:
+                        return
+                    step_id = str(step.id)
+                    state = step_state(step)
+                    if states.get(step_id) != state:
+                        self._publish_step(channel, step, outputs.get(step_id, ""))
+                        states[step_id] = state
+                        outputs[step_id] = step.output
+                    cursor = max(cursor or step.updated_at, step.updated_at)
+                if job.status != status:
+                    status = job.status
+                    channel.publish("status", {"status": status})
+                if job.status in TERMINAL_STATUSES:
+                    return
+                await asyncio.sleep(self.poll_interval)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception(f"Event poller for job {channel.job_id} failed")
+
+
+event_hub = ExecutionEventHub()
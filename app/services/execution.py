@@ -1,11 +1,24 @@
 import asyncio
+import os
+from contextlib import AsyncExitStack
+from datetime import datetime, UTC
 import docker
 import httpx
 import asyncssh
 from loguru import logger
-from typing import Dict, Any
+from typing import Any, Awaitable, Callable, Dict
 from pydantic import BaseModel
 
+from app.metrics import (
+    EXECUTION_BLOCK_DURATION,
+    EXECUTION_JOB_DURATION,
+    EXECUTION_JOBS_IN_FLIGHT,
+    EXECUTION_QUEUE_DEPTH,
+    EXECUTION_QUEUE_WAIT,
+    EXECUTION_RESOURCES_IN_USE,
+)
+from beanie.operators import NotIn
+
 from app.models import Runbook
 from app.models.block import Block
 from app.models.credential import Credential
@@ -13,6 +26,16 @@ from app.models.environment import ExecutionEnvironment
 from app.models.execution import ExecutionJob, ExecutionStep
 from app.models.runbook import RunbookVersion
 from app.security import decrypt_secret
+from app.services import analytics
+from app.services.events import TERMINAL_STATUSES, event_hub
+from app.services.images import ensure_image, start_image_maintenance
+from app.services.timing import elapsed_ms
+from app.services.tracing import db_span, tracer
+from app.services.versions import load_blocks
+
+
+# Seconds between samples of the queue depth gauges; 0 disables sampling.
+EXECUTION_METRICS_INTERVAL = float(os.getenv("EXECUTION_METRICS_INTERVAL", "15"))
 
 
 class BlockExecutionResult(BaseModel):
@@ -28,7 +51,8 @@ async def execute_api_block(block: Block) -> BlockExecutionResult:
     config = block.config
     method = config.get("method", "GET")
     url = config.get("url")
-    headers = config.get("headers", {})
+    # A fresh dict, so the decrypted token never lands in the block's config.
+    headers = dict(config.get("headers") or {})
     body = config.get("body")
     credential_id = config.get("credential_id")
 
@@ -38,19 +62,29 @@ async def execute_api_block(block: Block) -> BlockExecutionResult:
         )
 
     if credential_id:
-        cred = await Credential.get(credential_id)
-        if cred and cred.type == "api":
-            token = decrypt_secret(cred.encrypted_secret)
-            header_name = config.get("auth_header_name") or "Authorization"
-            headers[header_name] = token
+        with tracer.span("credential.decrypt", {"credential.id": str(credential_id)}):
+            cred = await Credential.get(credential_id)
+            if cred and cred.type == "api":
+                token = decrypt_secret(cred.encrypted_secret)
+                header_name = config.get("auth_header_name") or "Authorization"
+                headers[header_name] = token
 
     try:
         async with httpx.AsyncClient() as client:
             for attempt in range(3):  # Retry up to 3 times
                 try:
-                    response = await client.request(
-                        method, url, headers=headers, json=body, timeout=10.0
-                    )
+                    with (
+                        EXECUTION_RESOURCES_IN_USE.labels("http").track_inprogress(),
+                        tracer.span(
+                            "http.request",
+                            {"http.request.method": method, "http.attempt": attempt + 1},
+                            kind="client",
+                        ) as span,
+                    ):
+                        response = await client.request(
+                            method, url, headers=headers, json=body, timeout=10.0
+                        )
+                        span.set_attribute("http.response.status_code", response.status_code)
                     output = (
                         f"Status: {response.status_code}\n"
                         f"Headers: {response.headers}\n"
@@ -92,16 +126,24 @@ async def execute_api_block(block: Block) -> BlockExecutionResult:
 
 
 async def execute_command_in_container(
-    command: str, image_tag: str
+    command: str, image_tag: str, environment: ExecutionEnvironment | None = None
 ) -> BlockExecutionResult:
     """
     Executes a shell command inside a new Docker container and returns the result.
+    A missing image is rebuilt from the environment's Dockerfile first.
     """
     try:
         client = docker.from_env()
-        container = client.containers.run(
-            image_tag, command, detach=True, network_mode="host"
-        )
+        try:
+            container = client.containers.run(
+                image_tag, command, detach=True, network_mode="host"
+            )
+        except docker.errors.ImageNotFound:
+            if not environment or not await ensure_image(environment):
+                raise
+            container = client.containers.run(
+                image_tag, command, detach=True, network_mode="host"
+            )
         result = container.wait()
         stdout = container.logs(stdout=True, stderr=False).decode("utf-8")
         stderr = container.logs(stdout=False, stderr=True).decode("utf-8")
@@ -138,11 +180,27 @@ async def execute_command_block(
             exit_code=-1,
         )
 
+    if environment and not environment.image_tag:
+        # Never fall back to the host for an environment still being built.
+        return BlockExecutionResult(
+            status="error",
+            output=(
+                f"Execution environment '{environment.name}' has no image yet "
+                f"(build {environment.status})."
+            ),
+            exit_code=-1,
+        )
     if environment and environment.image_tag:
         logger.info(
             f"Executing command for block {block.id} in container {environment.image_tag}"
         )
-        return await execute_command_in_container(command, environment.image_tag)
+        with (
+            EXECUTION_RESOURCES_IN_USE.labels("container").track_inprogress(),
+            tracer.span("container.run", {"container.image.name": environment.image_tag}),
+        ):
+            return await execute_command_in_container(
+                command, environment.image_tag, environment
+            )
 
     logger.info(f"Executing command for block {block.id} locally")
     try:
@@ -151,7 +209,11 @@ async def execute_command_block(
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
-        stdout, stderr = await proc.communicate()
+        with (
+            EXECUTION_RESOURCES_IN_USE.labels("subprocess").track_inprogress(),
+            tracer.span("subprocess.run"),
+        ):
+            stdout, stderr = await proc.communicate()
 
         output = ""
         if stdout:
@@ -207,23 +269,34 @@ async def execute_ssh_block(block: Block) -> BlockExecutionResult:
 
     client_keys = None
     if credential_id:
-        cred = await Credential.get(credential_id)
-        if cred and cred.type == "ssh":
-            try:
-                private_key = decrypt_secret(cred.encrypted_secret)
-                client_keys = [asyncssh.import_private_key(private_key)]
-            except Exception as e:
-                return BlockExecutionResult(
-                    status="error",
-                    output=f"Failed to load SSH key: {str(e)}",
-                    exit_code=-1,
-                )
+        with tracer.span("credential.decrypt", {"credential.id": str(credential_id)}) as span:
+            cred = await Credential.get(credential_id)
+            if cred and cred.type == "ssh":
+                try:
+                    private_key = decrypt_secret(cred.encrypted_secret)
+                    client_keys = [asyncssh.import_private_key(private_key)]
+                except Exception as e:
+                    span.set_error(str(e))
+                    return BlockExecutionResult(
+                        status="error",
+                        output=f"Failed to load SSH key: {str(e)}",
+                        exit_code=-1,
+                    )
 
     try:
-        async with asyncssh.connect(
-            host, username=username, client_keys=client_keys, known_hosts=None
-        ) as conn:
-            result = await conn.run(command)
+        async with AsyncExitStack() as stack:
+            # Connecting is traced apart from the command; it is often the slow part.
+            with tracer.span("ssh.connect", {"server.address": host}, kind="client"):
+                conn = await stack.enter_async_context(
+                    asyncssh.connect(
+                        host, username=username, client_keys=client_keys, known_hosts=None
+                    )
+                )
+            with (
+                EXECUTION_RESOURCES_IN_USE.labels("ssh").track_inprogress(),
+                tracer.span("ssh.run", {"server.address": host}, kind="client"),
+            ):
+                result = await conn.run(command)
 
             output = ""
             if result.stdout:
@@ -243,22 +316,120 @@ async def execute_ssh_block(block: Block) -> BlockExecutionResult:
         return BlockExecutionResult(status="error", output=str(e), exit_code=-1)
 
 
+async def start_step(
+    job: ExecutionJob, block: Block, output: str = "", exit_code: int = -1
+) -> ExecutionStep:
+    """
+    Records a running step for a block and announces it to live viewers.
+    """
+    step = ExecutionStep(
+        job_id=job.id,
+        block_id=block.id,
+        status="running",
+        output=output,
+        exit_code=exit_code,
+        started_at=datetime.now(UTC),
+    )
+    with db_span("insert", "execution_steps"):
+        await step.insert()
+    event_hub.publish_step(step)
+    return step
+
+
+async def finish_step(
+    step: ExecutionStep, status: str, output: str, exit_code: int
+) -> None:
+    """
+    Stores the final state of a step and publishes the appended output.
+    """
+    previous_output = step.output
+    step.status = status
+    step.output = output
+    step.exit_code = exit_code
+    step.finished_at = datetime.now(UTC)
+    step.duration_ms = elapsed_ms(step.started_at or step.timestamp, step.finished_at)
+    with db_span("update", "execution_steps"):
+        await step.save()
+    event_hub.publish_step(step, previous_output)
+
+
+async def set_job_status(job: ExecutionJob, status: str) -> bool:
+    """
+    Persists a job status change and publishes it to live viewers. Records
+    when the job was claimed and finished, and adds finished jobs to the
+    analytics rollups.
+
+    A finished job keeps its status: the change only applies while the
+    stored job is unfinished, so a worker completing a job that was stopped
+    meanwhile changes nothing, and the job is counted once. Returns whether
+    the change applied; if not, `job` is refreshed from the database.
+    """
+    now = datetime.now(UTC)
+    fields: Dict[str, Any] = {"status": status}
+    if status == "running":
+        fields["worker_active"] = True
+        if job.started_at is None:
+            fields["started_at"] = now
+            fields["queue_wait_ms"] = elapsed_ms(job.start_time, now)
+    finishing = status in TERMINAL_STATUSES
+    if finishing:
+        fields["finished_at"] = fields["end_time"] = now
+        fields["duration_ms"] = elapsed_ms(job.started_at or job.start_time, now)
+    with db_span("update", "execution_jobs"):
+        result = await ExecutionJob.find_one(
+            ExecutionJob.id == job.id, NotIn(ExecutionJob.status, TERMINAL_STATUSES)
+        ).update({"$set": fields})
+    if not result.matched_count:
+        await job.sync()
+        return False
+
+    for name, value in fields.items():
+        setattr(job, name, value)
+    if "queue_wait_ms" in fields:
+        EXECUTION_QUEUE_WAIT.observe(job.queue_wait_ms / 1000)
+    if finishing:
+        EXECUTION_JOB_DURATION.labels(status).observe(job.duration_ms / 1000)
+    event_hub.publish_status(job)
+    if finishing:
+        try:
+            with tracer.span("analytics.record_job"):
+                await analytics.record_job(job)
+        except Exception:
+            logger.exception(f"Failed to record job {job.id} in analytics rollups")
+    return True
+
+
+async def release_job(job: ExecutionJob) -> None:
+    """Records that the worker is done with a job; it will not change again."""
+    with db_span("update", "execution_jobs"):
+        await ExecutionJob.find_one(ExecutionJob.id == job.id).update(
+            {"$set": {"worker_active": False}}
+        )
+    job.worker_active = False
+
+
+async def traced_executor(
+    executor: Callable[..., Awaitable[BlockExecutionResult]], *args: Any
+) -> BlockExecutionResult:
+    """Runs a block executor in a span of its own, recording the outcome."""
+    with tracer.span(executor.__name__) as span:
+        result = await executor(*args)
+        span.set_attribute("exit_code", result.exit_code)
+        if result.status != "success":
+            span.set_error(f"{result.status}, exit code {result.exit_code}")
+    return result
+
+
 async def process_ssh_block(job: ExecutionJob, block: Block) -> bool:
     """
     Executes an SSH block, captures the response, and records the step.
     Returns True on success, False otherwise.
     """
-    step = ExecutionStep(
-        job_id=job.id, block_id=block.id, status="running", output="", exit_code=-1
-    )
-    await step.insert()
+    step = await start_step(job, block)
 
-    result = await execute_ssh_block(block)
+    result = await traced_executor(execute_ssh_block, block)
 
-    step.status = result.status
-    step.output = result.output
-    step.exit_code = result.exit_code
-    await step.save()
+    await finish_step(step, result.status, result.output, result.exit_code)
 
     return result.status == "success"
 
@@ -268,17 +439,11 @@ async def process_api_block(job: ExecutionJob, block: Block) -> bool:
     Executes an API call block, captures the response, and records the step.
     Returns True on success (2xx status code), False otherwise.
     """
-    step = ExecutionStep(
-        job_id=job.id, block_id=block.id, status="running", output="", exit_code=-1
-    )
-    await step.insert()
+    step = await start_step(job, block)
 
-    result = await execute_api_block(block)
+    result = await traced_executor(execute_api_block, block)
 
-    step.status = result.status
-    step.output = result.output
-    step.exit_code = result.exit_code
-    await step.save()
+    await finish_step(step, result.status, result.output, result.exit_code)
 
     return result.status == "success"
 
@@ -290,17 +455,11 @@ async def process_command_block(
     Executes a command block, captures its output, and records the step.
     Returns True on success, False on failure.
     """
-    step = ExecutionStep(
-        job_id=job.id, block_id=block.id, status="running", output="", exit_code=-1
-    )
-    await step.insert()
+    step = await start_step(job, block)
 
-    result = await execute_command_block(block, environment)
+    result = await traced_executor(execute_command_block, block, environment)
 
-    step.status = result.status
-    step.output = result.output
-    step.exit_code = result.exit_code
-    await step.save()
+    await finish_step(step, result.status, result.output, result.exit_code)
 
     return result.status == "success"
 
@@ -310,19 +469,13 @@ async def process_timer_block(job: ExecutionJob, block: Block) -> bool:
     Pauses execution for a specified duration.
     """
     duration = block.config.get("duration", 0)
-    step = ExecutionStep(
-        job_id=job.id,
-        block_id=block.id,
-        status="running",
-        output=f"Pausing for {duration} seconds.",
-        exit_code=0,
+    step = await start_step(
+        job, block, output=f"Pausing for {duration} seconds.", exit_code=0
     )
-    await step.insert()
 
     await asyncio.sleep(duration)
 
-    step.status = "success"
-    await step.save()
+    await finish_step(step, "success", step.output, step.exit_code)
     logger.info(f"Timer block {block.id} completed after {duration} seconds.")
     return True
 
@@ -388,17 +541,17 @@ async def process_condition_block(
     """
     Executes a conditional block and its nested blocks if condition is met.
     """
-    step = ExecutionStep(
-        job_id=job.id, block_id=block.id, status="running", output="Evaluating condition...", exit_code=-1
-    )
-    await step.insert()
+    step = await start_step(job, block, output="Evaluating condition...")
 
-    is_met, description = await evaluate_condition(block, environment)
+    with tracer.span("evaluate_condition") as span:
+        is_met, description = await evaluate_condition(block, environment)
+        span.set_attribute("condition.met", is_met)
 
-    step.output = f"Condition evaluated: {description}. Result: {'TRUE' if is_met else 'FALSE'}"
-    step.status = "success"
-    step.exit_code = 0
-    await step.save()
+    # Step output is append-only so incremental status polls can send deltas.
+    output = step.output + f"\nCondition evaluated: {description}. Result: {'TRUE' if is_met else 'FALSE'}"
+    await finish_step(step, "success", output, 0)
+    # Nested blocks are measured on their own.
+    observe_block("condition", step.duration_ms, True)
 
     if is_met:
         nested_blocks_data = block.config.get("nested_blocks", [])
@@ -439,37 +592,75 @@ async def process_block(job: ExecutionJob, block: Block, environment: ExecutionE
     """
     Dispatch block execution based on type.
     """
+    with tracer.span(
+        "process_block", {"block.id": str(block.id), "block.type": block.type}
+    ) as span:
+        success = await _process_block(job, block, environment)
+        span.set_attribute("block.success", success)
+    return success
+
+
+async def _process_block(
+    job: ExecutionJob, block: Block, environment: ExecutionEnvironment | None
+) -> bool:
+    if block.type == "condition":
+        return await process_condition_block(job, block, environment)
+    started = datetime.now(UTC)
     if block.type == "command":
-        return await process_command_block(job, block, environment)
+        success = await process_command_block(job, block, environment)
     elif block.type == "instruction":
         logger.info(f"Executing instruction block {block.id}: No action needed.")
-        return True
+        success = True
     elif block.type == "api":
-        return await process_api_block(job, block)
-    elif block.type == "condition":
-        return await process_condition_block(job, block, environment)
+        success = await process_api_block(job, block)
     elif block.type == "timer":
-        return await process_timer_block(job, block)
+        success = await process_timer_block(job, block)
     elif block.type == "ssh":
-        return await process_ssh_block(job, block)
+        success = await process_ssh_block(job, block)
     else:
         logger.warning(f"Block type '{block.type}' not yet supported.")
         return True
+    observe_block(block.type, elapsed_ms(started, datetime.now(UTC)), success)
+    return success
+
+
+def observe_block(block_type: str, duration_ms: float | None, success: bool) -> None:
+    EXECUTION_BLOCK_DURATION.labels(block_type, "success" if success else "error").observe(
+        (duration_ms or 0) / 1000
+    )
 
 
 async def run_job(job: ExecutionJob):
     """
     Runs a single execution job by processing its blocks sequentially.
+    The run is traced under the job's id, from the time it was enqueued.
     """
+    with tracer.trace(
+        "run_job",
+        job.id.hex,
+        start=job.start_time,
+        attributes={"job.id": str(job.id), "runbook.id": str(job.runbook_id)},
+    ) as span:
+        try:
+            await _run_job(job)
+        finally:
+            await release_job(job)
+        span.set_attribute("job.status", job.status)
+        if job.status == "failed":
+            span.set_error("Job failed")
+
+
+async def _run_job(job: ExecutionJob):
     logger.info(f"Starting job {job.id}")
-    job.status = "running"
-    await job.save()
+    if not await set_job_status(job, "running"):
+        logger.info(f"Job {job.id} was stopped before it started.")
+        return
+    tracer.record("queued", job.start_time, job.started_at or datetime.now(UTC))
 
     version = await RunbookVersion.get(job.version_id)
     if not version:
         logger.error(f"RunbookVersion {job.version_id} not found for job {job.id}")
-        job.status = "failed"
-        await job.save()
+        await set_job_status(job, "failed")
         return
 
     runbook = await Runbook.get(job.runbook_id)
@@ -480,11 +671,13 @@ async def run_job(job: ExecutionJob):
     )
 
     # Sort blocks by their order
-    sorted_blocks = sorted(version.blocks, key=lambda b: b.order)
+    with tracer.span("load_blocks"):
+        sorted_blocks = sorted(await load_blocks(version), key=lambda b: b.order)
 
     for block in sorted_blocks:
         # Check if the job has been externally stopped
-        current_job_status = await ExecutionJob.get(job.id)
+        with db_span("find", "execution_jobs"):
+            current_job_status = await ExecutionJob.get(job.id)
         if current_job_status.status != "running":
             logger.info(f"Job {job.id} was stopped externally. Halting execution.")
             return
@@ -493,29 +686,56 @@ async def run_job(job: ExecutionJob):
 
         if not success:
             logger.error(f"Job {job.id} failed on block {block.id}")
-            job.status = "failed"
-            await job.save()
+            await set_job_status(job, "failed")
             return
 
-    job.status = "completed"
-    await job.save()
-    logger.info(f"Job {job.id} completed successfully.")
+    if await set_job_status(job, "completed"):
+        logger.info(f"Job {job.id} completed successfully.")
+    else:
+        logger.info(f"Job {job.id} was stopped while its last block ran.")
 
 
 async def execution_worker():
     """
     The main worker loop that polls for pending jobs and executes them.
+    Environment images are warmed up and garbage-collected alongside.
     """
     logger.info("Execution worker started.")
+    start_image_maintenance()
     while True:
-        pending_job = await ExecutionJob.find_one(ExecutionJob.status == "pending")
+        pending_job = (
+            await ExecutionJob.find(ExecutionJob.status == "pending")
+            .sort("+start_time")
+            .first_or_none()
+        )
         if pending_job:
             try:
-                await run_job(pending_job)
+                with EXECUTION_JOBS_IN_FLIGHT.track_inprogress():
+                    await run_job(pending_job)
             except Exception:
                 logger.exception(f"Unhandled error running job {pending_job.id}")
-                pending_job.status = "failed"
-                await pending_job.save()
+                await set_job_status(pending_job, "failed")
         else:
             # Sleep when no jobs are found
             await asyncio.sleep(2)
+
+
+async def sample_queue_depth() -> None:
+    """
+    Sets the queue depth gauges from index-backed counts of the unfinished
+    statuses. Finished jobs are counted by the job duration histogram.
+    """
+    for status in ("pending", "running"):
+        EXECUTION_QUEUE_DEPTH.labels(status).set(
+            await ExecutionJob.find(ExecutionJob.status == status).count()
+        )
+
+
+async def queue_depth_sampler(interval: float) -> None:
+    """Background loop refreshing the queue depth gauges, so scrapes never query MongoDB."""
+    while True:
+        try:
+            await sample_queue_depth()
+        except Exception:
+            logger.exception("Sampling the execution queue depth failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,85 @@
+import hashlib
+import os
+from typing import Hashable, NamedTuple, Optional
+
+from fastapi import Request, Response, status
+from pydantic import BaseModel
+
+from app.services.cache import LRUCache
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# For resources that only change in rare cases, such as a version history
+# replaced by an overwriting import: clients revalidate, and get a 304.
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+class CachedBody(NamedTuple):
+    etag: str
+    body: bytes
+    cache_control: str = IMMUTABLE_CACHE_CONTROL
+
+
+# Serialized responses of resources that do not change once written:
+# runbook versions, version diffs and finished execution jobs. Whatever
+# replaces one of them must invalidate its key.
+response_cache: LRUCache[CachedBody] = LRUCache(
+    int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+)
+
+
+def make_etag(body: bytes) -> str:
+    """Returns a strong ETag for a response body."""
+    return '"%s"' % hashlib.sha256(body).hexdigest()
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match header lists the given ETag."""
+    if_none_match = request.headers.get("if-none-match", "")
+    return if_none_match.strip() == "*" or etag in [
+        tag.strip() for tag in if_none_match.split(",")
+    ]
+
+
+def _respond(request: Request, cached: CachedBody) -> Response:
+    headers = {"ETag": cached.etag, "Cache-Control": cached.cache_control}
+    if etag_matches(request, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+def cached_response(request: Request, key: Hashable) -> Optional[Response]:
+    """
+    Answers a request for an immutable resource from the response cache,
+    including 304 for matching conditional requests, without any database
+    access. Returns None on a cache miss.
+    """
+    cached = response_cache.get(key)
+    return _respond(request, cached) if cached else None
+
+
+def immutable_response(
+    request: Request,
+    key: Hashable,
+    payload: BaseModel,
+    cache_control: str = IMMUTABLE_CACHE_CONTROL,
+) -> Response:
+    """
+    Serializes an immutable resource once, caches it under `key` and
+    answers the request with a strong ETag and, by default, an immutable
+    Cache-Control.
+    """
+    body = payload.model_dump_json().encode("utf-8")
+    cached = CachedBody(etag=make_etag(body), body=body, cache_control=cache_control)
+    response_cache.put(key, cached)
+    return _respond(request, cached)
+
+
+def invalidate(*key_prefix: Hashable) -> None:
+    """
+    Drops cached responses whose key starts with the given parts, for
+    example when a runbook or the execution history is deleted.
+    """
+    size = len(key_prefix)
+    response_cache.pop_matching(
+        lambda key: isinstance(key, tuple) and key[:size] == key_prefix
+    )
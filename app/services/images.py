@@ -0,0 +1,193 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, UTC
+from typing import Dict, List, Set, Tuple
+
+import docker
+from beanie.operators import In
+from loguru import logger
+
+from app.models.environment import (
+    EnvironmentBuild,
+    EnvironmentImage,
+    ExecutionEnvironment,
+)
+from app.services import builds
+
+# Images checked or built at once while warming up.
+IMAGE_WARMUP_CONCURRENCY = int(os.getenv("IMAGE_WARMUP_CONCURRENCY", "4"))
+IMAGE_WARMUP_ON_START = os.getenv("IMAGE_WARMUP_ON_START", "true").lower() == "true"
+# Seconds between garbage collections of unused images; 0 disables them.
+IMAGE_GC_INTERVAL = float(os.getenv("IMAGE_GC_INTERVAL", "3600"))
+# Younger images are never collected, so a build that just finished is not
+# mistaken for an orphan before its environment records it.
+IMAGE_GC_MIN_AGE = float(os.getenv("IMAGE_GC_MIN_AGE", "600"))
+
+# Ensures in progress by image tag, so concurrent callers share one build.
+_ensuring: Dict[str, asyncio.Task] = {}
+
+
+def _image_present(image_tag: str) -> bool:
+    client = docker.from_env()
+    try:
+        client.images.get(image_tag)
+        return True
+    except docker.errors.ImageNotFound:
+        return False
+    finally:
+        client.close()
+
+
+def _local_images() -> List[Tuple[List[str], datetime]]:
+    """Tags and creation time of every local `runbook-exec-env` image."""
+    client = docker.from_env()
+    try:
+        images = client.images.list(name=builds.IMAGE_REPOSITORY)
+    finally:
+        client.close()
+    return [
+        (
+            image.tags,
+            # e.g. "2024-05-01T12:00:00.123456789Z"; seconds are enough.
+            datetime.strptime(image.attrs["Created"][:19], "%Y-%m-%dT%H:%M:%S").replace(
+                tzinfo=UTC
+            ),
+        )
+        for image in images
+    ]
+
+
+def _remove_tag(image_tag: str) -> None:
+    client = docker.from_env()
+    try:
+        # Not forced: an image a container still runs from is kept.
+        client.images.remove(image=image_tag)
+    finally:
+        client.close()
+
+
+async def _ensure(environment: ExecutionEnvironment) -> bool:
+    image_tag = environment.image_tag
+    if await asyncio.to_thread(_image_present, image_tag):
+        return True
+    logger.info(f"Image {image_tag} is missing; building it for environment {environment.id}")
+    try:
+        await asyncio.to_thread(
+            builds.docker_build, environment.dockerfile, image_tag, logger.debug
+        )
+    except Exception as e:
+        logger.error(f"Could not build image {image_tag}: {e}")
+        return False
+    return True
+
+
+async def ensure_image(environment: ExecutionEnvironment) -> bool:
+    """
+    Makes sure the environment's image exists on this Docker host,
+    rebuilding it from the environment's Dockerfile if it does not.
+    Returns whether the image is available.
+    """
+    if not environment.image_tag:
+        return False
+    task = _ensuring.get(environment.image_tag)
+    if task is None:
+        task = asyncio.create_task(_ensure(environment))
+        _ensuring[environment.image_tag] = task
+        task.add_done_callback(lambda _: _ensuring.pop(environment.image_tag, None))
+    return await asyncio.shield(task)
+
+
+async def warm_up_images(concurrency: int = IMAGE_WARMUP_CONCURRENCY) -> Dict[str, bool]:
+    """
+    Ensures the image of every ready environment is present locally,
+    `concurrency` at a time. Returns each image tag with its availability.
+    """
+    environments = await ExecutionEnvironment.find(
+        ExecutionEnvironment.image_tag != None  # noqa: E711
+    ).to_list()
+    # Environments sharing an image are checked once.
+    by_tag = {environment.image_tag: environment for environment in environments}
+    slots = asyncio.Semaphore(concurrency)
+
+    async def warm(environment: ExecutionEnvironment) -> bool:
+        async with slots:
+            return await ensure_image(environment)
+
+    results = await asyncio.gather(*(warm(environment) for environment in by_tag.values()))
+    available = dict(zip(by_tag, results))
+    missing = [tag for tag, ok in available.items() if not ok]
+    logger.info(
+        f"Image warm-up checked {len(available)} images"
+        + (f"; unavailable: {missing}" if missing else "")
+    )
+    return available
+
+
+async def referenced_image_tags() -> Set[str]:
+    """Image tags that environments, or builds still running, need."""
+    tags = {
+        environment.image_tag
+        async for environment in ExecutionEnvironment.find(
+            ExecutionEnvironment.image_tag != None  # noqa: E711
+        )
+    }
+    async for build in EnvironmentBuild.find(
+        In(EnvironmentBuild.status, ["queued", "building"])
+    ):
+        tags.add(builds.image_tag_for(build.dockerfile_hash))
+    async for image in EnvironmentImage.find(EnvironmentImage.ref_count > 0):
+        tags.add(image.image_tag)
+    return tags
+
+
+async def collect_orphaned_images(min_age: float = IMAGE_GC_MIN_AGE) -> List[str]:
+    """
+    Removes local `runbook-exec-env` image tags that nothing references
+    and that are older than `min_age` seconds, with the records of images
+    no environment uses. Returns the removed tags.
+    """
+    cutoff = datetime.now(UTC) - timedelta(seconds=min_age)
+    await EnvironmentImage.find(
+        EnvironmentImage.ref_count <= 0, EnvironmentImage.created_at < cutoff
+    ).delete()
+    referenced = await referenced_image_tags()
+    removed = []
+    for tags, created in await asyncio.to_thread(_local_images):
+        if created > cutoff:
+            continue
+        for tag in tags:
+            if tag in referenced:
+                continue
+            try:
+                await asyncio.to_thread(_remove_tag, tag)
+                removed.append(tag)
+            except Exception as e:
+                logger.warning(f"Could not remove unused image {tag}: {e}")
+    if removed:
+        logger.info(f"Removed {len(removed)} unused images: {removed}")
+    return removed
+
+
+async def image_gc_worker(interval: float = IMAGE_GC_INTERVAL) -> None:
+    """Background loop that removes unused environment images periodically."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collect_orphaned_images()
+        except Exception:
+            logger.exception("Image garbage collection failed")
+
+
+def start_image_maintenance() -> None:
+    """Starts the warm-up pass and the image GC loop for this worker."""
+    if IMAGE_WARMUP_ON_START:
+        asyncio.create_task(_warm_up_quietly())
+    if IMAGE_GC_INTERVAL > 0:
+        asyncio.create_task(image_gc_worker())
+
+
+async def _warm_up_quietly() -> None:
+    try:
+        await warm_up_images()
+    except Exception:
+        logger.exception("Image warm-up failed")
@@ -0,0 +1,219 @@
+import asyncio
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from beanie.odm.utils.pydantic import get_model_fields
+from beanie.odm.utils.typing import get_index_attributes
+from loguru import logger
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from app.models import (
+    AuditLog,
+    ExecutionJob,
+    ExecutionStep,
+    Runbook,
+    RunbookSearchEntry,
+    RunbookTagCount,
+    RunbookVersion,
+    User,
+)
+
+IndexKey = Tuple[Tuple[str, Any], ...]
+
+_SAMPLE_ID = UUID(int=0)
+_AUDIT_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+# The queries the API and worker run most often, with the sort they use.
+# Each should be answered by an index rather than a collection scan.
+HOT_QUERIES: List[Tuple[type, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    (User, {"api_key": ""}, None),
+    (User, {"username": ""}, None),
+    (ExecutionJob, {"status": "pending"}, [("start_time", ASCENDING)]),
+    (ExecutionJob, {}, [("start_time", DESCENDING)]),
+    (
+        RunbookVersion,
+        {"runbook_id": _SAMPLE_ID},
+        [("version_number", DESCENDING)],
+    ),
+    (ExecutionStep, {"job_id": _SAMPLE_ID}, None),
+    (Runbook, {"tags": {"$all": ["", ""]}}, None),
+    (RunbookTagCount, {}, [("runbook_count", DESCENDING)]),
+    (RunbookSearchEntry, {"terms": {"$regex": "^a"}}, None),
+    (AuditLog, {}, _AUDIT_SORT),
+    (AuditLog, {"user_id": _SAMPLE_ID}, _AUDIT_SORT),
+    (AuditLog, {"action": ""}, _AUDIT_SORT),
+    (AuditLog, {"target_id": _SAMPLE_ID}, _AUDIT_SORT),
+]
+
+
+# Unique indexes over data that earlier releases did not keep unique, by
+# collection, index name and fields. MongoDB cannot build a unique index
+# over duplicates, and refuses to recreate an index under the same name
+# with new options, which Beanie does not handle either. `User` has no
+# collection name set, so Beanie names its collection after it.
+UNIQUE_UPGRADES: List[Tuple[str, str, List[str]]] = [
+    ("User", "username_1", ["username"]),
+    # Versions used to be numbered without a guard against concurrent saves.
+    (
+        "runbook_versions",
+        "runbook_id_1_version_number_-1",
+        ["runbook_id", "version_number"],
+    ),
+]
+
+
+class DuplicateValuesError(RuntimeError):
+    pass
+
+
+async def upgrade_unique_indexes(database) -> List[str]:
+    """
+    Prepares each index of `UNIQUE_UPGRADES` that is missing or not unique
+    yet for index creation: refuses, naming the duplicated values, while
+    the collection still holds duplicates, and drops a non-unique index so
+    that it is recreated as unique. Returns the dropped index names.
+    """
+    dropped = []
+    for collection_name, index_name, fields in UNIQUE_UPGRADES:
+        collection = database[collection_name]
+        index = (await collection.index_information()).get(index_name)
+        if index and index.get("unique"):
+            continue
+        duplicates = await collection.aggregate(
+            [
+                {"$group": {"_id": {f: f"${f}" for f in fields}, "n": {"$sum": 1}}},
+                {"$match": {"n": {"$gt": 1}}},
+                {"$limit": 10},
+            ]
+        ).to_list(None)
+        if duplicates:
+            values = "; ".join(
+                ", ".join(f"{field}={d['_id'].get(field)}" for field in fields)
+                for d in duplicates
+            )
+            raise DuplicateValuesError(
+                f"Cannot create unique index {collection_name}.{index_name}; remove "
+                f"or renumber the duplicates first: {values}"
+            )
+        if not index:
+            continue
+        await collection.drop_index(index_name)
+        logger.info(f"Dropped index {collection_name}.{index_name} to recreate it as unique")
+        dropped.append(f"{collection_name}.{index_name}")
+    return dropped
+
+
+def declared_indexes(model: type) -> Dict[IndexKey, bool]:
+    """
+    Returns the index key specs a document model declares, mapped to
+    whether the index is unique. Covers both `Indexed()` fields and
+    `Settings.indexes`.
+    """
+    declared: Dict[IndexKey, bool] = {}
+    for name, field in get_model_fields(model).items():
+        attributes = get_index_attributes(field)
+        if attributes:
+            index_type, options = attributes
+            declared[((field.alias or name, index_type),)] = bool(options.get("unique"))
+    for index in model.get_settings().indexes or []:
+        # Beanie wraps declared IndexModels once the model is initialized.
+        index = getattr(index, "index", index)
+        if isinstance(index, IndexModel):
+            document = index.document
+            declared[tuple(document["key"].items())] = bool(document.get("unique"))
+        elif isinstance(index, str):
+            declared[((index, ASCENDING),)] = False
+        else:
+            declared[tuple(index)] = False
+    return declared
+
+
+async def find_missing_indexes(models: Iterable[type]) -> List[str]:
+    """
+    Compares the declared indexes of each model with what exists in the
+    database and describes every index that is absent or lacks its unique
+    constraint.
+    """
+    problems = []
+    for model in models:
+        collection = model.get_motor_collection()
+        existing = {
+            tuple(info["key"]): bool(info.get("unique"))
+            for info in (await collection.index_information()).values()
+        }
+        for key, unique in declared_indexes(model).items():
+            spec = ", ".join(f"{field}:{direction}" for field, direction in key)
+            if key not in existing:
+                problems.append(f"{collection.name}: missing index ({spec})")
+            elif unique and not existing[key]:
+                problems.append(f"{collection.name}: index ({spec}) is not unique")
+    return problems
+
+
+def plan_stages(plan: Dict[str, Any]) -> Iterable[str]:
+    yield plan.get("stage", "")
+    for child in plan.get("inputStages", []) + [plan.get("inputStage") or {}]:
+        if child:
+            yield from plan_stages(child)
+
+
+async def find_collection_scans() -> List[str]:
+    """
+    Runs `explain()` on each hot query and describes those whose winning
+    plan scans the whole collection.
+    """
+    problems = []
+    for model, query, sort in HOT_QUERIES:
+        collection = model.get_motor_collection()
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explanation = await cursor.explain()
+        except Exception as e:
+            problems.append(f"{collection.name}: could not explain {query}: {e}")
+            continue
+        plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        # An empty filter without a sort reads everything by design.
+        if "COLLSCAN" in plan_stages(plan) and (query or sort):
+            problems.append(
+                f"{collection.name}: collection scan for filter {list(query)} sort {sort}"
+            )
+    return problems
+
+
+async def report_indexes(models: Iterable[type], explain: bool = False) -> List[str]:
+    """
+    Logs and returns every index problem found. Query plans are only
+    checked when `explain` is set, as that needs a real MongoDB server.
+    """
+    problems = await find_missing_indexes(models)
+    if explain:
+        problems += await find_collection_scans()
+    for problem in problems:
+        logger.warning(f"Index check: {problem}")
+    if not problems:
+        logger.info("Index check: all declared indexes are present.")
+    return problems
+
+
+async def main() -> int:
+    """
+    Command-line check: `python -m app.services.indexes`. Exits non-zero
+    when an index is missing or a hot query scans a collection.
+    """
+    from app.db import create_init_beanie
+    from app.main import document_models
+
+    # Connect without creating indexes so the check reflects the database
+    # as it is.
+    await create_init_beanie(document_models, create_indexes=False)()
+    problems = await report_indexes(document_models, explain=True)
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,136 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from pydantic import BaseModel
+
+SCHEME = "scrypt"
+
+
+class HashParams(BaseModel):
+    """scrypt cost parameters: CPU/memory cost `n`, block size `r`, parallelism `p`."""
+
+    n: int = 2**14
+    r: int = 8
+    p: int = 1
+
+    @classmethod
+    def from_env(cls) -> "HashParams":
+        return cls(
+            n=int(os.getenv("PASSWORD_SCRYPT_N", str(2**14))),
+            r=int(os.getenv("PASSWORD_SCRYPT_R", "8")),
+            p=int(os.getenv("PASSWORD_SCRYPT_P", "1")),
+        )
+
+
+params = HashParams.from_env()
+
+# hashlib.scrypt releases the GIL, so a small thread pool runs hashes in
+# parallel without blocking the event loop, and bounds the CPU and memory
+# that concurrent logins can take.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    thread_name_prefix="password-hash",
+)
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"),
+        salt=salt,
+        n=n,
+        r=r,
+        p=p,
+        # OpenSSL's default limit is too low for larger costs.
+        maxmem=256 * n * r + 1024 * 1024,
+        dklen=32,
+    )
+
+
+def hash_password_sync(password: str, hash_params: Optional[HashParams] = None) -> str:
+    """Returns `scrypt$n$r$p$salt$hash` for the password."""
+    hash_params = hash_params or params
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, hash_params.n, hash_params.r, hash_params.p)
+    return (
+        f"{SCHEME}${hash_params.n}${hash_params.r}${hash_params.p}"
+        f"${_b64(salt)}${_b64(digest)}"
+    )
+
+
+def _parse(stored: str) -> Optional[Tuple[int, int, int, bytes, bytes]]:
+    """
+    Splits a stored hash into its parameters, salt and digest. Returns None
+    for anything that is not a valid hash, such as a plaintext password
+    that happens to contain `$`.
+    """
+    parts = stored.split("$")
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    try:
+        n, r, p = (int(value) for value in parts[1:4])
+        salt = base64.b64decode(parts[4], validate=True)
+        digest = base64.b64decode(parts[5], validate=True)
+    except ValueError:
+        return None
+    # scrypt needs a power of two above 1 for n.
+    if n < 2 or n & (n - 1) or r < 1 or p < 1:
+        return None
+    return n, r, p, salt, digest
+
+
+def verify_password_sync(password: str, stored: str) -> bool:
+    parsed = _parse(stored)
+    if parsed is None:
+        # Accounts created before passwords were hashed.
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    n, r, p, salt, digest = parsed
+    return hmac.compare_digest(_scrypt(password, salt, n, r, p), digest)
+
+
+def needs_rehash(stored: str, hash_params: Optional[HashParams] = None) -> bool:
+    """True for plaintext passwords and hashes made with other parameters."""
+    hash_params = hash_params or params
+    parsed = _parse(stored)
+    return parsed is None or parsed[:3] != (hash_params.n, hash_params.r, hash_params.p)
+
+
+@lru_cache(maxsize=1)
+def _unknown_user_hash() -> str:
+    return hash_password_sync(secrets.token_urlsafe(16))
+
+
+async def verify_unknown_user(password: str) -> bool:
+    """
+    Checks a password against a hash no password matches, taking as long
+    as a real check, so that login time does not reveal which usernames
+    exist. Always False.
+    """
+    loop = asyncio.get_running_loop()
+    stored = await loop.run_in_executor(_executor, _unknown_user_hash)
+    await verify_password(password, stored)
+    return False
+
+
+async def hash_password(password: str) -> str:
+    """Hashes a password in the hashing pool."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, hash_password_sync, password
+    )
+
+
+async def verify_password(password: str, stored: str) -> bool:
+    """Checks a password against its stored hash in the hashing pool."""
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, verify_password_sync, password, stored
+    )
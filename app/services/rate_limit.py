@@ -0,0 +1,133 @@
+import os
+import time
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+from app.metrics import RATE_LIMIT_DECISIONS
+from app.models.rate_limit import RateLimitState
+from app.services.cache import LRUCache
+
+# Per-user limits by scope, as "requests/seconds". `blocks` covers
+# interactive block runs, `jobs` queued runbook executions.
+DEFAULT_LIMITS: Dict[str, str] = {
+    "blocks": "30/60",
+    "jobs": "10/60",
+}
+
+# Attempts at a compare-and-swap before a contended shared bucket gives up.
+MAX_ATTEMPTS = 5
+
+
+class Limit(BaseModel):
+    requests: int
+    period: float
+
+    @property
+    def interval(self) -> float:
+        """Seconds it takes the bucket to regain one token."""
+        return self.period / self.requests
+
+
+def parse_limit(spec: str) -> Optional[Limit]:
+    """Parses "requests/seconds"; "0" or "off" means unlimited."""
+    if spec.strip().lower() in ("0", "off"):
+        return None
+    requests, _, period = spec.partition("/")
+    return Limit(requests=int(requests), period=float(period or 1))
+
+
+def limit_for(scope: str, role: str) -> Optional[Limit]:
+    """
+    The per-user limit of a scope for a role: `RATE_LIMIT_<SCOPE>_<ROLE>`,
+    else `RATE_LIMIT_<SCOPE>`, else the default.
+    """
+    spec = (
+        os.getenv(f"RATE_LIMIT_{scope.upper()}_{role.upper()}")
+        or os.getenv(f"RATE_LIMIT_{scope.upper()}")
+        or DEFAULT_LIMITS[scope]
+    )
+    return parse_limit(spec)
+
+
+def take_token(tat: float, now: float, limit: Limit) -> Tuple[Optional[float], float]:
+    """
+    One token bucket step, in its GCRA form: the bucket is a single
+    timestamp, `tat`, at which it would be full again. Returns the new
+    timestamp if a token was available, else None and the seconds until
+    one will be.
+    """
+    new_tat = max(tat, now) + limit.interval
+    allowed_at = new_tat - limit.period
+    if now < allowed_at:
+        return None, allowed_at - now
+    return new_tat, 0.0
+
+
+class MemoryBucketStore:
+    """Buckets of this process only. Evicted buckets start full again."""
+
+    def __init__(self, maxsize: int):
+        self._tats: LRUCache[float] = LRUCache(maxsize)
+
+    async def acquire(self, key: str, limit: Limit, now: float) -> float:
+        new_tat, retry_after = take_token(self._tats.get(key, now), now, limit)
+        if new_tat is not None:
+            self._tats.put(key, new_tat)
+        return retry_after
+
+
+class MongoBucketStore:
+    """
+    Buckets shared by every process through the `rate_limit_state`
+    collection, updated by compare-and-swap on `tat`.
+    """
+
+    async def acquire(self, key: str, limit: Limit, now: float) -> float:
+        collection = RateLimitState.get_motor_collection()
+        for _ in range(MAX_ATTEMPTS):
+            state = await collection.find_one({"_id": key})
+            new_tat, retry_after = take_token(state["tat"] if state else now, now, limit)
+            if new_tat is None:
+                return retry_after
+            if state is None:
+                try:
+                    await collection.insert_one({"_id": key, "tat": new_tat})
+                    return 0.0
+                except DuplicateKeyError:
+                    continue
+            result = await collection.update_one(
+                {"_id": key, "tat": state["tat"]}, {"$set": {"tat": new_tat}}
+            )
+            if result.modified_count:
+                return 0.0
+        # Another process keeps winning the bucket; it is busy anyway.
+        return limit.interval
+
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+
+    async def check(self, scope: str, user_id: UUID, role: str) -> float:
+        """
+        Takes a token from the user's bucket for `scope`. Returns 0 if the
+        request may proceed, else the seconds to wait before retrying.
+        """
+        limit = limit_for(scope, role)
+        if limit is None:
+            return 0.0
+        retry_after = await self.store.acquire(f"{scope}:{user_id}", limit, time.time())
+        RATE_LIMIT_DECISIONS.labels(
+            scope, role, "throttled" if retry_after else "allowed"
+        ).inc()
+        return retry_after
+
+
+rate_limiter = RateLimiter(
+    MongoBucketStore()
+    if os.getenv("RATE_LIMIT_STORE", "memory") == "mongo"
+    else MemoryBucketStore(int(os.getenv("RATE_LIMIT_MAX_USERS", "100000")))
+)
@@ -0,0 +1,254 @@
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from beanie.operators import In
+from loguru import logger
+from pydantic import BaseModel
+
+from app.models.audit import AuditLog
+from app.models.execution import ArchivedExecution, ExecutionJob, ExecutionStep
+from app.services import http_cache
+from app.services.events import TERMINAL_STATUSES
+
+
+class RetentionSettings(BaseModel):
+    # Zero keeps data forever.
+    execution_days: int = 0
+    audit_days: int = 0
+    # Expired data is written here before deletion; unset disables archiving.
+    archive_dir: Optional[str] = None
+    batch_size: int = 500
+    interval: float = 3600.0
+
+    @classmethod
+    def from_env(cls) -> "RetentionSettings":
+        return cls(
+            execution_days=int(os.getenv("EXECUTION_RETENTION_DAYS", "0")),
+            audit_days=int(os.getenv("AUDIT_RETENTION_DAYS", "0")),
+            archive_dir=os.getenv("RETENTION_ARCHIVE_DIR") or None,
+            batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "500")),
+            interval=float(os.getenv("RETENTION_INTERVAL", "3600")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.execution_days > 0 or self.audit_days > 0
+
+
+def _write_archive(archive_dir: str, kind: str, records: List[Dict[str, Any]]) -> str:
+    """
+    Writes one batch as a gzipped NDJSON file and returns its file name.
+    Blocking; run it in a thread.
+    """
+    directory = Path(archive_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{kind}-{datetime.now(UTC).strftime('%Y%m%dT%H%M%S%f')}.ndjson.gz"
+    with gzip.open(directory / name, "wt", encoding="utf-8") as archive:
+        for record in records:
+            archive.write(json.dumps(record, default=str) + "\n")
+    return name
+
+
+async def delete_executions(
+    job_ids: List[UUID], archive_dir: Optional[str] = None
+) -> None:
+    """
+    Deletes the given jobs and their steps, archiving them first when an
+    archive directory is given.
+    """
+    if archive_dir:
+        jobs = await ExecutionJob.find(In(ExecutionJob.id, job_ids)).to_list()
+        steps = await ExecutionStep.find(In(ExecutionStep.job_id, job_ids)).to_list()
+        steps_by_job: Dict[UUID, List[ExecutionStep]] = {}
+        for step in steps:
+            steps_by_job.setdefault(step.job_id, []).append(step)
+        name = await asyncio.to_thread(
+            _write_archive,
+            archive_dir,
+            "executions",
+            [
+                {
+                    "job": job.model_dump(mode="json"),
+                    "steps": [
+                        step.model_dump(mode="json") for step in steps_by_job.get(job.id, [])
+                    ],
+                }
+                for job in jobs
+            ],
+        )
+        # Replace, so a job archived again after a rehydrate points at the
+        # newest copy.
+        for job in jobs:
+            await ArchivedExecution(
+                id=job.id,
+                runbook_id=job.runbook_id,
+                status=job.status,
+                start_time=job.start_time,
+                archive=name,
+            ).save()
+
+    await ExecutionStep.find(In(ExecutionStep.job_id, job_ids)).delete()
+    await ExecutionJob.find(In(ExecutionJob.id, job_ids)).delete()
+    for job_id in job_ids:
+        http_cache.invalidate("job", job_id)
+
+
+async def prune_executions(
+    cutoff: datetime, batch_size: int, archive_dir: Optional[str] = None
+) -> int:
+    """
+    Deletes finished jobs started before `cutoff`, with their steps, in
+    batches of at most `batch_size` jobs. Jobs restored from the archive
+    are kept until `cutoff` passes their restore time. Returns the number
+    deleted.
+    """
+    deleted = 0
+    while True:
+        batch = [
+            job.id
+            for job in await ExecutionJob.find(
+                In(ExecutionJob.status, list(TERMINAL_STATUSES)),
+                {
+                    "$or": [
+                        {"rehydrated_at": None, "start_time": {"$lt": cutoff}},
+                        {"rehydrated_at": {"$lt": cutoff}},
+                    ]
+                },
+            )
+            .sort("+start_time")
+            .limit(batch_size)
+            .to_list()
+        ]
+        if not batch:
+            return deleted
+        await delete_executions(batch, archive_dir)
+        deleted += len(batch)
+        # Let requests in between batches.
+        await asyncio.sleep(0)
+
+
+async def prune_audit_logs(
+    cutoff: datetime, batch_size: int, archive_dir: Optional[str] = None
+) -> int:
+    """
+    Deletes audit entries older than `cutoff` in batches, archiving them
+    first when an archive directory is given. Returns the number deleted.
+    """
+    deleted = 0
+    while True:
+        logs = (
+            await AuditLog.find(AuditLog.timestamp < cutoff)
+            .sort([("timestamp", 1), ("_id", 1)])
+            .limit(batch_size)
+            .to_list()
+        )
+        if not logs:
+            return deleted
+        if archive_dir:
+            await asyncio.to_thread(
+                _write_archive,
+                archive_dir,
+                "audit",
+                [log.model_dump(mode="json", by_alias=True) for log in logs],
+            )
+        await AuditLog.find(In(AuditLog.id, [log.id for log in logs])).delete()
+        deleted += len(logs)
+        await asyncio.sleep(0)
+
+
+async def clear_executions(batch_size: int) -> int:
+    """
+    Deletes every job and step in batches of at most `batch_size`, rather
+    than in one unbounded delete. Returns the number of jobs deleted.
+    """
+    deleted = 0
+    while True:
+        batch = [job.id for job in await ExecutionJob.find().limit(batch_size).to_list()]
+        if not batch:
+            break
+        await delete_executions(batch)
+        deleted += len(batch)
+        await asyncio.sleep(0)
+    # Steps whose job is already gone.
+    while True:
+        steps = await ExecutionStep.find().limit(batch_size).to_list()
+        if not steps:
+            return deleted
+        await ExecutionStep.find(In(ExecutionStep.id, [step.id for step in steps])).delete()
+        await asyncio.sleep(0)
+
+
+async def enforce_retention(settings: RetentionSettings) -> Dict[str, int]:
+    """Runs one pruning pass and returns how many records each part removed."""
+    now = datetime.now(UTC)
+    result = {"executions": 0, "audit_logs": 0}
+    if settings.execution_days > 0:
+        result["executions"] = await prune_executions(
+            now - timedelta(days=settings.execution_days),
+            settings.batch_size,
+            settings.archive_dir,
+        )
+    if settings.audit_days > 0:
+        result["audit_logs"] = await prune_audit_logs(
+            now - timedelta(days=settings.audit_days),
+            settings.batch_size,
+            settings.archive_dir,
+        )
+    return result
+
+
+async def retention_worker(settings: RetentionSettings) -> None:
+    """Background loop that enforces the retention windows periodically."""
+    logger.info("Retention worker started.")
+    while True:
+        try:
+            result = await enforce_retention(settings)
+            if any(result.values()):
+                logger.info(f"Retention pruned {result}")
+        except Exception:
+            logger.exception("Retention pass failed")
+        await asyncio.sleep(settings.interval)
+
+
+def _read_archived_job(path: Path, job_id: UUID) -> Dict[str, Any]:
+    """
+    Finds the record of one job in an archive file. Blocking; run it in a
+    thread. Raises FileNotFoundError without the file, and LookupError
+    when the job is not in it.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            record = json.loads(line)
+            if record["job"]["id"] == str(job_id):
+                return record
+    raise LookupError(f"Job {job_id} is missing from {path.name}")
+
+
+async def rehydrate_execution(job_id: UUID, archive_dir: str) -> Optional[ExecutionJob]:
+    """
+    Restores an archived job and its steps from the archive file, keeping
+    their ids. The restored job is kept for a full retention period from
+    now. Returns None when the job was never archived; raises
+    FileNotFoundError when its archive file is gone.
+    """
+    archived = await ArchivedExecution.get(job_id)
+    if not archived:
+        return None
+    record = await asyncio.to_thread(
+        _read_archived_job, Path(archive_dir) / archived.archive, job_id
+    )
+
+    job = ExecutionJob.model_validate(record["job"])
+    job.rehydrated_at = datetime.now(UTC)
+    if not await ExecutionJob.get(job.id):
+        await job.insert()
+        steps = [ExecutionStep.model_validate(step) for step in record["steps"]]
+        if steps:
+            await ExecutionStep.insert_many(steps)
+    return job
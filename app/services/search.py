@@ -0,0 +1,218 @@
+import asyncio
+import re
+import sys
+from collections import Counter
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from loguru import logger
+
+from app.models.block import Block
+from app.models.runbook import Runbook
+from app.models.search import RunbookSearchEntry, RunbookSearchHit
+from app.services.versions import get_latest_version, load_blocks
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# How much a single occurrence of a term counts, by where it was found.
+FIELD_WEIGHTS = {
+    "title": 8.0,
+    "tags": 6.0,
+    "block_name": 4.0,
+    "description": 2.0,
+    "block_text": 1.0,
+}
+# Repeating a word in a long command does not make it more relevant.
+MAX_OCCURRENCES = 5
+# A query token that only prefixes a term counts for less than a whole word.
+PREFIX_FACTOR = 0.5
+# Config keys that hold identifiers or structure rather than searchable text.
+SKIPPED_CONFIG_KEYS = {"id", "type", "order", "credential_id"}
+# Entry fields returned with each hit.
+HIT_FIELDS = ("title", "description", "tags", "version", "updated_at")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase word tokens, dropping single characters.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1]
+
+
+def _config_text(value: Any) -> Iterable[str]:
+    """Yields the string values of a block config, including nested blocks."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if key not in SKIPPED_CONFIG_KEYS:
+                yield from _config_text(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _config_text(item)
+
+
+def build_entry(runbook: Runbook, version: int, blocks: List[Block]) -> RunbookSearchEntry:
+    """
+    Builds the search entry for a runbook from its metadata and the blocks
+    of its latest version.
+    """
+    fields: Dict[str, List[str]] = {
+        "title": tokenize(runbook.title),
+        "description": tokenize(runbook.description),
+        "tags": [token for tag in runbook.tags for token in tokenize(tag)],
+        "block_name": [
+            token for block in blocks for token in tokenize(block.name or "")
+        ],
+        "block_text": [
+            token
+            for block in blocks
+            for text in _config_text(block.config)
+            for token in tokenize(text)
+        ],
+    }
+    weights: Dict[str, float] = {}
+    for field, tokens in fields.items():
+        for term, count in Counter(tokens).items():
+            weights[term] = weights.get(term, 0.0) + FIELD_WEIGHTS[field] * min(
+                count, MAX_OCCURRENCES
+            )
+
+    return RunbookSearchEntry(
+        id=runbook.id,
+        title=runbook.title,
+        description=runbook.description,
+        tags=runbook.tags,
+        version=version,
+        terms=sorted(weights),
+        weights=weights,
+        updated_at=datetime.now(UTC),
+    )
+
+
+async def index_runbook(
+    runbook: Runbook, version: Optional[int] = None, blocks: Optional[List[Block]] = None
+) -> None:
+    """
+    Writes the search entry for a runbook. The latest version is loaded
+    when `version` and `blocks` are not given.
+    """
+    if version is None or blocks is None:
+        latest_version = await get_latest_version(runbook.id)
+        version = latest_version.version_number if latest_version else 0
+        blocks = await load_blocks(latest_version) if latest_version else []
+    await build_entry(runbook, version, blocks).save()
+
+
+async def remove_runbook(runbook_id: UUID) -> None:
+    """Drops a runbook from the search index."""
+    await RunbookSearchEntry.find(RunbookSearchEntry.id == runbook_id).delete()
+
+
+def score_pipeline(tokens: List[str], skip: int, limit: int) -> List[Dict[str, Any]]:
+    """
+    Aggregation stages that score and rank matching entries, then return
+    the total and one page in a single document. An entry scores, for each
+    query token, the weight of the term it matches best: the whole word if
+    present, else the strongest term it prefixes. Every match is ranked on
+    the server before the page is cut.
+    """
+    best: Dict[str, Any] = {}
+    for i, token in enumerate(tokens):
+        best[f"exact{i}"] = {"$cond": [{"$eq": ["$term.k", token]}, "$term.v", 0]}
+        best[f"prefix{i}"] = {
+            "$cond": [
+                {"$regexMatch": {"input": "$term.k", "regex": f"^{re.escape(token)}"}},
+                "$term.v",
+                0,
+            ]
+        }
+    token_scores = [
+        {
+            "$cond": [
+                {"$gt": [f"$exact{i}", 0]},
+                f"$exact{i}",
+                {"$multiply": [PREFIX_FACTOR, f"$prefix{i}"]},
+            ]
+        }
+        for i in range(len(tokens))
+    ]
+    return [
+        {"$project": {**{f: 1 for f in HIT_FIELDS}, "term": {"$objectToArray": "$weights"}}},
+        # One document per term; every entry has a term for each token.
+        {"$unwind": "$term"},
+        {"$addFields": best},
+        {
+            "$group": {
+                "_id": "$_id",
+                **{f: {"$first": f"${f}"} for f in HIT_FIELDS},
+                **{name: {"$max": f"${name}"} for name in best},
+            }
+        },
+        {"$addFields": {"score": {"$add": token_scores}, "sort_title": {"$toLower": "$title"}}},
+        {"$sort": {"score": -1, "sort_title": 1, "_id": 1}},
+        {
+            "$facet": {
+                "total": [{"$count": "count"}],
+                "page": [
+                    {"$skip": skip},
+                    {"$limit": limit},
+                    {"$project": {f: 1 for f in (*HIT_FIELDS, "score")}},
+                ],
+            }
+        },
+    ]
+
+
+async def search_runbooks(
+    query: str, skip: int = 0, limit: int = 20
+) -> Tuple[int, List[RunbookSearchHit]]:
+    """
+    Returns the number of runbooks matching every query token (as a word
+    or word prefix) and one page of them, best match first.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return 0, []
+
+    result = await RunbookSearchEntry.find(
+        {"$and": [{"terms": {"$regex": f"^{re.escape(token)}"}} for token in tokens]}
+    ).aggregate(score_pipeline(tokens, skip, limit)).to_list()
+    facets = result[0] if result else {"total": [], "page": []}
+    total = facets["total"][0]["count"] if facets["total"] else 0
+    hits = [RunbookSearchHit(id=doc.pop("_id"), **doc) for doc in facets["page"]]
+    return total, hits
+
+
+async def rebuild_index() -> int:
+    """
+    Re-indexes every runbook and drops entries of runbooks that no longer
+    exist. Returns the number of runbooks indexed.
+    """
+    indexed = set()
+    async for runbook in Runbook.find_all():
+        await index_runbook(runbook)
+        indexed.add(runbook.id)
+    async for entry in RunbookSearchEntry.find_all():
+        if entry.id not in indexed:
+            await entry.delete()
+    logger.info(f"Search index rebuilt for {len(indexed)} runbooks.")
+    return len(indexed)
+
+
+async def main() -> int:
+    """
+    Command-line rebuild: `python -m app.services.search`. Needed once for
+    runbooks created before the search index existed.
+    """
+    from app.db import create_init_beanie
+    from app.main import document_models
+
+    await create_init_beanie(document_models)()
+    print(f"Indexed {await rebuild_index()} runbooks.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
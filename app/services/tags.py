@@ -0,0 +1,86 @@
+import asyncio
+import sys
+from collections import Counter
+from typing import Iterable, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+from pymongo import DESCENDING
+
+from app.models.runbook import Runbook, RunbookTagCount
+
+
+class TagFacet(BaseModel):
+    tag: str
+    count: int
+
+
+async def update_tag_counts(
+    old_tags: Iterable[str] = (), new_tags: Iterable[str] = ()
+) -> None:
+    """
+    Applies the change of one runbook's tags to the materialized counts.
+    Pass no `old_tags` for a new runbook and no `new_tags` for a deleted one.
+    """
+    deltas = Counter(set(new_tags))
+    deltas.subtract(set(old_tags))
+    changed = {tag: delta for tag, delta in deltas.items() if delta}
+    if not changed:
+        return
+    collection = RunbookTagCount.get_motor_collection()
+    # Atomic increments, so concurrent edits of the same tag never lose counts.
+    for tag, delta in changed.items():
+        await collection.update_one(
+            {"_id": tag}, {"$inc": {"runbook_count": delta}}, upsert=True
+        )
+    if any(delta < 0 for delta in changed.values()):
+        await collection.delete_many({"runbook_count": {"$lte": 0}})
+
+
+async def tag_facets(limit: Optional[int] = None) -> List[TagFacet]:
+    """Returns tags with their runbook counts, most used first."""
+    query = RunbookTagCount.find().sort(
+        [(RunbookTagCount.runbook_count, DESCENDING), (RunbookTagCount.id, 1)]
+    )
+    if limit:
+        query = query.limit(limit)
+    return [TagFacet(tag=entry.id, count=entry.runbook_count) async for entry in query]
+
+
+async def rebuild_tag_counts() -> int:
+    """
+    Recomputes every tag count from the runbooks collection. Returns the
+    number of distinct tags.
+    """
+    counts = await Runbook.find().aggregate(
+        [
+            {"$unwind": "$tags"},
+            # A tag listed twice on one runbook counts once.
+            {"$group": {"_id": {"runbook": "$_id", "tag": "$tags"}}},
+            {"$group": {"_id": "$_id.tag", "count": {"$sum": 1}}},
+        ]
+    ).to_list()
+    await RunbookTagCount.find_all().delete()
+    if counts:
+        await RunbookTagCount.insert_many(
+            [RunbookTagCount(id=entry["_id"], runbook_count=entry["count"]) for entry in counts]
+        )
+    logger.info(f"Tag counts rebuilt for {len(counts)} tags.")
+    return len(counts)
+
+
+async def main() -> int:
+    """
+    Command-line rebuild: `python -m app.services.tags`. Needed once for
+    runbooks created before tag counts were maintained.
+    """
+    from app.db import create_init_beanie
+    from app.main import document_models
+
+    await create_init_beanie(document_models)()
+    print(f"Counted {await rebuild_tag_counts()} tags.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,130 @@
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional, Union
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from app.models.block import Block
+from app.models.execution import ExecutionJob, ExecutionStep
+
+
+def as_utc(moment: datetime) -> datetime:
+    """MongoDB returns naive datetimes; they are UTC."""
+    return moment if moment.tzinfo else moment.replace(tzinfo=UTC)
+
+
+def elapsed_ms(start: datetime, end: datetime) -> float:
+    """Milliseconds from `start` to `end`, never negative."""
+    return max((as_utc(end) - as_utc(start)).total_seconds() * 1000, 0.0)
+
+
+class TimelineStep(BaseModel):
+    step_id: UUID
+    block_id: UUID
+    block_name: Optional[str] = None
+    block_type: Optional[str] = None
+    status: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    # From the start of the job; the bar's position in a Gantt chart.
+    offset_ms: float
+    duration_ms: Optional[float] = None
+    # Fraction of the job's duration spent in this step.
+    share: Optional[float] = None
+    slowest: bool = False
+
+
+class JobTimeline(BaseModel):
+    job_id: UUID
+    status: str
+    enqueued_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    queue_wait_ms: Optional[float] = None
+    duration_ms: Optional[float] = None
+    # Time inside the job not spent in any step: loading, dispatch, polling.
+    overhead_ms: Optional[float] = None
+    steps: List[TimelineStep]
+
+
+def _block_index(blocks: Iterable[Union[Block, Dict[str, Any]]]) -> Dict[str, Block]:
+    """Maps block ids to blocks, including those nested in condition blocks."""
+    index: Dict[str, Block] = {}
+    for block in blocks:
+        if isinstance(block, dict):
+            block = Block(**block)
+        index[str(block.id)] = block
+        if block.type == "condition":
+            index.update(
+                _block_index(
+                    block.config.get("nested_blocks", []) + block.config.get("else_blocks", [])
+                )
+            )
+    return index
+
+
+def build_timeline(
+    job: ExecutionJob,
+    steps: List[ExecutionStep],
+    blocks: List[Block],
+    slowest: int = 3,
+) -> JobTimeline:
+    """
+    Lays out the steps of a job on a time axis. Blocks run one after the
+    other, so every step is on the critical path; the `slowest` longest
+    steps are flagged as the place to look when a runbook is slow.
+    """
+    blocks_by_id = _block_index(blocks)
+    job_start = job.started_at or job.start_time
+    job_duration = job.duration_ms
+
+    entries = []
+    for step in sorted(steps, key=lambda s: as_utc(s.started_at or s.timestamp)):
+        started_at = step.started_at or step.timestamp
+        finished_at = step.finished_at
+        duration = step.duration_ms
+        if duration is None and step.status in ("success", "error"):
+            # Steps recorded before timing was captured.
+            finished_at = step.updated_at
+            duration = elapsed_ms(started_at, finished_at)
+        block = blocks_by_id.get(str(step.block_id))
+        entries.append(
+            TimelineStep(
+                step_id=step.id,
+                block_id=step.block_id,
+                block_name=block.name if block else None,
+                block_type=block.type if block else None,
+                status=step.status,
+                started_at=started_at,
+                finished_at=finished_at,
+                offset_ms=elapsed_ms(job_start, started_at),
+                duration_ms=duration,
+                share=duration / job_duration
+                if duration is not None and job_duration
+                else None,
+            )
+        )
+
+    for entry in sorted(
+        (e for e in entries if e.duration_ms is not None),
+        key=lambda e: e.duration_ms,
+        reverse=True,
+    )[:slowest]:
+        entry.slowest = True
+
+    overhead = None
+    if job_duration is not None:
+        overhead = max(
+            job_duration - sum(e.duration_ms or 0 for e in entries), 0.0
+        )
+    return JobTimeline(
+        job_id=job.id,
+        status=job.status,
+        enqueued_at=job.start_time,
+        started_at=job.started_at,
+        finished_at=job.finished_at or job.end_time,
+        queue_wait_ms=job.queue_wait_ms,
+        duration_ms=job_duration,
+        overhead_ms=overhead,
+        steps=entries,
+    )
@@ -0,0 +1,267 @@
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from app.services.cache import LRUCache
+from app.services.timing import as_utc
+
+# Traces of the most recent jobs kept in memory for the trace endpoint.
+TRACE_MAX_JOBS = int(os.getenv("TRACE_MAX_JOBS", "200"))
+# When set, every finished trace is appended to this file as one line of
+# OTLP/JSON, the format of the OpenTelemetry collector's file exporter.
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE") or None
+
+SERVICE_NAME = "runbook-runner"
+
+# Copied from a span to its children, so every span of a block carries it.
+INHERITED_ATTRIBUTES = ("job.id", "runbook.id", "block.id", "block.type")
+
+# OTLP span kinds and status codes.
+SPAN_KINDS = {"internal": 1, "client": 3}
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def _to_nanos(moment: datetime) -> int:
+    return int(as_utc(moment).timestamp() * 1_000_000_000)
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings.
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span(BaseModel):
+    trace_id: str
+    span_id: str = Field(default_factory=lambda: secrets.token_hex(8))
+    parent_span_id: Optional[str] = None
+    name: str
+    kind: str = "internal"
+    start_ns: int = Field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = {}
+    error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, message: str) -> None:
+        self.error = message
+
+    def to_otlp(self) -> Dict[str, Any]:
+        status: Dict[str, Any] = {"code": STATUS_OK}
+        if self.error is not None:
+            status = {"code": STATUS_ERROR, "message": self.error}
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": SPAN_KINDS[self.kind],
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": status,
+        }
+
+
+def otlp_document(spans: List[Span]) -> Dict[str, Any]:
+    """Spans as an OTLP/JSON `ExportTraceServiceRequest`."""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": otlp_value(SERVICE_NAME)}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "app.services.tracing"},
+                        "spans": [span.to_otlp() for span in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Records spans of job executions without an external collector. A
+    job's trace id is its id, so its spans can be looked up directly;
+    spans opened outside a job's trace are not recorded. Finished traces
+    stay in an in-process LRU and are optionally appended to an OTLP/JSON
+    file that an OpenTelemetry collector or viewer can read.
+    """
+
+    def __init__(self, max_traces: int, export_path: Optional[str]):
+        self.export_path = export_path
+        self._traces: LRUCache[List[Span]] = LRUCache(max_traces)
+        self._export_lock = threading.Lock()
+
+    @contextmanager
+    def trace(
+        self,
+        name: str,
+        trace_id: str,
+        start: Optional[datetime] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Span]:
+        """
+        Opens the root span of a trace, replacing any earlier trace with
+        the same id. `start` backdates the span, e.g. to when a job was
+        enqueued. The trace is exported when the root span ends.
+        """
+        spans: List[Span] = []
+        self._traces.put(trace_id, spans)
+        root = Span(trace_id=trace_id, name=name, attributes=dict(attributes or {}))
+        if start is not None:
+            root.start_ns = _to_nanos(start)
+        try:
+            with self._activate(root, spans):
+                yield root
+        finally:
+            self._export(spans)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: str = "internal",
+    ) -> Iterator[Span]:
+        """
+        Opens a child of the current span. Outside a trace the span is
+        handed out for attributes but not recorded.
+        """
+        parent = _current_span.get()
+        span = self._child(parent, name, attributes, kind)
+        if parent is None:
+            yield span
+            return
+        with self._activate(span, self._traces.get(parent.trace_id)):
+            yield span
+
+    def record(
+        self,
+        name: str,
+        start: datetime,
+        end: datetime,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Records a child of the current span that has already finished."""
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = self._child(parent, name, attributes, "internal")
+        span.start_ns = _to_nanos(start)
+        span.end_ns = _to_nanos(end)
+        self._append(span, self._traces.get(parent.trace_id))
+
+    def _child(
+        self,
+        parent: Optional[Span],
+        name: str,
+        attributes: Optional[Dict[str, Any]],
+        kind: str,
+    ) -> Span:
+        inherited = {
+            key: parent.attributes[key]
+            for key in INHERITED_ATTRIBUTES
+            if parent and key in parent.attributes
+        }
+        return Span(
+            trace_id=parent.trace_id if parent else "",
+            parent_span_id=parent.span_id if parent else None,
+            name=name,
+            kind=kind,
+            attributes={**inherited, **(attributes or {})},
+        )
+
+    @contextmanager
+    def _activate(self, span: Span, spans: Optional[List[Span]]) -> Iterator[None]:
+        token = _current_span.set(span)
+        try:
+            yield
+        except BaseException as e:
+            if span.error is None:
+                span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._append(span, spans)
+
+    def _append(self, span: Span, spans: Optional[List[Span]]) -> None:
+        # None once the trace was evicted; the span is dropped with it.
+        if spans is not None:
+            spans.append(span)
+
+    def _export(self, spans: List[Span]) -> None:
+        if not self.export_path or not spans:
+            return
+        # One short append per job, so it is not worth a thread hop.
+        line = json.dumps(otlp_document(spans), separators=(",", ":"))
+        try:
+            with self._export_lock, open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not export trace to {self.export_path}: {e}")
+
+    def get_spans(self, trace_id: str) -> Optional[List[Span]]:
+        """Spans of a trace still held in memory, in the order they ended."""
+        spans = self._traces.get(trace_id)
+        return list(spans) if spans is not None else None
+
+    def read_exported(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The latest export of a trace from the OTLP/JSON file, for traces
+        no longer in memory or recorded by another worker. Blocking.
+        """
+        if not self.export_path or not os.path.exists(self.export_path):
+            return None
+        found = None
+        needle = f'"traceId":"{trace_id}"'
+        with open(self.export_path, encoding="utf-8") as f:
+            for line in f:
+                if needle in line:
+                    found = line
+        return json.loads(found) if found else None
+
+
+tracer = Tracer(TRACE_MAX_JOBS, TRACE_EXPORT_FILE)
+
+
+def db_span(operation: str, collection: str):
+    """A client span around one MongoDB operation of the current trace."""
+    return tracer.span(
+        f"{operation} {collection}",
+        {
+            "db.system": "mongodb",
+            "db.operation.name": operation,
+            "db.collection.name": collection,
+        },
+        kind="client",
+    )
@@ -0,0 +1,303 @@
+import os
+import zlib
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional, Set, Tuple
+from uuid import UUID, uuid4
+
+from beanie.operators import In
+from pydantic import BaseModel, ValidationError, field_validator
+from pymongo.errors import BulkWriteError
+from typing_extensions import Literal
+
+from app.models.block import Block
+from app.models.runbook import Runbook, RunbookVersion
+from app.services import http_cache, search
+from app.services.tags import update_tag_counts
+from app.services.versions import blocks_content_hash, load_blocks_many, store_blocks
+
+# Runbooks read, or written, per round trip while streaming.
+TRANSFER_BATCH_SIZE = int(os.getenv("TRANSFER_BATCH_SIZE", "100"))
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+ConflictPolicy = Literal["remap", "skip", "overwrite"]
+
+
+class ExportedVersion(BaseModel):
+    version_number: int
+    created_at: datetime
+    created_by: Optional[UUID] = None
+    content_hash: Optional[str] = None
+    blocks: List[Block]
+
+
+class ExportedRunbook(BaseModel):
+    """One line of an export: a runbook with its full version history."""
+
+    id: UUID
+    title: str
+    description: str
+    created_by: UUID
+    environment_id: Optional[UUID] = None
+    created_at: datetime
+    updated_at: datetime
+    tags: List[str] = []
+    versions: List[ExportedVersion]
+
+    @field_validator("versions")
+    @classmethod
+    def version_numbers_are_unique(cls, versions: List[ExportedVersion]):
+        numbers = [version.version_number for version in versions]
+        if any(number < 1 for number in numbers):
+            raise ValueError("version numbers start at 1")
+        if len(set(numbers)) != len(numbers):
+            raise ValueError(f"duplicate version numbers: {sorted(numbers)}")
+        return versions
+
+
+class ImportLineError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportSummary(BaseModel):
+    import_id: UUID
+    imported: int = 0
+    skipped: int = 0
+    overwritten: int = 0
+    remapped: Dict[UUID, UUID] = {}  # original id -> new id
+    errors: List[ImportLineError] = []
+
+
+async def _export_batch(runbooks: List[Runbook]) -> AsyncIterator[bytes]:
+    versions = await RunbookVersion.find(
+        In(RunbookVersion.runbook_id, [runbook.id for runbook in runbooks])
+    ).sort("+version_number").to_list()
+    blocks = await load_blocks_many(versions)
+    history: Dict[UUID, List[ExportedVersion]] = {}
+    for version, version_blocks in zip(versions, blocks):
+        history.setdefault(version.runbook_id, []).append(
+            ExportedVersion(**version.model_dump(exclude={"blocks"}), blocks=version_blocks)
+        )
+    for runbook in runbooks:
+        line = ExportedRunbook(
+            **runbook.model_dump(), versions=history.get(runbook.id, [])
+        )
+        yield line.model_dump_json().encode("utf-8") + b"\n"
+
+
+async def export_runbooks(compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    Streams every runbook with its version history as NDJSON, optionally
+    gzip-compressed. Runbooks are read from a cursor in batches, so memory
+    use does not grow with the library.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    async def lines() -> AsyncIterator[bytes]:
+        batch: List[Runbook] = []
+        async for runbook in Runbook.find_all().sort("+created_at"):
+            batch.append(runbook)
+            if len(batch) >= TRANSFER_BATCH_SIZE:
+                async for line in _export_batch(batch):
+                    yield line
+                batch = []
+        if batch:
+            async for line in _export_batch(batch):
+                yield line
+
+    async for chunk in lines():
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+async def _read_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Splits a byte stream into lines, gunzipping it if it starts gzipped."""
+    decompressor = None
+    pending = b""
+    first = True
+    async for chunk in chunks:
+        if first and chunk:
+            first = False
+            if chunk.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(wbits=31)
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if decompressor:
+        pending += decompressor.flush()
+    for line in pending.split(b"\n"):
+        yield line
+
+
+def _write_errors(error: BulkWriteError, documents: List) -> Dict[UUID, str]:
+    """Maps each document a bulk insert rejected to the runbook it belongs to."""
+    failed: Dict[UUID, str] = {}
+    for write_error in error.details.get("writeErrors", []):
+        document = documents[write_error["index"]]
+        runbook_id = getattr(document, "runbook_id", None) or document.id
+        failed.setdefault(runbook_id, write_error.get("errmsg", "write failed"))
+    return failed
+
+
+async def _insert_runbooks(
+    runbooks: List[Runbook], versions: List[RunbookVersion]
+) -> Dict[UUID, str]:
+    """
+    Inserts runbooks, then the versions of those that were stored. Returns
+    the runbooks that could not be stored completely, with the reason;
+    a runbook whose versions were rejected is removed again, so no runbook
+    is left with part of its history.
+    """
+    failed: Dict[UUID, str] = {}
+    try:
+        await Runbook.insert_many(runbooks, ordered=False)
+    except BulkWriteError as e:
+        failed = _write_errors(e, runbooks)
+    versions = [version for version in versions if version.runbook_id not in failed]
+    if not versions:
+        return failed
+    try:
+        await RunbookVersion.insert_many(versions, ordered=False)
+    except BulkWriteError as e:
+        incomplete = _write_errors(e, versions)
+        await RunbookVersion.find(In(RunbookVersion.runbook_id, list(incomplete))).delete()
+        await Runbook.find(In(Runbook.id, list(incomplete))).delete()
+        failed.update(incomplete)
+    return failed
+
+
+async def _import_batch(
+    batch: List[Tuple[int, ExportedRunbook]],
+    policy: ConflictPolicy,
+    summary: ImportSummary,
+) -> None:
+    existing = {
+        runbook.id: runbook
+        for runbook in await Runbook.find(
+            In(Runbook.id, [item.id for _, item in batch])
+        ).to_list()
+    }
+
+    runbooks: List[Runbook] = []
+    lines: Dict[UUID, int] = {}
+    original_ids: Dict[UUID, UUID] = {}
+    exported_versions: List[ExportedVersion] = []
+    version_owners: List[UUID] = []
+    replaced: List[Runbook] = []
+    for line_number, item in batch:
+        runbook = Runbook(**item.model_dump(exclude={"versions"}))
+        if item.id in existing:
+            if policy == "skip":
+                summary.skipped += 1
+                continue
+            if policy == "remap":
+                runbook.id = uuid4()
+            else:
+                replaced.append(existing[item.id])
+        runbooks.append(runbook)
+        lines[runbook.id] = line_number
+        original_ids[runbook.id] = item.id
+        exported_versions += item.versions
+        version_owners += [runbook.id] * len(item.versions)
+
+    if replaced:
+        replaced_ids = [runbook.id for runbook in replaced]
+        await RunbookVersion.find(In(RunbookVersion.runbook_id, replaced_ids)).delete()
+        await Runbook.find(In(Runbook.id, replaced_ids)).delete()
+        for runbook in replaced:
+            http_cache.invalidate("runbook", runbook.id)
+            await update_tag_counts(old_tags=runbook.tags)
+    if not runbooks:
+        return
+
+    # One block store round trip for every version in the batch.
+    refs = await store_blocks(
+        [block for exported in exported_versions for block in exported.blocks]
+    )
+    versions: List[RunbookVersion] = []
+    latest: Dict[UUID, ExportedVersion] = {}
+    start = 0
+    for runbook_id, exported in zip(version_owners, exported_versions):
+        end = start + len(exported.blocks)
+        versions.append(
+            RunbookVersion(
+                runbook_id=runbook_id,
+                version_number=exported.version_number,
+                block_refs=refs[start:end],
+                created_at=exported.created_at,
+                created_by=exported.created_by,
+                content_hash=exported.content_hash
+                or blocks_content_hash(exported.blocks),
+            )
+        )
+        start = end
+        if (
+            runbook_id not in latest
+            or exported.version_number > latest[runbook_id].version_number
+        ):
+            latest[runbook_id] = exported
+
+    failed = await _insert_runbooks(runbooks, versions)
+    # Again, in case a read of the old versions was cached meanwhile.
+    for runbook in replaced:
+        http_cache.invalidate("runbook", runbook.id)
+    for runbook_id, error in failed.items():
+        summary.errors.append(ImportLineError(line=lines[runbook_id], error=error))
+    runbooks = [runbook for runbook in runbooks if runbook.id not in failed]
+    summary.overwritten += sum(runbook.id not in failed for runbook in replaced)
+    for runbook in runbooks:
+        if original_ids[runbook.id] != runbook.id:
+            summary.remapped[original_ids[runbook.id]] = runbook.id
+        version = latest.get(runbook.id)
+        await search.index_runbook(
+            runbook,
+            version.version_number if version else 0,
+            version.blocks if version else [],
+        )
+        await update_tag_counts(new_tags=runbook.tags)
+    summary.imported += len(runbooks)
+
+
+async def import_runbooks(
+    chunks: AsyncIterable[bytes], policy: ConflictPolicy = "skip"
+) -> ImportSummary:
+    """
+    Reads an export stream (plain or gzipped NDJSON) and inserts its
+    runbooks and versions in batches. Runbooks whose id already exists are
+    skipped, given a new id (`remap`) or replace the existing runbook
+    (`overwrite`). Lines that cannot be parsed or stored, such as a history
+    with repeated version numbers, are reported and skipped.
+    """
+    summary = ImportSummary(import_id=uuid4())
+    seen: Set[UUID] = set()
+    batch: List[Tuple[int, ExportedRunbook]] = []
+    line_number = 0
+    async for line in _read_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            item = ExportedRunbook.model_validate_json(line)
+        except (ValidationError, ValueError) as e:
+            summary.errors.append(ImportLineError(line=line_number, error=str(e)))
+            continue
+        # A runbook repeated within the stream conflicts with its first copy.
+        if item.id in seen:
+            await _import_batch(batch, policy, summary)
+            batch = []
+        seen.add(item.id)
+        batch.append((line_number, item))
+        if len(batch) >= TRANSFER_BATCH_SIZE:
+            await _import_batch(batch, policy, summary)
+            batch = []
+    if batch:
+        await _import_batch(batch, policy, summary)
+    return summary
@@ -0,0 +1,385 @@
+import copy
+import difflib
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from beanie.operators import In
+from pydantic import BaseModel, Field
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from typing_extensions import Literal
+
+from app.models.block import (
+    Block,
+    BlockContent,
+    BlockOperation,
+    BlockRef,
+    DeleteBlockOperation,
+    InsertBlockOperation,
+    MoveBlockOperation,
+    UpdateBlockOperation,
+)
+from app.models.runbook import RunbookVersion
+from app.models.user import User
+from app.services.cache import LRUCache
+
+# Stored blocks never change, so cached entries never go stale.
+block_cache: LRUCache[BlockContent] = LRUCache(
+    int(os.getenv("BLOCK_CACHE_SIZE", "10000"))
+)
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Attempts at taking the next version number while concurrent saves of the
+# same runbook keep taking it first.
+VERSION_NUMBER_ATTEMPTS = 5
+
+
+class StoredBlockId(BaseModel):
+    id: str = Field(alias="_id")
+
+
+class ValueChange(BaseModel):
+    old: Any = None
+    new: Any = None
+
+
+class BlockChange(BaseModel):
+    block_id: UUID
+    change: Literal["added", "removed", "reordered", "changed"]
+    name: Optional[str] = None
+    old_position: Optional[int] = None
+    new_position: Optional[int] = None
+    # Only set for added blocks.
+    block: Optional[Block] = None
+    # Changed top-level fields ("name", "type") and config keys ("config.<key>").
+    fields: Dict[str, ValueChange] = {}
+
+
+# Diffs between two stored versions never change once computed.
+diff_cache: LRUCache[List[BlockChange]] = LRUCache(
+    int(os.getenv("VERSION_DIFF_CACHE_SIZE", "512"))
+)
+
+
+def blocks_content_hash(blocks: List[Block]) -> str:
+    """
+    Returns a stable sha256 over the block list, independent of key order.
+    """
+    canonical = json.dumps(
+        [block.model_dump(mode="json") for block in blocks],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def block_content_hash(block: Block) -> str:
+    """
+    Returns the key a block is stored under. The order is excluded so that
+    moving a block does not create a new copy of it.
+    """
+    canonical = json.dumps(
+        block.model_dump(mode="json", exclude={"order"}),
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+async def store_blocks(blocks: List[Block]) -> List[BlockRef]:
+    """
+    Stores any blocks not yet in the block store and returns the ordered
+    references to all of them.
+    """
+    refs = []
+    contents: Dict[str, BlockContent] = {}
+    for block in blocks:
+        content_hash = block_content_hash(block)
+        refs.append(BlockRef(hash=content_hash, order=block.order))
+        contents[content_hash] = BlockContent(
+            id=content_hash,
+            block_id=block.id,
+            name=block.name,
+            type=block.type,
+            config=block.config,
+        )
+
+    if contents:
+        existing = {
+            content.id
+            for content in await BlockContent.find(In(BlockContent.id, list(contents)))
+            .project(StoredBlockId)
+            .to_list()
+        }
+        missing = [content for h, content in contents.items() if h not in existing]
+        if missing:
+            try:
+                await BlockContent.insert_many(missing, ordered=False)
+            except BulkWriteError as e:
+                # Another writer stored the same content concurrently.
+                if any(
+                    error["code"] != DUPLICATE_KEY_ERROR
+                    for error in e.details.get("writeErrors", [])
+                ):
+                    raise
+    for content_hash, content in contents.items():
+        block_cache.put(content_hash, content)
+    return refs
+
+
+async def load_blocks_many(versions: Iterable[RunbookVersion]) -> List[List[Block]]:
+    """
+    Rebuilds the block lists of several versions with a single batched
+    lookup for the blocks that are not cached.
+    """
+    versions = list(versions)
+    wanted = {
+        ref.hash
+        for version in versions
+        for ref in version.block_refs
+        if ref.hash not in block_cache
+    }
+    if wanted:
+        for content in await BlockContent.find(In(BlockContent.id, list(wanted))).to_list():
+            block_cache.put(content.id, content)
+
+    results = []
+    for version in versions:
+        # Callers get copies: executors fill in configs (e.g. credential
+        # headers), which must never reach cached or stored blocks.
+        if not version.block_refs:
+            results.append([block.model_copy(deep=True) for block in version.blocks])
+            continue
+        blocks = []
+        for ref in version.block_refs:
+            content = block_cache.get(ref.hash)
+            if content is None:
+                raise LookupError(
+                    f"Block {ref.hash} of runbook version {version.id} is missing"
+                )
+            blocks.append(
+                Block(
+                    id=content.block_id,
+                    name=content.name,
+                    type=content.type,
+                    config=copy.deepcopy(content.config),
+                    order=ref.order,
+                )
+            )
+        results.append(blocks)
+    return results
+
+
+async def load_blocks(version: RunbookVersion) -> List[Block]:
+    """
+    Returns the blocks of a version, whether stored inline or by reference.
+    """
+    return (await load_blocks_many([version]))[0]
+
+
+async def get_latest_version(runbook_id: UUID) -> Optional[RunbookVersion]:
+    """
+    Fetches the newest version of a runbook, if any.
+    """
+    return (
+        await RunbookVersion.find(RunbookVersion.runbook_id == runbook_id)
+        .sort("-version_number")
+        .first_or_none()
+    )
+
+
+async def get_latest_versions(runbook_ids: Iterable[UUID]) -> Dict[UUID, RunbookVersion]:
+    """
+    Returns the latest version of each of the given runbooks, by runbook
+    id, in one aggregation.
+    """
+    versions = await RunbookVersion.find(
+        In(RunbookVersion.runbook_id, list(runbook_ids))
+    ).aggregate(
+        [
+            {"$sort": {"runbook_id": 1, "version_number": -1}},
+            {"$group": {"_id": "$runbook_id", "latest": {"$first": "$$ROOT"}}},
+            {"$replaceRoot": {"newRoot": "$latest"}},
+        ],
+        projection_model=RunbookVersion,
+    ).to_list()
+    return {version.runbook_id: version for version in versions}
+
+
+async def create_version(
+    runbook_id: UUID,
+    blocks: List[Block],
+    user: Optional[User] = None,
+    version_number: Optional[int] = None,
+) -> RunbookVersion:
+    """
+    Stores a new version of a runbook, with its blocks in the block store.
+    The version number defaults to one past the current latest version; if
+    a concurrent save takes that number first, the next one is tried. An
+    explicit number that is taken raises DuplicateKeyError.
+    """
+    block_refs = await store_blocks(blocks)
+    content_hash = blocks_content_hash(blocks)
+    for attempt in range(VERSION_NUMBER_ATTEMPTS):
+        number = version_number
+        if number is None:
+            latest_version = await get_latest_version(runbook_id)
+            number = (latest_version.version_number + 1) if latest_version else 1
+        version = RunbookVersion(
+            runbook_id=runbook_id,
+            version_number=number,
+            block_refs=block_refs,
+            created_by=user.id if user else None,
+            content_hash=content_hash,
+        )
+        try:
+            await version.insert()
+            return version
+        except DuplicateKeyError:
+            if version_number is not None or attempt == VERSION_NUMBER_ATTEMPTS - 1:
+                raise
+
+
+def diff_blocks(old: List[Block], new: List[Block]) -> List[BlockChange]:
+    """
+    Computes a block-level diff, matching blocks by id. Blocks present in
+    both lists are reported as reordered when they fall outside the longest
+    run of blocks that kept their relative order, and as changed when their
+    name, type or config differ.
+    """
+    old_blocks = sorted(old, key=lambda b: b.order)
+    new_blocks = sorted(new, key=lambda b: b.order)
+    old_by_id = {b.id: (i, b) for i, b in enumerate(old_blocks)}
+    new_by_id = {b.id: (i, b) for i, b in enumerate(new_blocks)}
+
+    changes = []
+    for block_id, (position, block) in old_by_id.items():
+        if block_id not in new_by_id:
+            changes.append(
+                BlockChange(
+                    block_id=block_id,
+                    change="removed",
+                    name=block.name,
+                    old_position=position,
+                )
+            )
+    for block_id, (position, block) in new_by_id.items():
+        if block_id not in old_by_id:
+            changes.append(
+                BlockChange(
+                    block_id=block_id,
+                    change="added",
+                    name=block.name,
+                    new_position=position,
+                    block=block,
+                )
+            )
+
+    old_common = [b.id for b in old_blocks if b.id in new_by_id]
+    new_common = [b.id for b in new_blocks if b.id in old_by_id]
+    matcher = difflib.SequenceMatcher(a=old_common, b=new_common, autojunk=False)
+    kept_in_place = {
+        block_id
+        for match in matcher.get_matching_blocks()
+        for block_id in old_common[match.a : match.a + match.size]
+    }
+
+    for block_id in new_common:
+        old_position, old_block = old_by_id[block_id]
+        new_position, new_block = new_by_id[block_id]
+        if block_id not in kept_in_place:
+            changes.append(
+                BlockChange(
+                    block_id=block_id,
+                    change="reordered",
+                    name=new_block.name,
+                    old_position=old_position,
+                    new_position=new_position,
+                )
+            )
+
+        fields = {}
+        for field in ("name", "type"):
+            if getattr(old_block, field) != getattr(new_block, field):
+                fields[field] = ValueChange(
+                    old=getattr(old_block, field), new=getattr(new_block, field)
+                )
+        for key in sorted(set(old_block.config) | set(new_block.config)):
+            old_value = old_block.config.get(key)
+            new_value = new_block.config.get(key)
+            if old_value != new_value:
+                fields[f"config.{key}"] = ValueChange(old=old_value, new=new_value)
+        if fields:
+            changes.append(
+                BlockChange(
+                    block_id=block_id,
+                    change="changed",
+                    name=new_block.name,
+                    old_position=old_position,
+                    new_position=new_position,
+                    fields=fields,
+                )
+            )
+    return changes
+
+
+async def diff_versions(
+    old: RunbookVersion, new: RunbookVersion
+) -> List[BlockChange]:
+    """
+    Returns the block-level diff between two stored versions, memoized by
+    version id since stored versions are immutable.
+    """
+    key = (old.id, new.id)
+    changes = diff_cache.get(key)
+    if changes is None:
+        old_blocks, new_blocks = await load_blocks_many([old, new])
+        changes = diff_blocks(old_blocks, new_blocks)
+        diff_cache.put(key, changes)
+    return changes
+
+
+def apply_block_operations(
+    blocks: List[Block], operations: List[BlockOperation]
+) -> List[Block]:
+    """
+    Applies insert, update, delete and move operations in sequence and
+    renumbers the block orders. Raises ValueError for unknown or duplicate
+    block ids.
+    """
+    result = [block.model_copy(deep=True) for block in sorted(blocks, key=lambda b: b.order)]
+
+    def index_of(block_id: UUID) -> int:
+        for i, block in enumerate(result):
+            if block.id == block_id:
+                return i
+        raise ValueError(f"Block {block_id} not found")
+
+    for operation in operations:
+        if isinstance(operation, InsertBlockOperation):
+            if any(block.id == operation.block.id for block in result):
+                raise ValueError(f"Block {operation.block.id} already exists")
+            position = len(result) if operation.position is None else operation.position
+            result.insert(max(0, min(position, len(result))), operation.block)
+        elif isinstance(operation, UpdateBlockOperation):
+            block = result[index_of(operation.block_id)]
+            if "name" in operation.model_fields_set:
+                block.name = operation.name
+            for key, value in operation.config.items():
+                if value is None:
+                    block.config.pop(key, None)
+                else:
+                    block.config[key] = value
+        elif isinstance(operation, DeleteBlockOperation):
+            result.pop(index_of(operation.block_id))
+        elif isinstance(operation, MoveBlockOperation):
+            block = result.pop(index_of(operation.block_id))
+            result.insert(max(0, min(operation.position, len(result))), block)
+
+    for order, block in enumerate(result, start=1):
+        block.order = order
+    return result
@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+from beanie import init_beanie
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.db import get_connection_string
+from app.models import BlockContent, RunbookVersion
+from app.services.versions import blocks_content_hash, store_blocks
+
+
+async def run_migration():
+    """
+    Moves blocks embedded in runbook versions into the content-addressed
+    block store, leaving each version with an ordered list of block hashes.
+    """
+    load_dotenv()
+    client = AsyncIOMotorClient(get_connection_string(), uuidRepresentation="standard")
+    await init_beanie(
+        database=client[os.getenv("DB_NAME")],
+        document_models=[RunbookVersion, BlockContent],
+    )
+
+    print("Finding runbook versions with embedded blocks...")
+    query = RunbookVersion.find({"blocks.0": {"$exists": True}})
+    total = await query.count()
+
+    if not total:
+        print("No versions to migrate. Database is already up to date.")
+        return
+
+    print(f"Found {total} versions to migrate.")
+
+    async for version in query:
+        version.block_refs = await store_blocks(version.blocks)
+        version.content_hash = version.content_hash or blocks_content_hash(
+            version.blocks
+        )
+        version.blocks = []
+        await version.save()
+        print(f"Migrated version {version.version_number} of runbook {version.runbook_id}")
+
+    print(f"Migration complete. {await BlockContent.count()} unique blocks stored.")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_migration())
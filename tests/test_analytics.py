@@ -0,0 +1,147 @@
+# ruff: noqa: E402
+import sys
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from uuid import UUID, uuid4
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db as db
+from app.main import app
+from app.models import ExecutionJob, ExecutionRollup, ExecutionStep
+from app.services.analytics import percentile, rebuild_rollups
+from app.services.execution import set_job_status
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "analyticsdb")
+    yield
+
+
+async def _finish_job(runbook_id, block_ids, seconds, status):
+    """Records a finished job whose steps each took `seconds`."""
+    now = datetime.now(UTC)
+    job = ExecutionJob(
+        runbook_id=runbook_id,
+        version_id=uuid4(),
+        status="running",
+        start_time=now - timedelta(seconds=seconds * len(block_ids)),
+    )
+    await job.insert()
+    for i, block_id in enumerate(block_ids):
+        step = ExecutionStep(
+            job_id=job.id,
+            block_id=block_id,
+            status="error" if status == "failed" and i == len(block_ids) - 1 else "success",
+            output="",
+            exit_code=0,
+            timestamp=now - timedelta(seconds=seconds),
+        )
+        await step.insert()
+    await set_job_status(job, status)
+    return job
+
+
+def test_percentile_uses_bucket_bounds():
+    assert percentile({"100": 9, "1000": 1}, 800, 0.5) == 100
+    assert percentile({"100": 9, "1000": 1}, 800, 0.95) == 800
+    assert percentile({}, 0, 0.5) is None
+
+
+def test_runbook_and_fleet_analytics(client_headers):
+    client, headers = client_headers
+    runbook = client.post(
+        "/runbooks",
+        headers=headers,
+        json={"title": "RB", "description": "d", "blocks": []},
+    ).json()
+    runbook_id = runbook["id"]
+    fast, slow = uuid4(), uuid4()
+    for status in ("completed", "completed", "failed"):
+        client.portal.call(_finish_job, UUID(runbook_id), [fast, slow], 2, status)
+    # A job in another runbook only shows up in the fleet summary.
+    client.portal.call(_finish_job, uuid4(), [uuid4()], 1, "completed")
+
+    resp = client.get(f"/analytics/runbooks/{runbook_id}", headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert (data["jobs"], data["succeeded"], data["failed"]) == (3, 2, 1)
+    assert data["success_rate"] == pytest.approx(2 / 3)
+    assert 3000 < data["p50_ms"] <= 5000
+    assert len(data["series"]) == 1
+    # The block that failed is listed first.
+    assert data["blocks"][0]["block_id"] == str(slow)
+    assert data["blocks"][0]["failures"] == 1
+    assert data["blocks"][1]["runs"] == 3
+
+    resp = client.get("/analytics/summary", headers=headers, params={"granularity": "hour"})
+    data = resp.json()
+    assert data["jobs"] == 4
+    assert data["hotspots"] == [
+        {"runbook_id": runbook_id, "jobs": 3, "failed": 1, "failure_rate": pytest.approx(1 / 3)}
+    ]
+
+    # Hourly and daily documents for each runbook and for the fleet.
+    assert client.portal.call(ExecutionRollup.count) == 6
+
+    resp = client.get(f"/analytics/runbooks/{uuid4()}", headers=headers)
+    assert resp.status_code == 404
+
+
+def _rounded(value):
+    """Durations are summed in a different order when rebuilt."""
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items()}
+    return round(value, 6) if isinstance(value, float) else value
+
+
+async def _rollup_figures():
+    return {
+        rollup.id: _rounded(rollup.model_dump(exclude={"revision_id"}))
+        for rollup in await ExecutionRollup.find_all().to_list()
+    }
+
+
+def test_rebuilt_rollups_match_live_ones(client_headers):
+    client, headers = client_headers
+    runbook_id = client.post(
+        "/runbooks",
+        headers=headers,
+        json={"title": "RB", "description": "d", "blocks": []},
+    ).json()["id"]
+    block = {"type": "instruction", "config": {"text": "read me"}, "order": 1}
+    for _ in range(2):
+        resp = client.post(
+            "/blocks/execute",
+            headers=headers,
+            json={"block": block, "runbook_id": runbook_id},
+        )
+        assert resp.status_code == 200
+    client.portal.call(_finish_job, UUID(runbook_id), [uuid4()], 1, "completed")
+    client.portal.call(_finish_job, UUID(runbook_id), [uuid4()], 1, "failed")
+
+    live = client.portal.call(_rollup_figures)
+    resp = client.get(f"/analytics/runbooks/{runbook_id}", headers=headers)
+    assert resp.json()["jobs"] == 4
+
+    assert client.portal.call(rebuild_rollups) == 4
+    assert client.portal.call(_rollup_figures) == live
+
+
+@pytest.fixture
+def client_headers():
+    with TestClient(app) as client:
+        token = client.post(
+            "/users/signup",
+            json={"username": "analyst", "password": "pw", "role": "sre"},
+        ).json()["api_key"]
+        yield client, {"X-API-KEY": token}
@@ -1,6 +1,12 @@
 # ruff: noqa: E402
+import asyncio
+import csv
+import io
+import json
 import sys
+from datetime import datetime, timedelta, UTC
 from pathlib import Path
+from uuid import uuid4
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
@@ -9,8 +15,9 @@ from fastapi.testclient import TestClient
 from mongomock_motor import AsyncMongoMockClient
 
 import app.db as db
-from app.main import app
+from app.main import app, document_models
 from app.models import AuditLog
+from app.services.audit import AuditWriter
 
 
 @pytest.fixture(autouse=True)
@@ -48,6 +55,9 @@ async def test_runbook_creation_is_audited(client: TestClient, sre_token: str):
         headers=headers,
         json={"title": "Audited Runbook", "description": "d1", "blocks": []},
     )
+    # Entries are written behind the request; querying the audit API
+    # waits for pending ones.
+    client.get("/audit", headers=headers)
 
     log = await AuditLog.find_one(AuditLog.action == "create_runbook")
     assert log is not None
@@ -89,3 +99,139 @@ async def test_get_audit_logs(client: TestClient, sre_token: str):
     assert resp.status_code == 200
     logs = resp.json()
     assert len(logs) == 3  # All actions were on this runbook
+
+
+@pytest.mark.asyncio
+async def test_audit_logs_keyset_pagination(client: TestClient, sre_token: str):
+    headers = {"X-API-KEY": sre_token}
+    base = datetime(2026, 1, 1, tzinfo=UTC)
+    runbook_id = uuid4()
+    # Five entries, two of which share a timestamp.
+    for minutes in (0, 1, 2, 2, 3):
+        await AuditLog(
+            timestamp=base + timedelta(minutes=minutes),
+            user_id=uuid4(),
+            action="update_runbook",
+            target_id=runbook_id,
+        ).insert()
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"target_id": str(runbook_id), "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        resp = client.get("/audit", headers=headers, params=params)
+        assert resp.status_code == 200
+        seen += [log["_id"] for log in resp.json()]
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 5
+
+    resp = client.get(
+        "/audit",
+        headers=headers,
+        params={
+            "target_id": str(runbook_id),
+            "start": (base + timedelta(minutes=1)).isoformat(),
+            "end": (base + timedelta(minutes=3)).isoformat(),
+        },
+    )
+    assert len(resp.json()) == 3
+    assert "X-Next-Cursor" not in resp.headers
+
+    resp = client.get("/audit", headers=headers, params={"cursor": "garbage"})
+    assert resp.status_code == 400
+
+
+def test_audit_export_streams_ndjson_and_csv(client: TestClient, sre_token: str):
+    headers = {"X-API-KEY": sre_token}
+    for title in ("One", "Two"):
+        client.post(
+            "/runbooks",
+            headers=headers,
+            json={"title": title, "description": "d", "blocks": []},
+        )
+
+    resp = client.get("/audit/export", headers=headers)
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["details"]["title"] for line in lines] == ["Two", "One"]
+
+    resp = client.get(
+        "/audit/export",
+        headers=headers,
+        params={"format": "csv", "action": "create_runbook"},
+    )
+    assert resp.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(resp.text)))
+    assert rows[0] == ["id", "timestamp", "user_id", "action", "target_id", "details"]
+    assert len(rows) == 3
+    assert json.loads(rows[1][5]) == {"title": "Two"}
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_batches_and_spills(tmp_path):
+    await db.create_init_beanie(document_models)()
+    spill_path = tmp_path / "spill.ndjson"
+    writer = AuditWriter(
+        queue_size=2,
+        batch_size=10,
+        flush_interval=60,
+        overflow_policy="spill",
+        spill_path=str(spill_path),
+    )
+    await writer.start()
+
+    entries = [
+        AuditLog(user_id=uuid4(), action="test", target_id=uuid4()) for _ in range(3)
+    ]
+    for entry in entries:
+        await writer.submit(entry)
+    # The third entry did not fit in the queue and went to the spill file.
+    assert len(spill_path.read_text().splitlines()) == 1
+    assert await AuditLog.find(AuditLog.action == "test").count() == 0
+
+    await writer.flush()
+    assert await AuditLog.find(AuditLog.action == "test").count() == 2
+
+    await writer.stop()
+    await writer.start()
+    assert not spill_path.exists()
+    assert await AuditLog.find(AuditLog.action == "test").count() == 3
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_audit_flush_waits_only_for_earlier_entries(tmp_path):
+    await db.create_init_beanie(document_models)()
+    writer = AuditWriter(
+        queue_size=10,
+        batch_size=10,
+        flush_interval=60,
+        overflow_policy="block",
+        spill_path=str(tmp_path / "spill.ndjson"),
+    )
+    await writer.start()
+    written = []
+    release = asyncio.Event()
+
+    async def write(batch):
+        # The first batch waits to be released; later ones never finish.
+        if written:
+            await asyncio.Event().wait()
+        await release.wait()
+        written.append(batch)
+
+    writer._write = write
+    await writer.submit(AuditLog(user_id=uuid4(), action="early", target_id=uuid4()))
+    flush = asyncio.create_task(writer.flush())
+    await asyncio.sleep(0.01)
+    await writer.submit(AuditLog(user_id=uuid4(), action="late", target_id=uuid4()))
+    assert await writer.flush(timeout=0.01) is False
+
+    release.set()
+    assert await asyncio.wait_for(flush, 1) is True
+    assert [entry.action for entry in written[0]] == ["early"]
+    writer.task.cancel()
@@ -7,9 +7,12 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 import pytest
 from fastapi.testclient import TestClient
 from mongomock_motor import AsyncMongoMockClient
+from prometheus_client import REGISTRY
 
 import app.db as db
 from app.main import app
+from app.models import User
+from app.services import passwords
 
 
 @pytest.fixture(autouse=True)
@@ -63,3 +66,114 @@ def test_missing_api_key_unauthorized():
         # Attempt to access protected route without API key
         resp = client.get("/protected")
         assert resp.status_code == 401
+
+
+def _lookups(result):
+    return REGISTRY.get_sample_value("auth_cache_lookups_total", {"result": result}) or 0
+
+
+def test_api_key_lookups_are_cached():
+    with TestClient(app) as client:
+        resp = client.post(
+            "/users/signup",
+            json={"username": "carol", "password": "pw", "role": "sre"},
+        )
+        api_key = resp.json()["api_key"]
+
+        assert client.get("/protected", headers={"X-API-KEY": api_key}).status_code == 200
+        hits = _lookups("hit")
+        assert client.get("/protected", headers={"X-API-KEY": api_key}).status_code == 200
+        assert _lookups("hit") == hits + 1
+
+        # A key that matched no user is remembered as invalid.
+        assert client.get("/protected", headers={"X-API-KEY": "nope"}).status_code == 401
+        negative_hits = _lookups("negative_hit")
+        assert client.get("/protected", headers={"X-API-KEY": "nope"}).status_code == 401
+        assert _lookups("negative_hit") == negative_hits + 1
+
+
+def test_role_change_invalidates_cached_user():
+    with TestClient(app) as client:
+        resp = client.post(
+            "/users/signup",
+            json={"username": "dave", "password": "pw", "role": "sre"},
+        )
+        api_key = resp.json()["api_key"]
+        assert client.get("/protected", headers={"X-API-KEY": api_key}).status_code == 200
+
+        async def demote():
+            user = await User.find_one(User.username == "dave")
+            user.role = "developer"
+            await user.save()
+
+        client.portal.call(demote)
+        assert client.get("/protected", headers={"X-API-KEY": api_key}).status_code == 403
+
+
+def test_passwords_are_hashed_and_rehashed_on_login():
+    with TestClient(app) as client:
+        client.post(
+            "/users/signup",
+            json={"username": "erin", "password": "pw", "role": "sre"},
+        )
+        user = client.portal.call(User.find_one, User.username == "erin")
+        assert user.password.startswith("scrypt$")
+        assert client.post(
+            "/users/login", json={"username": "erin", "password": "wrong"}
+        ).status_code == 401
+
+        # An account from before hashing still logs in, and is upgraded.
+        async def store_plaintext():
+            user.password = "pw"
+            await user.save()
+
+        client.portal.call(store_plaintext)
+        resp = client.post("/users/login", json={"username": "erin", "password": "pw"})
+        assert resp.status_code == 200
+        user = client.portal.call(User.find_one, User.username == "erin")
+        assert user.password.startswith("scrypt$")
+
+
+def test_plaintext_password_shaped_like_a_hash_logs_in():
+    with TestClient(app) as client:
+        client.post(
+            "/users/signup",
+            json={"username": "frank", "password": "pw", "role": "sre"},
+        )
+        user = client.portal.call(User.find_one, User.username == "frank")
+        legacy = "scrypt$a$b$c$d$e"
+
+        async def store_plaintext():
+            user.password = legacy
+            await user.save()
+
+        client.portal.call(store_plaintext)
+        assert client.post(
+            "/users/login", json={"username": "frank", "password": "pw"}
+        ).status_code == 401
+        resp = client.post("/users/login", json={"username": "frank", "password": legacy})
+        assert resp.status_code == 200
+        user = client.portal.call(User.find_one, User.username == "frank")
+        assert user.password != legacy
+
+
+def test_unknown_username_still_checks_a_password(monkeypatch):
+    checked = []
+    verify = passwords.verify_password_sync
+
+    def counting_verify(password, stored):
+        checked.append(stored)
+        return verify(password, stored)
+
+    monkeypatch.setattr(passwords, "verify_password_sync", counting_verify)
+    with TestClient(app) as client:
+        resp = client.post("/users/login", json={"username": "nobody", "password": "pw"})
+        assert resp.status_code == 401
+    assert len(checked) == 1 and checked[0].startswith("scrypt$")
+
+
+def test_needs_rehash_when_cost_changes():
+    stored = passwords.hash_password_sync("pw", passwords.HashParams(n=2**10))
+    assert passwords.verify_password_sync("pw", stored)
+    assert not passwords.needs_rehash(stored, passwords.HashParams(n=2**10))
+    assert passwords.needs_rehash(stored, passwords.HashParams(n=2**11))
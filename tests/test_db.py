@@ -4,7 +4,14 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+import asyncio
+from types import SimpleNamespace
+
+from loguru import logger
+from prometheus_client import REGISTRY
+
 from app.db import get_connection_string
+from app.services.db_metrics import CommandMetricsListener, command_shape
 
 
 def test_get_connection_string_uses_full_connection(monkeypatch):
@@ -18,3 +25,91 @@ def test_get_connection_string_builds_from_parts(monkeypatch):
     monkeypatch.setenv("DB_PASSWORD", "p")
     monkeypatch.setenv("DB_HOST", "db")
     assert get_connection_string() == "mongodb://u:p@db"
+
+
+def command_events(name, command, duration_micros, request_id=1):
+    started = SimpleNamespace(
+        command_name=name,
+        command=command,
+        database_name="testdb",
+        connection_id=("db", 27017),
+        request_id=request_id,
+    )
+    finished = SimpleNamespace(
+        command_name=name,
+        connection_id=("db", 27017),
+        request_id=request_id,
+        duration_micros=duration_micros,
+    )
+    return started, finished
+
+
+def test_filter_shape_hides_values():
+    command = {
+        "update": "execution_jobs",
+        "updates": [{"q": {"status": "pending", "_id": {"$in": [1, 2, 3]}}, "u": {}}],
+    }
+    assert command_shape("update", command) == {"status": "?", "_id": {"$in": ["?"]}}
+    pipeline = {
+        "aggregate": "audit_logs",
+        "pipeline": [{"$match": {"user_id": "x"}}, {"$group": {"_id": "$action"}}],
+    }
+    assert command_shape("aggregate", pipeline) == [
+        {"$match": {"user_id": "?"}},
+        {"$group": "..."},
+    ]
+
+
+def test_listener_observes_latency_and_logs_slow_commands():
+    listener = CommandMetricsListener(slow_ms=50, explain_sample_rate=0)
+    labels = {"collection": "runbooks", "command": "find"}
+    before = REGISTRY.get_sample_value("mongodb_command_duration_seconds_count", labels) or 0
+    messages = []
+    sink = logger.add(messages.append, level="WARNING")
+    try:
+        fast = command_events("find", {"find": "runbooks", "filter": {"title": "a"}}, 2000, 1)
+        slow = command_events("find", {"find": "runbooks", "filter": {"title": "b"}}, 80000, 2)
+        for started, finished in (fast, slow):
+            listener.started(started)
+            listener.succeeded(finished)
+    finally:
+        logger.remove(sink)
+
+    after = REGISTRY.get_sample_value("mongodb_command_duration_seconds_count", labels)
+    assert after - before == 2
+    assert len(messages) == 1
+    extra = messages[0].record["extra"]
+    assert extra["collection"] == "runbooks"
+    assert extra["duration_ms"] == 80.0
+    assert extra["filter_shape"] == {"title": "?"}
+
+
+def test_listener_explains_each_slow_shape_once():
+    explained = []
+
+    class FakeDatabase:
+        async def command(self, command):
+            explained.append(command)
+            return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+    async def run():
+        listener = CommandMetricsListener(slow_ms=10, explain_sample_rate=1)
+        listener.bind({"testdb": FakeDatabase()}, asyncio.get_running_loop())
+        for request_id, title in enumerate(["a", "b"]):
+            started, finished = command_events(
+                "find",
+                {"find": "runbooks", "filter": {"title": title}, "lsid": {}, "$db": "testdb"},
+                500000,
+                request_id,
+            )
+            listener.started(started)
+            listener.succeeded(finished)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert explained == [
+        {
+            "explain": {"find": "runbooks", "filter": {"title": "a"}},
+            "verbosity": "queryPlanner",
+        }
+    ]
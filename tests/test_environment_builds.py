@@ -0,0 +1,216 @@
+# ruff: noqa: E402
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db as db
+from app.main import app
+from app.services import builds
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "testdb")
+    monkeypatch.setattr(builds, "BUILD_LOG_FLUSH_INTERVAL", 0.01)
+    yield
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def headers(client: TestClient):
+    resp = client.post(
+        "/users/signup",
+        json={"username": "sre_user", "password": "pw", "role": "sre"},
+    )
+    return {"X-API-KEY": resp.json()["api_key"]}
+
+
+def wait_for_status(client, headers, environment_id, statuses=("ready", "failed")):
+    for _ in range(200):
+        environment = client.get(f"/environments/{environment_id}", headers=headers).json()
+        if environment["status"] in statuses:
+            return environment
+        time.sleep(0.01)
+    raise AssertionError(f"environment stuck in {environment['status']}")
+
+
+def fake_build(dockerfile, tag, emit):
+    for line in dockerfile.splitlines():
+        emit(f"Step: {line}")
+    if "FAIL" in dockerfile:
+        raise builds.BuildFailed("command returned a non-zero code")
+    return tag
+
+
+def test_build_runs_in_background_and_streams_logs(client, headers, monkeypatch):
+    release = threading.Event()
+
+    def slow_build(dockerfile, tag, emit):
+        release.wait(5)
+        return fake_build(dockerfile, tag, emit)
+
+    monkeypatch.setattr(builds, "docker_build", slow_build)
+    resp = client.post(
+        "/environments",
+        headers=headers,
+        json={"name": "py", "description": "d", "dockerfile": "FROM python\nRUN true"},
+    )
+    assert resp.status_code == 201
+    environment = resp.json()
+    environment_id = environment["id"]
+    # The request returns before the build finishes.
+    assert environment["status"] == "queued"
+    assert environment["image_tag"] is None
+
+    release.set()
+    environment = wait_for_status(client, headers, environment_id)
+    assert environment["status"] == "ready"
+    assert environment["image_tag"].startswith("runbook-exec-env:")
+
+    resp = client.get(f"/environments/{environment_id}/build/logs", headers=headers)
+    assert resp.text == "Step: FROM python\nStep: RUN true\n"
+    resp = client.get(f"/environments/{environment_id}/build/logs?offset=1", headers=headers)
+    assert resp.text == "Step: RUN true\n"
+
+
+def test_failed_rebuild_keeps_previous_image(client, headers, monkeypatch):
+    monkeypatch.setattr(builds, "docker_build", fake_build)
+    environment_id = client.post(
+        "/environments",
+        headers=headers,
+        json={"name": "py", "description": "d", "dockerfile": "FROM python"},
+    ).json()["id"]
+    environment = wait_for_status(client, headers, environment_id)
+
+    resp = client.put(
+        f"/environments/{environment_id}",
+        headers=headers,
+        json={"name": "py", "description": "d", "dockerfile": "FROM python\nRUN FAIL"},
+    )
+    assert resp.json()["status"] == "queued"
+    failed = wait_for_status(client, headers, environment_id)
+    assert failed["status"] == "failed"
+    assert "non-zero code" in failed["build_error"]
+    assert failed["image_tag"] == environment["image_tag"]
+    assert failed["dockerfile"] == "FROM python"
+
+    resp = client.get(f"/environments/{environment_id}/build/logs", headers=headers)
+    assert resp.text.endswith("ERROR: Docker build failed: command returned a non-zero code\n")
+
+
+def test_builds_wait_for_a_free_slot(client, headers, monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def blocking_build(dockerfile, tag, emit):
+        started.append(tag)
+        release.wait(5)
+        return tag
+
+    monkeypatch.setattr(builds, "docker_build", blocking_build)
+    monkeypatch.setattr(builds.build_manager, "concurrency", 1)
+    monkeypatch.setattr(builds.build_manager, "_slots", None)
+    ids = [
+        client.post(
+            "/environments",
+            headers=headers,
+            json={"name": f"env{i}", "description": "d", "dockerfile": f"FROM alpine:3.{i}"},
+        ).json()["id"]
+        for i in range(2)
+    ]
+    wait_for_status(client, headers, ids[0], ("building",))
+    time.sleep(0.05)
+    assert len(started) == 1
+    assert client.get(f"/environments/{ids[1]}", headers=headers).json()["status"] == "queued"
+
+    release.set()
+    for environment_id in ids:
+        assert wait_for_status(client, headers, environment_id)["status"] == "ready"
+    monkeypatch.setattr(builds.build_manager, "_slots", None)
+
+
+def test_identical_dockerfiles_share_one_image(client, headers, monkeypatch):
+    built, removed = [], []
+
+    def counting_build(dockerfile, tag, emit):
+        built.append(tag)
+        return tag
+
+    monkeypatch.setattr(builds, "docker_build", counting_build)
+    monkeypatch.setattr(builds, "remove_image", removed.append)
+    first = client.post(
+        "/environments",
+        headers=headers,
+        json={"name": "a", "description": "d", "dockerfile": "FROM python\nrun pip install x"},
+    ).json()
+    first = wait_for_status(client, headers, first["id"])
+
+    # Comments, blank lines and keyword case do not change the image.
+    resp = client.post(
+        "/environments",
+        headers=headers,
+        json={
+            "name": "b",
+            "description": "d",
+            "dockerfile": "# team b\nFROM python\n\nRUN pip install x  \n",
+        },
+    )
+    second = resp.json()
+    assert second["status"] == "ready"
+    assert second["image_tag"] == first["image_tag"]
+    assert len(built) == 1
+
+    client.delete(f"/environments/{first['_id']}", headers=headers)
+    assert removed == []
+    client.delete(f"/environments/{second['id']}", headers=headers)
+    assert removed == [second["image_tag"]]
+
+
+def test_normalize_dockerfile_keeps_directives_and_continuations():
+    dockerfile = "# syntax = docker/dockerfile:1\n# comment\nfrom alpine\nrun apk add \\\n    curl\n"
+    assert builds.normalize_dockerfile(dockerfile) == (
+        "#syntax=docker/dockerfile:1\nFROM alpine\nRUN apk add \\\ncurl"
+    )
+
+
+def test_heredoc_bodies_are_hashed_as_written():
+    def dockerfile(body):
+        return (
+            "FROM alpine\n"
+            f"COPY <<CONF /etc/app.conf\n{body}\nCONF\n"
+            "run <<-EOF\n\techo ready\n\tEOF\n"
+            "# trailing comment\n"
+        )
+
+    plain = dockerfile("# listen on all interfaces\nhost = 0.0.0.0")
+    assert builds.normalize_dockerfile(plain) == (
+        "FROM alpine\nCOPY <<CONF /etc/app.conf\n# listen on all interfaces\n"
+        "host = 0.0.0.0\nCONF\nRUN <<-EOF\n\techo ready\n\tEOF"
+    )
+    for changed in (
+        "host = 0.0.0.0",
+        "# Listen on all interfaces\nhost = 0.0.0.0",
+        "# listen on all interfaces\n\nhost = 0.0.0.0",
+        "# listen on all interfaces\nHOST = 0.0.0.0",
+    ):
+        assert builds.dockerfile_hash(dockerfile(changed)) != builds.dockerfile_hash(plain)
+    # Outside the bodies, case and comments still do not matter.
+    assert builds.dockerfile_hash(plain.replace("run", "RUN")) == builds.dockerfile_hash(
+        "# header\n" + plain
+    )
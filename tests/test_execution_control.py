@@ -2,7 +2,7 @@
 import asyncio
 import sys
 from pathlib import Path
-from uuid import UUID
+from uuid import UUID, uuid4
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
@@ -13,7 +13,7 @@ from mongomock_motor import AsyncMongoMockClient
 
 import app.db as db
 from app.main import app
-from app.models import ExecutionJob, Runbook, RunbookVersion, Block
+from app.models import ExecutionJob, ExecutionStep, Runbook, RunbookVersion, Block
 
 
 @pytest.fixture(autouse=True)
@@ -126,3 +126,113 @@ async def test_stop_completed_job(
         json={"action": "stop"},
     )
     assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_execution_status_incremental(
+    client: TestClient, sre_token: str, pending_job: ExecutionJob
+):
+    pending_job.status = "running"
+    await pending_job.save()
+    step = ExecutionStep(
+        job_id=pending_job.id,
+        block_id=uuid4(),
+        status="running",
+        output="line 1\n",
+        exit_code=-1,
+    )
+    await step.insert()
+
+    headers = {"X-API-KEY": sre_token}
+    resp = client.get(f"/executions/{pending_job.id}", headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["steps"][0]["output"] == "line 1\n"
+    cursor = data["cursor"]
+    etag = resp.headers["ETag"]
+
+    # Nothing changed: the same poll is answered with 304.
+    resp = client.get(
+        f"/executions/{pending_job.id}",
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert resp.status_code == 304
+
+    step.output += "line 2\n"
+    await step.save()
+
+    resp = client.get(
+        f"/executions/{pending_job.id}",
+        headers=headers,
+        params={"since": cursor, "offsets": f"{step.id}:7"},
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert len(data["steps"]) == 1
+    assert data["steps"][0]["output"] == "line 2\n"
+    assert data["steps"][0]["output_offset"] == 7
+
+
+def test_get_execution_status_invalid_offsets(client: TestClient, sre_token: str):
+    headers = {"X-API-KEY": sre_token}
+    resp = client.get(
+        f"/executions/{uuid4()}", headers=headers, params={"offsets": "nope"}
+    )
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_finished_job_is_served_from_cache(
+    client: TestClient, sre_token: str, pending_job: ExecutionJob
+):
+    pending_job.status = "completed"
+    await pending_job.save()
+
+    headers = {"X-API-KEY": sre_token}
+    resp = client.get(f"/executions/{pending_job.id}", headers=headers)
+    assert resp.status_code == 200
+    assert "immutable" in resp.headers["Cache-Control"]
+    etag = resp.headers["ETag"]
+
+    # Served without the database once cached.
+    await pending_job.delete()
+    resp = client.get(
+        f"/executions/{pending_job.id}",
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert resp.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_stopped_job_is_not_cached_while_its_worker_runs(
+    client: TestClient, sre_token: str, pending_job: ExecutionJob
+):
+    pending_job.status = "failed"
+    pending_job.worker_active = True
+    await pending_job.save()
+
+    headers = {"X-API-KEY": sre_token}
+    resp = client.get(f"/executions/{pending_job.id}", headers=headers)
+    assert resp.status_code == 200
+    assert "immutable" not in resp.headers.get("Cache-Control", "")
+
+    pending_job.worker_active = False
+    await pending_job.save()
+    resp = client.get(f"/executions/{pending_job.id}", headers=headers)
+    assert "immutable" in resp.headers["Cache-Control"]
+
+
+@pytest.mark.asyncio
+async def test_get_execution_timeline(
+    client: TestClient, sre_token: str, pending_job: ExecutionJob
+):
+    headers = {"X-API-KEY": sre_token}
+    resp = client.get(f"/executions/{pending_job.id}/timeline", headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["status"] == "pending"
+    assert data["started_at"] is None
+    assert data["steps"] == []
+
+    resp = client.get(f"/executions/{uuid4()}/timeline", headers=headers)
+    assert resp.status_code == 404
@@ -0,0 +1,118 @@
+# ruff: noqa: E402
+import asyncio
+import sys
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db as db
+from app.main import app
+from app.models import ExecutionJob, ExecutionStep
+from app.services.events import ExecutionEventHub
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "testdb")
+    monkeypatch.setenv("SECRET_KEY", "870STvCfnd0oNi-TeWJM6986M9Rfm26zbnIgTOKwDLw=")
+    yield
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def sre_token(client: TestClient) -> str:
+    resp = client.post(
+        "/users/signup",
+        json={"username": "sre_user", "password": "pw", "role": "sre"},
+    )
+    assert resp.status_code == 201
+    return resp.json()["api_key"]
+
+
+async def collect(hub: ExecutionEventHub, job_id, last_seq=None):
+    return [event async for event in hub.subscribe(job_id, last_seq)]
+
+
+@pytest.mark.asyncio
+async def test_local_events_fan_out_to_all_subscribers(client: TestClient):
+    hub = ExecutionEventHub()
+    job = ExecutionJob(runbook_id=uuid4(), version_id=uuid4(), status="running")
+    await job.insert()
+
+    viewers = [asyncio.create_task(collect(hub, job.id)) for _ in range(3)]
+    await asyncio.sleep(0.05)
+
+    step = ExecutionStep(
+        job_id=job.id, block_id=uuid4(), status="running", output="", exit_code=-1
+    )
+    hub.publish_step(step)
+    step.output = "hello"
+    step.status = "success"
+    hub.publish_step(step, "")
+    job.status = "completed"
+    hub.publish_status(job)
+
+    results = await asyncio.wait_for(asyncio.gather(*viewers), timeout=2)
+    assert len(hub.channels) == 0
+    for events in results:
+        assert events[0].type == "snapshot"
+        assert [e.type for e in events[1:]] == ["step", "step", "output", "status"]
+        assert events[3].data["chunk"] == "hello"
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_buffered_events(client: TestClient):
+    hub = ExecutionEventHub()
+    job = ExecutionJob(runbook_id=uuid4(), version_id=uuid4(), status="running")
+    await job.insert()
+
+    step = ExecutionStep(
+        job_id=job.id, block_id=uuid4(), status="running", output="", exit_code=-1
+    )
+    hub.publish_step(step)  # seq 1
+    step.output = "partial"
+    hub.publish_step(step, "")  # seq 2 (step), seq 3 (output)
+    job.status = "failed"
+
+    resumed = asyncio.create_task(collect(hub, job.id, last_seq=1))
+    await asyncio.sleep(0.05)
+    hub.publish_status(job)
+
+    events = await asyncio.wait_for(resumed, timeout=2)
+    assert [e.seq for e in events] == [2, 3, 4]
+    assert events[-1].data == {"status": "failed"}
+
+
+def test_stream_finished_job_sends_snapshot(client: TestClient, sre_token: str):
+    async def setup():
+        job = ExecutionJob(runbook_id=uuid4(), version_id=uuid4(), status="completed")
+        await job.insert()
+        await ExecutionStep(
+            job_id=job.id, block_id=uuid4(), status="success", output="done", exit_code=0
+        ).insert()
+        return job
+
+    job = client.portal.call(setup)
+    headers = {"X-API-KEY": sre_token}
+    resp = client.get(f"/executions/{job.id}/events", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    assert "event: snapshot" in resp.text
+    assert '"output": "done"' in resp.text
+
+    resp = client.get(f"/executions/{uuid4()}/events", headers=headers)
+    assert resp.status_code == 404
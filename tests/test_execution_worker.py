@@ -8,17 +8,20 @@ from uuid import uuid4
 import httpx
 import pytest
 from mongomock_motor import AsyncMongoMockClient
+from prometheus_client import REGISTRY
 
 import app.db as db
 from app.models import (
     ExecutionJob,
+    ExecutionRollup,
     Runbook,
     RunbookVersion,
     Block,
     ExecutionStep,
     Credential,
 )
-from app.services.execution import run_job
+from app.services.execution import run_job, sample_queue_depth, set_job_status
+from app.services.timing import build_timeline
 from app.security import encrypt_secret
 
 
@@ -352,3 +355,124 @@ async def test_run_timer_block(mock_sleep):
     assert steps[0].status == "success"
     assert "Pausing for 5 seconds" in steps[0].output
     mock_sleep.assert_called_once_with(5)
+
+
+@pytest.mark.asyncio
+async def test_run_job_records_timing():
+    runbook = Runbook(title="Timed RB", description="d", created_by=uuid4())
+    await runbook.insert()
+    fast = Block(name="fast", type="timer", config={"duration": 0}, order=1)
+    slow = Block(name="slow", type="timer", config={"duration": 0.05}, order=2)
+    version = RunbookVersion(runbook_id=runbook.id, version_number=1, blocks=[fast, slow])
+    await version.insert()
+    job = ExecutionJob(runbook_id=runbook.id, version_id=version.id, status="pending")
+    await job.insert()
+
+    await run_job(job)
+
+    job = await ExecutionJob.get(job.id)
+    assert job.status == "completed"
+    assert job.started_at is not None and job.finished_at is not None
+    assert job.end_time is not None
+    assert job.queue_wait_ms >= 0
+    steps = await ExecutionStep.find(ExecutionStep.job_id == job.id).to_list()
+    assert all(step.finished_at is not None for step in steps)
+
+    timeline = build_timeline(job, steps, [fast, slow])
+    assert [s.block_name for s in timeline.steps] == ["fast", "slow"]
+    assert timeline.steps[1].duration_ms >= 50
+    assert timeline.steps[1].offset_ms >= timeline.steps[0].offset_ms
+    assert timeline.duration_ms >= timeline.steps[1].duration_ms
+    assert timeline.steps[1].slowest
+    assert 0 < timeline.steps[1].share <= 1
+
+
+def _sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+@pytest.mark.asyncio
+async def test_run_job_exports_engine_metrics():
+    runbook = Runbook(title="Metrics RB", description="d", created_by=uuid4())
+    await runbook.insert()
+    version = RunbookVersion(
+        runbook_id=runbook.id,
+        version_number=1,
+        blocks=[
+            Block(type="instruction", config={"text": "read me"}, order=1),
+            Block(type="command", config={"command": "exit 3"}, order=2),
+        ],
+    )
+    await version.insert()
+    job = ExecutionJob(runbook_id=runbook.id, version_id=version.id, status="pending")
+    await job.insert()
+    await ExecutionJob(runbook_id=runbook.id, version_id=version.id, status="pending").insert()
+
+    await sample_queue_depth()
+    assert _sample("execution_jobs", {"status": "pending"}) == 2
+
+    waits = _sample("execution_queue_wait_seconds_count")
+    failed_commands = _sample(
+        "execution_block_duration_seconds_count",
+        {"block_type": "command", "outcome": "error"},
+    )
+    failed_jobs = _sample("execution_job_duration_seconds_count", {"status": "failed"})
+    await run_job(job)
+
+    assert _sample("execution_queue_wait_seconds_count") == waits + 1
+    assert _sample(
+        "execution_job_duration_seconds_count", {"status": "failed"}
+    ) == failed_jobs + 1
+    assert _sample(
+        "execution_block_duration_seconds_count",
+        {"block_type": "command", "outcome": "error"},
+    ) == failed_commands + 1
+    assert _sample("execution_resources_in_use", {"resource": "subprocess"}) == 0
+    await sample_queue_depth()
+    assert _sample("execution_jobs", {"status": "pending"}) == 1
+
+
+@pytest.mark.asyncio
+async def test_job_stopped_mid_block_stays_failed():
+    runbook = Runbook(title="Stopped RB", description="d", created_by=uuid4())
+    await runbook.insert()
+    version = RunbookVersion(
+        runbook_id=runbook.id,
+        version_number=1,
+        blocks=[Block(type="command", config={"command": "sleep 60"}, order=1)],
+    )
+    await version.insert()
+    job = ExecutionJob(runbook_id=runbook.id, version_id=version.id, status="pending")
+    await job.insert()
+    seen_while_running = []
+
+    async def stop_during_block():
+        # The stop control runs while the worker waits on the command.
+        stopped = await ExecutionJob.get(job.id)
+        assert await set_job_status(stopped, "failed")
+        seen_while_running.append(await ExecutionJob.get(job.id))
+        return (b"done", b"")
+
+    completed = _sample(
+        "execution_job_duration_seconds_count", {"status": "completed"}
+    )
+    with patch("asyncio.create_subprocess_shell") as mock_shell:
+        mock_proc = AsyncMock()
+        mock_proc.communicate.side_effect = stop_during_block
+        mock_proc.returncode = 0
+        mock_shell.return_value = mock_proc
+        await run_job(job)
+
+    assert seen_while_running[0].status == "failed"
+    assert seen_while_running[0].worker_active
+    stored = await ExecutionJob.get(job.id)
+    assert stored.status == "failed"
+    assert not stored.worker_active
+    assert _sample(
+        "execution_job_duration_seconds_count", {"status": "completed"}
+    ) == completed
+    rollups = await ExecutionRollup.find(ExecutionRollup.runbook_id == runbook.id).to_list()
+    assert {(r.granularity, r.jobs, r.failed) for r in rollups} == {
+        ("hour", 1, 1),
+        ("day", 1, 1),
+    }
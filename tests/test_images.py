@@ -0,0 +1,95 @@
+# ruff: noqa: E402
+import sys
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db as db
+from app.main import app
+from app.models import EnvironmentBuild, EnvironmentImage, ExecutionEnvironment
+from app.services import builds, images
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "testdb")
+    # Tests run the warm-up themselves.
+    monkeypatch.setattr(images, "IMAGE_WARMUP_ON_START", False)
+    yield
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def add_environment(client, image_tag, dockerfile="FROM alpine"):
+    environment = ExecutionEnvironment(
+        name=image_tag,
+        description="d",
+        dockerfile=dockerfile,
+        image_tag=image_tag,
+        created_by=uuid4(),
+    )
+    client.portal.call(environment.insert)
+    return environment
+
+
+def test_warm_up_builds_missing_images_once(client, monkeypatch):
+    present = {"runbook-exec-env:a"}
+    built = []
+    monkeypatch.setattr(images, "_image_present", lambda tag: tag in present)
+    monkeypatch.setattr(
+        builds, "docker_build", lambda dockerfile, tag, emit: built.append(tag) or tag
+    )
+    add_environment(client, "runbook-exec-env:a")
+    add_environment(client, "runbook-exec-env:b", "FROM debian")
+    # Shares the image of the previous environment.
+    add_environment(client, "runbook-exec-env:b", "FROM debian")
+
+    available = client.portal.call(images.warm_up_images, 2)
+    assert available == {"runbook-exec-env:a": True, "runbook-exec-env:b": True}
+    assert built == ["runbook-exec-env:b"]
+
+
+def test_gc_removes_only_old_unreferenced_images(client, monkeypatch):
+    old = datetime.now(UTC) - timedelta(days=1)
+    local = [
+        (["runbook-exec-env:used"], old),
+        (["runbook-exec-env:orphan", "runbook-exec-env:legacy"], old),
+        (["runbook-exec-env:building"], old),
+        (["runbook-exec-env:fresh"], datetime.now(UTC)),
+    ]
+    removed = []
+    monkeypatch.setattr(images, "_local_images", lambda: local)
+    monkeypatch.setattr(images, "_remove_tag", removed.append)
+    add_environment(client, "runbook-exec-env:used")
+    build = EnvironmentBuild(
+        environment_id=uuid4(),
+        dockerfile="FROM x",
+        dockerfile_hash="building",
+        status="building",
+    )
+    client.portal.call(build.insert)
+    stale = EnvironmentImage(
+        id="orphan", image_tag="runbook-exec-env:orphan", ref_count=0, created_at=old
+    )
+    client.portal.call(stale.insert)
+
+    assert client.portal.call(images.collect_orphaned_images, 600) == [
+        "runbook-exec-env:orphan",
+        "runbook-exec-env:legacy",
+    ]
+    assert removed == ["runbook-exec-env:orphan", "runbook-exec-env:legacy"]
+    assert client.portal.call(EnvironmentImage.get, "orphan") is None
@@ -0,0 +1,101 @@
+# ruff: noqa: E402
+import sys
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db as db
+from app.main import document_models
+from app.models import AuditLog, RunbookVersion, User
+from app.services.indexes import (
+    DuplicateValuesError,
+    declared_indexes,
+    find_missing_indexes,
+)
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "indexdb")
+    yield
+
+
+@pytest.mark.asyncio
+async def test_declared_indexes_cover_hot_lookups():
+    await db.create_init_beanie(document_models)()
+    assert declared_indexes(User)[(("api_key", 1),)] is True
+    assert declared_indexes(User)[(("username", 1),)] is True
+    assert declared_indexes(RunbookVersion)[
+        (("runbook_id", 1), ("version_number", -1))
+    ] is True
+    assert (("user_id", 1), ("timestamp", -1), ("_id", -1)) in declared_indexes(
+        AuditLog
+    )
+
+
+@pytest.mark.asyncio
+async def test_missing_indexes_are_reported():
+    await db.create_init_beanie(document_models, create_indexes=False)()
+    await AuditLog.get_motor_collection().drop_indexes()
+    problems = await find_missing_indexes([AuditLog])
+    assert any("audit_logs: missing index (user_id:1, timestamp:-1, _id:-1)" in p for p in problems)
+
+    await db.create_init_beanie(document_models)()
+    assert await find_missing_indexes(document_models) == []
+
+
+@pytest.fixture
+def shared_client(monkeypatch):
+    """One mock client for the test and the app; mock clients share no data."""
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(db, "AsyncIOMotorClient", lambda *args, **kwargs: client)
+    return client
+
+
+async def legacy_users_collection(client):
+    """The users collection as earlier releases left it: `username_1` not unique."""
+    users = client["indexdb"]["User"]
+    await users.create_index("username", name="username_1")
+    return users
+
+
+@pytest.mark.asyncio
+async def test_legacy_username_index_is_recreated_unique(shared_client):
+    users = await legacy_users_collection(shared_client)
+    await users.insert_many(
+        [{"username": "a", "api_key": "k1"}, {"username": "b", "api_key": "k2"}]
+    )
+
+    await db.create_init_beanie(document_models)()
+    assert (await users.index_information())["username_1"].get("unique") is True
+
+
+@pytest.mark.asyncio
+async def test_legacy_username_index_with_duplicates_is_refused(shared_client):
+    users = await legacy_users_collection(shared_client)
+    await users.insert_many([{"username": "a"}, {"username": "a"}])
+
+    with pytest.raises(DuplicateValuesError, match="username"):
+        await db.create_init_beanie(document_models)()
+    assert not (await users.index_information())["username_1"].get("unique")
+
+
+@pytest.mark.asyncio
+async def test_duplicate_version_numbers_are_refused(shared_client):
+    runbook_id = uuid4()
+    versions = shared_client["indexdb"]["runbook_versions"]
+    await versions.insert_many(
+        [{"runbook_id": str(runbook_id), "version_number": 2} for _ in range(2)]
+    )
+
+    with pytest.raises(DuplicateValuesError, match=f"runbook_id={runbook_id}"):
+        await db.create_init_beanie(document_models)()
+    assert "runbook_id_1_version_number_-1" not in await versions.index_information()
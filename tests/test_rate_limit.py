@@ -0,0 +1,110 @@
+# ruff: noqa: E402
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from prometheus_client import REGISTRY
+
+import app.db as db
+from app.main import app
+from app.services.rate_limit import Limit, MongoBucketStore
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "testdb")
+    monkeypatch.setenv("SECRET_KEY", "870STvCfnd0oNi-TeWJM6986M9Rfm26zbnIgTOKwDLw=")
+    yield
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def signup(client: TestClient, username: str, role: str) -> str:
+    resp = client.post(
+        "/users/signup",
+        json={"username": username, "password": "pw", "role": role},
+    )
+    assert resp.status_code == 201
+    return resp.json()["api_key"]
+
+
+def create_runbook(client: TestClient, token: str) -> str:
+    resp = client.post(
+        "/runbooks",
+        headers={"X-API-KEY": token},
+        json={
+            "title": "Limited",
+            "description": "d",
+            "blocks": [{"type": "instruction", "config": {"text": "Step 1"}, "order": 1}],
+        },
+    )
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def test_job_enqueues_are_limited_per_user(client: TestClient, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_JOBS", "2/60")
+    first = signup(client, "dev1", "developer")
+    second = signup(client, "dev2", "developer")
+    runbook_id = create_runbook(client, first)
+
+    def enqueue(token):
+        return client.post(f"/runbooks/{runbook_id}/execute", headers={"X-API-KEY": token})
+
+    assert enqueue(first).status_code == 202
+    assert enqueue(first).status_code == 202
+    resp = enqueue(first)
+    assert resp.status_code == 429
+    assert 0 < int(resp.headers["Retry-After"]) <= 30
+    # Another user has a bucket of their own.
+    assert enqueue(second).status_code == 202
+    assert REGISTRY.get_sample_value(
+        "rate_limit_decisions_total",
+        {"scope": "jobs", "role": "developer", "result": "throttled"},
+    )
+
+
+def test_role_limits_and_separate_scopes(client: TestClient, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_BLOCKS", "1/60")
+    monkeypatch.setenv("RATE_LIMIT_BLOCKS_SRE", "off")
+    dev = signup(client, "dev3", "developer")
+    sre = signup(client, "sre3", "sre")
+    runbook_id = create_runbook(client, sre)
+    body = {
+        "runbook_id": runbook_id,
+        "block": {"type": "instruction", "config": {"text": "hi"}, "order": 1},
+    }
+
+    def run_block(token):
+        return client.post("/blocks/execute", headers={"X-API-KEY": token}, json=body)
+
+    assert run_block(dev).status_code == 200
+    assert run_block(dev).status_code == 429
+    # Queued jobs draw from a different bucket.
+    resp = client.post(f"/runbooks/{runbook_id}/execute", headers={"X-API-KEY": dev})
+    assert resp.status_code == 202
+    for _ in range(3):
+        assert run_block(sre).status_code == 200
+
+
+def test_shared_bucket_store(client: TestClient):
+    store = MongoBucketStore()
+    limit = Limit(requests=2, period=10)
+    results = [
+        client.portal.call(store.acquire, "jobs:shared", limit, 1000.0) for _ in range(3)
+    ]
+    assert results == [0.0, 0.0, 5.0]
+    # One token is back after one interval.
+    assert client.portal.call(store.acquire, "jobs:shared", limit, 1005.0) == 0.0
@@ -0,0 +1,131 @@
+# ruff: noqa: E402
+import gzip
+import json
+import sys
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db as db
+from app.main import app, document_models
+from app.models import ArchivedExecution, AuditLog, ExecutionJob, ExecutionStep
+from app.services.retention import RetentionSettings, enforce_retention
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "retentiondb")
+    yield
+
+
+async def _job(days_ago: float, status: str = "completed") -> ExecutionJob:
+    job = ExecutionJob(
+        runbook_id=uuid4(),
+        version_id=uuid4(),
+        status=status,
+        start_time=datetime.now(UTC) - timedelta(days=days_ago),
+    )
+    await job.insert()
+    await ExecutionStep(
+        job_id=job.id, block_id=uuid4(), status="success", output="ok", exit_code=0
+    ).insert()
+    return job
+
+
+@pytest.mark.asyncio
+async def test_retention_prunes_and_archives(tmp_path):
+    await db.create_init_beanie(document_models)()
+    old = [await _job(40) for _ in range(3)]
+    running = await _job(40, status="running")
+    recent = await _job(1)
+    await AuditLog(
+        timestamp=datetime.now(UTC) - timedelta(days=100),
+        user_id=uuid4(),
+        action="old",
+        target_id=uuid4(),
+    ).insert()
+    await AuditLog(user_id=uuid4(), action="new", target_id=uuid4()).insert()
+
+    settings = RetentionSettings(
+        execution_days=30, audit_days=90, archive_dir=str(tmp_path), batch_size=2
+    )
+    assert await enforce_retention(settings) == {"executions": 3, "audit_logs": 1}
+
+    remaining = {job.id for job in await ExecutionJob.find_all().to_list()}
+    assert remaining == {running.id, recent.id}
+    assert await ExecutionStep.count() == 2
+    assert [log.action for log in await AuditLog.find_all().to_list()] == ["new"]
+
+    # Two batches of jobs and one of audit entries.
+    archives = sorted(path.name for path in tmp_path.iterdir())
+    assert len(archives) == 3
+    archived = await ArchivedExecution.get(old[0].id)
+    with gzip.open(tmp_path / archived.archive, "rt") as archive:
+        records = [json.loads(line) for line in archive]
+    assert records[0]["steps"][0]["output"] == "ok"
+
+
+def test_rehydrate_archived_job(tmp_path, monkeypatch):
+    monkeypatch.setenv("RETENTION_ARCHIVE_DIR", str(tmp_path))
+    with TestClient(app) as client:
+        token = client.post(
+            "/users/signup",
+            json={"username": "retention", "password": "pw", "role": "sre"},
+        ).json()["api_key"]
+        headers = {"X-API-KEY": token}
+
+        job = client.portal.call(_job, 40)
+        client.portal.call(
+            enforce_retention,
+            RetentionSettings(execution_days=30, archive_dir=str(tmp_path)),
+        )
+        assert client.get(f"/executions/{job.id}", headers=headers).status_code == 404
+
+        resp = client.post(f"/executions/{job.id}/rehydrate", headers=headers)
+        assert resp.status_code == 200
+        resp = client.get(f"/executions/{job.id}", headers=headers)
+        assert resp.status_code == 200
+        assert resp.json()["steps"][0]["output"] == "ok"
+
+        # A restored job is not pruned again by the next pass.
+        client.portal.call(
+            enforce_retention,
+            RetentionSettings(execution_days=30, archive_dir=str(tmp_path)),
+        )
+        assert client.get(f"/executions/{job.id}", headers=headers).status_code == 200
+
+        resp = client.post(f"/executions/{uuid4()}/rehydrate", headers=headers)
+        assert resp.status_code == 404
+
+        archived = client.portal.call(ArchivedExecution.get, job.id)
+
+        async def archive_elsewhere(job_id, archive):
+            await ExecutionJob.find(ExecutionJob.id == job_id).delete()
+            await ArchivedExecution(
+                id=job_id,
+                runbook_id=uuid4(),
+                status="completed",
+                start_time=datetime.now(UTC),
+                archive=archive,
+            ).save()
+
+        # Listed in an archive that does not hold it.
+        client.portal.call(archive_elsewhere, job.id, archived.archive)
+        other = uuid4()
+        client.portal.call(archive_elsewhere, other, archived.archive)
+        resp = client.post(f"/executions/{other}/rehydrate", headers=headers)
+        assert resp.status_code == 404
+
+        (tmp_path / archived.archive).unlink()
+        resp = client.post(f"/executions/{job.id}/rehydrate", headers=headers)
+        assert resp.status_code == 410
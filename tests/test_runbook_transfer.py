@@ -0,0 +1,185 @@
+# ruff: noqa: E402
+import gzip
+import json
+import sys
+from pathlib import Path
+from uuid import UUID, uuid4
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db as db
+from app.main import app
+from app.models import RunbookVersion
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "transferdb")
+    yield
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def headers(client: TestClient):
+    resp = client.post(
+        "/users/signup",
+        json={"username": "transfer", "password": "pw", "role": "sre"},
+    )
+    return {"X-API-KEY": resp.json()["api_key"]}
+
+
+def _create_runbook(client, headers, title):
+    runbook = client.post(
+        "/runbooks",
+        headers=headers,
+        json={
+            "title": title,
+            "description": "d",
+            "tags": ["ops"],
+            "blocks": [{"type": "command", "config": {"command": "uptime"}, "order": 1}],
+        },
+    ).json()
+    client.put(
+        f"/runbooks/{runbook['id']}",
+        headers=headers,
+        json={
+            "title": title,
+            "description": "d",
+            "tags": ["ops"],
+            "blocks": [{"type": "command", "config": {"command": "df -h"}, "order": 1}],
+        },
+    )
+    return runbook
+
+
+def test_export_streams_runbooks_with_history(client: TestClient, headers):
+    _create_runbook(client, headers, "Disk check")
+
+    resp = client.get("/runbooks/export", headers=headers)
+    plain = resp.content
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["title"] == "Disk check"
+    assert [v["version_number"] for v in lines[0]["versions"]] == [1, 2]
+    assert lines[0]["versions"][1]["blocks"][0]["config"] == {"command": "df -h"}
+
+    resp = client.get("/runbooks/export", headers=headers, params={"gzip": "true"})
+    assert resp.headers["content-type"] == "application/gzip"
+    assert gzip.decompress(resp.content) == plain
+
+
+def test_import_applies_conflict_policy(client: TestClient, headers):
+    runbook = _create_runbook(client, headers, "Disk check")
+    export = client.get("/runbooks/export", headers=headers, params={"gzip": "true"}).content
+
+    resp = client.post("/runbooks/import", headers=headers, content=export)
+    assert resp.status_code == 200
+    assert resp.json()["skipped"] == 1
+    assert resp.json()["imported"] == 0
+
+    resp = client.post(
+        "/runbooks/import",
+        headers=headers,
+        params={"on_conflict": "remap"},
+        content=gzip.decompress(export) + b"not json\n",
+    )
+    summary = resp.json()
+    assert summary["imported"] == 1
+    assert summary["errors"][0]["line"] == 2
+    new_id = summary["remapped"][runbook["id"]]
+
+    copy = client.get(f"/runbooks/{new_id}", headers=headers).json()
+    assert copy["version"] == 2
+    assert copy["blocks"][0]["config"] == {"command": "df -h"}
+    assert client.get("/runbooks/tags", headers=headers).json() == [
+        {"tag": "ops", "count": 2}
+    ]
+    search = client.get("/runbooks/search", headers=headers, params={"q": "df"}).json()
+    assert search["total"] == 2
+
+    line = json.loads(gzip.decompress(export))
+    line["title"] = "Overwritten"
+    resp = client.post(
+        "/runbooks/import",
+        headers=headers,
+        params={"on_conflict": "overwrite"},
+        content=json.dumps(line),
+    )
+    assert resp.json()["overwritten"] == 1
+    assert client.get(f"/runbooks/{runbook['id']}", headers=headers).json()["title"] == (
+        "Overwritten"
+    )
+    assert len(client.get("/runbooks", headers=headers).json()) == 2
+
+    logs = client.get("/audit", headers=headers, params={"action": "import_runbooks"})
+    assert len(logs.json()) == 3
+    assert logs.json()[0]["details"]["overwritten"] == 1
+
+
+def test_import_reports_lines_that_cannot_be_stored(client: TestClient, headers):
+    runbook = _create_runbook(client, headers, "Disk check")
+    export = client.get("/runbooks/export", headers=headers).content
+    client.delete(f"/runbooks/{runbook['id']}", headers=headers)
+    valid = json.loads(export)
+    repeated = {**valid, "id": str(uuid4()), "title": "Repeated"}
+    repeated["versions"] = [valid["versions"][0], valid["versions"][0]]
+    # A version left behind by an earlier failure takes version 1 of this one.
+    orphaned = {**valid, "id": str(uuid4()), "title": "Orphaned"}
+
+    async def leave_orphan():
+        await RunbookVersion(runbook_id=UUID(orphaned["id"]), version_number=1).insert()
+
+    client.portal.call(leave_orphan)
+    body = "\n".join(json.dumps(line) for line in (valid, repeated, orphaned))
+    resp = client.post("/runbooks/import", headers=headers, content=body)
+    assert resp.status_code == 200
+    summary = resp.json()
+    assert summary["imported"] == 1
+    assert [error["line"] for error in summary["errors"]] == [2, 3]
+    assert "duplicate version numbers" in summary["errors"][0]["error"]
+
+    assert [r["title"] for r in client.get("/runbooks", headers=headers).json()] == [
+        "Disk check"
+    ]
+    assert client.get(f"/runbooks/{orphaned['id']}", headers=headers).status_code == 404
+    logs = client.get("/audit", headers=headers, params={"action": "import_runbooks"})
+    assert logs.json()[0]["details"]["errors"] == 2
+
+
+def test_overwrite_import_replaces_cached_versions(client: TestClient, headers):
+    runbook = _create_runbook(client, headers, "Disk check")
+    url = f"/runbooks/{runbook['id']}/versions/2"
+    resp = client.get(url, headers=headers)
+    assert resp.headers["Cache-Control"] == "private, no-cache"
+    etag = resp.headers["ETag"]
+    diff = client.get(f"/runbooks/{runbook['id']}/versions/1/diff/2", headers=headers)
+
+    line = json.loads(client.get("/runbooks/export", headers=headers).content)
+    line["versions"][1]["blocks"][0]["config"] = {"command": "du -sh /"}
+    client.post(
+        "/runbooks/import",
+        headers=headers,
+        params={"on_conflict": "overwrite"},
+        content=json.dumps(line),
+    )
+
+    resp = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["blocks"][0]["config"] == {"command": "du -sh /"}
+    resp = client.get(f"/runbooks/{runbook['id']}/versions/1/diff/2", headers=headers)
+    assert resp.headers["ETag"] != diff.headers["ETag"]
@@ -1,6 +1,7 @@
 # ruff: noqa: E402
 import sys
 from pathlib import Path
+from unittest.mock import patch
 from uuid import UUID
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
@@ -11,7 +12,8 @@ from mongomock_motor import AsyncMongoMockClient
 
 import app.db as db
 from app.main import app
-from app.models import Runbook, RunbookVersion
+from app.models import BlockContent, Runbook, RunbookVersion
+from app.services.search import build_entry
 
 
 @pytest.fixture(autouse=True)
@@ -79,6 +81,51 @@ def test_list_runbooks(client: TestClient, authenticated_user_token: str):
     assert data[0]["title"] == "RB1"
 
 
+def test_list_runbooks_reads_versions_and_blocks_in_batches(
+    client: TestClient, authenticated_user_token: str
+):
+    headers = {"X-API-KEY": authenticated_user_token}
+    for i in range(3):
+        runbook = client.post(
+            "/runbooks",
+            headers=headers,
+            json={
+                "title": f"RB{i}",
+                "description": "d",
+                "blocks": [{"type": "command", "config": {"command": "v1"}, "order": 1}],
+            },
+        ).json()
+        client.put(
+            f"/runbooks/{runbook['id']}",
+            headers=headers,
+            json={
+                "title": f"RB{i}",
+                "description": "d",
+                "blocks": [
+                    {"type": "command", "config": {"command": f"v2 of {i}"}, "order": 1}
+                ],
+            },
+        )
+
+    with (
+        patch.object(RunbookVersion, "find", wraps=RunbookVersion.find) as find_versions,
+        patch.object(BlockContent, "find", wraps=BlockContent.find) as find_blocks,
+    ):
+        data = client.get("/runbooks", headers=headers).json()
+    assert sorted((rb["title"], rb["version"]) for rb in data) == [
+        ("RB0", 2),
+        ("RB1", 2),
+        ("RB2", 2),
+    ]
+    assert {rb["blocks"][0]["config"]["command"] for rb in data} == {
+        "v2 of 0",
+        "v2 of 1",
+        "v2 of 2",
+    }
+    assert find_versions.call_count == 1
+    assert find_blocks.call_count <= 1
+
+
 def test_get_runbook(client: TestClient, authenticated_user_token: str):
     headers = {"X-API-KEY": authenticated_user_token}
     create_resp = client.post(
@@ -151,3 +198,205 @@ async def test_delete_runbook(client: TestClient, authenticated_user_token: str)
         headers=headers,
     )
     assert resp.status_code == 404
+
+
+def test_patch_runbook_blocks(client: TestClient, authenticated_user_token: str):
+    headers = {"X-API-KEY": authenticated_user_token}
+    create_resp = client.post(
+        "/runbooks",
+        headers=headers,
+        json={
+            "title": "RB1",
+            "description": "d1",
+            "blocks": [
+                {"type": "instruction", "config": {"text": "one"}, "order": 1},
+                {"type": "command", "config": {"command": "ls", "cwd": "/"}, "order": 2},
+            ],
+        },
+    )
+    runbook = create_resp.json()
+    first, second = runbook["blocks"]
+
+    resp = client.patch(
+        f"/runbooks/{runbook['id']}",
+        headers=headers,
+        json={
+            "base_version": 1,
+            "title": "Patched",
+            "operations": [
+                {
+                    "op": "update",
+                    "block_id": second["id"],
+                    "config": {"command": "ls -la", "cwd": None},
+                },
+                {"op": "move", "block_id": second["id"], "position": 0},
+                {
+                    "op": "insert",
+                    "block": {"type": "timer", "config": {"duration": 1}, "order": 0},
+                },
+                {"op": "delete", "block_id": first["id"]},
+            ],
+        },
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["version"] == 2
+    assert data["title"] == "Patched"
+    assert data["description"] == "d1"
+    assert [b["type"] for b in data["blocks"]] == ["command", "timer"]
+    assert [b["order"] for b in data["blocks"]] == [1, 2]
+    assert data["blocks"][0]["config"] == {"command": "ls -la"}
+
+    # The same base version is now stale.
+    resp = client.patch(
+        f"/runbooks/{runbook['id']}",
+        headers=headers,
+        json={"base_version": 1, "operations": [{"op": "delete", "block_id": second["id"]}]},
+    )
+    assert resp.status_code == 409
+
+    resp = client.patch(
+        f"/runbooks/{runbook['id']}",
+        headers=headers,
+        json={"base_version": 2, "operations": [{"op": "delete", "block_id": first["id"]}]},
+    )
+    assert resp.status_code == 400
+
+
+def test_search_runbooks(client: TestClient, authenticated_user_token: str):
+    headers = {"X-API-KEY": authenticated_user_token}
+    postgres = client.post(
+        "/runbooks",
+        headers=headers,
+        json={
+            "title": "Postgres failover",
+            "description": "Promote the replica",
+            "tags": ["database"],
+            "blocks": [
+                {
+                    "type": "command",
+                    "name": "Promote",
+                    "config": {"command": "pg_ctl promote -D /var/lib/postgresql"},
+                    "order": 1,
+                }
+            ],
+        },
+    ).json()
+    client.post(
+        "/runbooks",
+        headers=headers,
+        json={
+            "title": "Restart web tier",
+            "description": "Check postgres connections first",
+            "blocks": [
+                {"type": "api", "config": {"url": "https://web.internal/health"}, "order": 1}
+            ],
+        },
+    )
+
+    resp = client.get("/runbooks/search", headers=headers, params={"q": "postgres"})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["total"] == 2
+    # The title match outranks the description match.
+    assert [hit["title"] for hit in data["items"]] == [
+        "Postgres failover",
+        "Restart web tier",
+    ]
+
+    # Block text and word prefixes are searchable.
+    resp = client.get("/runbooks/search", headers=headers, params={"q": "promo var"})
+    assert [hit["id"] for hit in resp.json()["items"]] == [postgres["id"]]
+    resp = client.get("/runbooks/search", headers=headers, params={"q": "health"})
+    assert [hit["title"] for hit in resp.json()["items"]] == ["Restart web tier"]
+
+    resp = client.get(
+        "/runbooks/search", headers=headers, params={"q": "postgres", "skip": 1, "limit": 1}
+    )
+    assert [hit["title"] for hit in resp.json()["items"]] == ["Restart web tier"]
+
+    # Updates replace the indexed content and deletes remove it.
+    client.put(
+        f"/runbooks/{postgres['id']}",
+        headers=headers,
+        json={"title": "MySQL failover", "description": "d", "blocks": []},
+    )
+    resp = client.get("/runbooks/search", headers=headers, params={"q": "promote"})
+    assert resp.json()["total"] == 0
+    resp = client.get("/runbooks/search", headers=headers, params={"q": "mysql"})
+    assert resp.json()["items"][0]["version"] == 2
+
+    client.delete(f"/runbooks/{postgres['id']}", headers=headers)
+    resp = client.get("/runbooks/search", headers=headers, params={"q": "failover"})
+    assert resp.json()["total"] == 0
+
+
+def test_search_ranks_every_match_before_paging(
+    client: TestClient, authenticated_user_token: str
+):
+    headers = {"X-API-KEY": authenticated_user_token}
+    created_by = UUID(int=1)
+
+    async def index(title, description):
+        runbook = Runbook(title=title, description=description, created_by=created_by)
+        await build_entry(runbook, 1, []).insert()
+
+    # Weak matches stored before the strongest one.
+    for i in range(30):
+        client.portal.call(index, f"Notes {i:02}", "check the disk")
+    client.portal.call(index, "Disk cleanup", "d")
+
+    for query in ("disk", "dis"):
+        resp = client.get(
+            "/runbooks/search", headers=headers, params={"q": query, "limit": 2}
+        )
+        data = resp.json()
+        assert data["total"] == 31
+        assert [hit["title"] for hit in data["items"]] == ["Disk cleanup", "Notes 00"]
+    assert data["items"][0]["score"] == 4.0
+
+
+def test_tag_filter_and_facets(client: TestClient, authenticated_user_token: str):
+    headers = {"X-API-KEY": authenticated_user_token}
+    for title, tags in [
+        ("Failover", ["db", "postgres"]),
+        ("Vacuum", ["db", "postgres", "db"]),
+        ("Cache flush", ["redis"]),
+    ]:
+        created = client.post(
+            "/runbooks",
+            headers=headers,
+            json={"title": title, "description": "d", "blocks": [], "tags": tags},
+        ).json()
+
+    resp = client.get("/runbooks", headers=headers, params={"tags": "db,postgres"})
+    assert sorted(rb["title"] for rb in resp.json()) == ["Failover", "Vacuum"]
+    resp = client.get(
+        "/runbooks", headers=headers, params={"tags": "postgres,redis", "match": "any"}
+    )
+    assert len(resp.json()) == 3
+    resp = client.get("/runbooks", headers=headers, params={"tags": "db,redis"})
+    assert resp.json() == []
+
+    resp = client.get("/runbooks/tags", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json() == [
+        {"tag": "db", "count": 2},
+        {"tag": "postgres", "count": 2},
+        {"tag": "redis", "count": 1},
+    ]
+
+    # Counts follow tag edits and deletes.
+    client.patch(
+        f"/runbooks/{created['id']}",
+        headers=headers,
+        json={"base_version": 1, "tags": ["redis", "cache"]},
+    )
+    resp = client.get("/runbooks/tags", headers=headers, params={"limit": 1})
+    assert resp.json() == [{"tag": "db", "count": 2}]
+    client.delete(f"/runbooks/{created['id']}", headers=headers)
+    resp = client.get("/runbooks/tags", headers=headers)
+    assert {facet["tag"]: facet["count"] for facet in resp.json()} == {
+        "db": 2,
+        "postgres": 2,
+    }
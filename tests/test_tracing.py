@@ -0,0 +1,139 @@
+# ruff: noqa: E402
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import app.db as db
+from app.main import app
+from app.services.tracing import tracer
+
+
+@pytest.fixture(autouse=True)
+def setup_db(monkeypatch):
+    monkeypatch.setattr(db, "AsyncIOMotorClient", AsyncMongoMockClient)
+    monkeypatch.setenv("DB_USER", "u")
+    monkeypatch.setenv("DB_PASSWORD", "p")
+    monkeypatch.setenv("DB_HOST", "localhost")
+    monkeypatch.setenv("DB_NAME", "testdb")
+    monkeypatch.setenv("SECRET_KEY", "870STvCfnd0oNi-TeWJM6986M9Rfm26zbnIgTOKwDLw=")
+    yield
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def signup(client: TestClient, username: str, role: str) -> str:
+    resp = client.post(
+        "/users/signup",
+        json={"username": username, "password": "pw", "role": role},
+    )
+    assert resp.status_code == 201
+    return resp.json()["api_key"]
+
+
+def run_traced_job(client: TestClient, token: str) -> str:
+    headers = {"X-API-KEY": token}
+    resp = client.post(
+        "/runbooks",
+        headers=headers,
+        json={
+            "title": "Traced",
+            "description": "d",
+            "blocks": [
+                {"type": "command", "config": {"command": "echo traced"}, "order": 1},
+                {"type": "instruction", "config": {"text": "Done"}, "order": 2},
+            ],
+        },
+    )
+    assert resp.status_code == 201
+    resp = client.post(f"/runbooks/{resp.json()['id']}/execute", headers=headers)
+    job_id = resp.json()["job_id"]
+    deadline = time.monotonic() + 10
+    while client.get(f"/executions/{job_id}", headers=headers).json()["status"] != "completed":
+        assert time.monotonic() < deadline, "job did not complete"
+        time.sleep(0.1)
+    return job_id
+
+
+def spans_of(document: dict) -> list:
+    return document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+def finished_trace(client: TestClient, job_id: str, token: str) -> list:
+    """The job's spans once the root span has ended, after the last status write."""
+    deadline = time.monotonic() + 5
+    while True:
+        resp = client.get(f"/executions/{job_id}/trace", headers={"X-API-KEY": token})
+        assert resp.status_code == 200
+        spans = spans_of(resp.json())
+        if any(span["name"] == "run_job" for span in spans):
+            return spans
+        assert time.monotonic() < deadline, "trace did not finish"
+        time.sleep(0.05)
+
+
+def attributes_of(span: dict) -> dict:
+    return {a["key"]: next(iter(a["value"].values())) for a in span["attributes"]}
+
+
+def test_job_trace_covers_queueing_blocks_and_writes(client: TestClient):
+    sre = signup(client, "sre", "sre")
+    job_id = run_traced_job(client, sre)
+
+    spans = {span["name"]: span for span in finished_trace(client, job_id, sre)}
+    assert {
+        "run_job",
+        "queued",
+        "process_block",
+        "execute_command_block",
+        "subprocess.run",
+        "insert execution_steps",
+        "update execution_jobs",
+    } <= set(spans)
+
+    root = spans["run_job"]
+    assert root["parentSpanId"] == ""
+    assert root["traceId"] == job_id.replace("-", "")
+    assert attributes_of(root)["job.status"] == "completed"
+    assert spans["queued"]["parentSpanId"] == root["spanId"]
+    executor = attributes_of(spans["subprocess.run"])
+    assert executor["job.id"] == job_id
+    assert executor["block.type"] == "command"
+    assert "block.id" in executor
+
+
+def test_job_trace_requires_sre_and_known_job(client: TestClient):
+    sre = signup(client, "sre", "sre")
+    dev = signup(client, "dev", "developer")
+    job_id = run_traced_job(client, dev)
+
+    resp = client.get(f"/executions/{job_id}/trace", headers={"X-API-KEY": dev})
+    assert resp.status_code == 403
+    resp = client.get(
+        "/executions/00000000-0000-0000-0000-000000000000/trace",
+        headers={"X-API-KEY": sre},
+    )
+    assert resp.status_code == 404
+
+
+def test_exported_trace_is_read_back_once_evicted(client: TestClient, tmp_path, monkeypatch):
+    export = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracer, "export_path", str(export))
+    sre = signup(client, "sre", "sre")
+    job_id = run_traced_job(client, sre)
+    finished_trace(client, job_id, sre)
+
+    assert export.read_text().count("\n") == 1
+    tracer._traces.clear()
+    resp = client.get(f"/executions/{job_id}/trace", headers={"X-API-KEY": sre})
+    assert resp.status_code == 200
+    assert "run_job" in {span["name"] for span in spans_of(resp.json())}
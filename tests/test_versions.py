@@ -1,16 +1,23 @@
 # ruff: noqa: E402
 import asyncio
 import sys
+import time
 from pathlib import Path
+from unittest.mock import AsyncMock, patch
+from uuid import UUID
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from mongomock_motor import AsyncMongoMockClient
 
 import app.db as db
 from app.main import app
+from app.models import Block, BlockContent, RunbookVersion
+import app.services.versions as versions_service
+from app.services.versions import diff_blocks, load_blocks
 
 
 @pytest.fixture(autouse=True)
@@ -108,3 +115,252 @@ def test_rollback_non_existent_version(
 
     resp = client.post(f"/runbooks/{runbook_id}/versions/99/rollback", headers=headers)
     assert resp.status_code == 404
+
+
+def test_list_version_summaries(client: TestClient, authenticated_user_token: str):
+    headers = {"X-API-KEY": authenticated_user_token}
+    runbook_id = create_runbook_with_versions(client, headers)
+
+    resp = client.get(f"/runbooks/{runbook_id}/versions/summary", headers=headers)
+    assert resp.status_code == 200
+    page = resp.json()
+    assert page["total"] == 2
+    assert [item["version"] for item in page["items"]] == [2, 1]
+    assert page["items"][0]["block_count"] == 1
+    assert page["items"][0]["author"] == "testuser"
+    assert page["items"][0]["content_hash"] != page["items"][1]["content_hash"]
+    assert "blocks" not in page["items"][0]
+
+    resp = client.get(
+        f"/runbooks/{runbook_id}/versions/summary?skip=1&limit=1", headers=headers
+    )
+    assert [item["version"] for item in resp.json()["items"]] == [1]
+
+
+def test_get_single_version(client: TestClient, authenticated_user_token: str):
+    headers = {"X-API-KEY": authenticated_user_token}
+    runbook_id = create_runbook_with_versions(client, headers)
+
+    resp = client.get(f"/runbooks/{runbook_id}/versions/1", headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["version"] == 1
+    assert data["blocks"][0]["config"]["text"] == "v1"
+
+    resp = client.get(f"/runbooks/{runbook_id}/versions/99", headers=headers)
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_versions_share_unchanged_blocks(
+    client: TestClient, authenticated_user_token: str
+):
+    headers = {"X-API-KEY": authenticated_user_token}
+    blocks = [
+        {"type": "instruction", "config": {"text": "keep"}, "order": 1},
+        {"type": "command", "config": {"command": "ls"}, "order": 2},
+    ]
+    resp = client.post(
+        "/runbooks",
+        headers=headers,
+        json={"title": "Dedup", "description": "d", "blocks": blocks},
+    )
+    runbook = resp.json()
+    blocks = runbook["blocks"]
+
+    # Change only the second block and move it first.
+    blocks[1]["config"]["command"] = "ls -la"
+    blocks[0]["order"], blocks[1]["order"] = 2, 1
+    resp = client.put(
+        f"/runbooks/{runbook['id']}",
+        headers=headers,
+        json={"title": "Dedup", "description": "d", "blocks": blocks},
+    )
+    assert resp.status_code == 200
+    assert sorted(b["order"] for b in resp.json()["blocks"]) == [1, 2]
+
+    versions = await RunbookVersion.find(
+        RunbookVersion.runbook_id == UUID(runbook["id"])
+    ).to_list()
+    assert all(v.blocks == [] for v in versions)
+    assert await BlockContent.count() == 3
+
+    resp = client.get(f"/runbooks/{runbook['id']}/versions", headers=headers)
+    v1, v2 = resp.json()
+    assert v1["blocks"][1]["config"]["command"] == "ls"
+    assert v2["blocks"][1]["config"]["command"] == "ls -la"
+    assert v1["blocks"][0]["id"] == v2["blocks"][0]["id"]
+
+
+def test_diff_blocks_reports_only_changes():
+    keep = Block(type="instruction", config={"text": "a"}, order=1)
+    moved = Block(type="command", config={"command": "ls"}, order=2)
+    edited = Block(type="command", config={"command": "df", "timeout": 5}, order=3)
+    other = Block(type="command", config={"command": "uptime"}, order=4)
+    removed = Block(type="timer", config={"duration": 1}, order=5)
+    added = Block(type="instruction", config={"text": "new"}, order=6)
+
+    old = [keep, moved, edited, other, removed]
+    new = [
+        keep,
+        edited.model_copy(update={"order": 2, "config": {"command": "df -h", "timeout": 5}}),
+        other.model_copy(update={"order": 3}),
+        moved.model_copy(update={"order": 4}),
+        added,
+    ]
+
+    changes = {(c.change, c.block_id): c for c in diff_blocks(old, new)}
+    assert set(changes) == {
+        ("removed", removed.id),
+        ("added", added.id),
+        ("reordered", moved.id),
+        ("changed", edited.id),
+    }
+    edit = changes[("changed", edited.id)]
+    assert list(edit.fields) == ["config.command"]
+    assert edit.fields["config.command"].new == "df -h"
+    assert changes[("added", added.id)].block == added
+
+
+def test_diff_endpoint(client: TestClient, authenticated_user_token: str):
+    headers = {"X-API-KEY": authenticated_user_token}
+    runbook_id = create_runbook_with_versions(client, headers)
+
+    resp = client.get(f"/runbooks/{runbook_id}/versions/1/diff/2", headers=headers)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert (data["from_version"], data["to_version"]) == (1, 2)
+    kinds = sorted(c["change"] for c in data["changes"])
+    # The blocks were sent without ids, so each version got a new block.
+    assert kinds == ["added", "removed"]
+
+    resp = client.get(f"/runbooks/{runbook_id}/versions/2/diff/2", headers=headers)
+    assert resp.json()["changes"] == []
+
+    resp = client.get(f"/runbooks/{runbook_id}/versions/1/diff/9", headers=headers)
+    assert resp.status_code == 404
+
+
+def test_version_read_is_cacheable(client: TestClient, authenticated_user_token: str):
+    headers = {"X-API-KEY": authenticated_user_token}
+    runbook_id = create_runbook_with_versions(client, headers)
+
+    resp = client.get(f"/runbooks/{runbook_id}/versions/1", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["Cache-Control"] == "private, no-cache"
+    etag = resp.headers["ETag"]
+
+    resp = client.get(
+        f"/runbooks/{runbook_id}/versions/1",
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == etag
+
+    # Deleting the runbook drops its cached versions.
+    client.delete(f"/runbooks/{runbook_id}", headers=headers)
+    resp = client.get(f"/runbooks/{runbook_id}/versions/1", headers=headers)
+    assert resp.status_code == 404
+
+
+def test_executed_credentials_never_reach_stored_blocks(
+    client: TestClient, authenticated_user_token: str, monkeypatch
+):
+    monkeypatch.setenv("SECRET_KEY", "870STvCfnd0oNi-TeWJM6986M9Rfm26zbnIgTOKwDLw=")
+    headers = {"X-API-KEY": authenticated_user_token}
+    resp = client.post(
+        "/credentials",
+        headers=headers,
+        json={"name": "api", "type": "api", "secret": "Bearer SUPERSECRET"},
+    )
+    assert resp.status_code == 201
+    block = {
+        "type": "api",
+        "config": {
+            "method": "GET",
+            "url": "https://example.com/health",
+            "headers": {"Accept": "application/json"},
+            "credential_id": resp.json()["id"],
+        },
+        "order": 1,
+    }
+    resp = client.post(
+        "/runbooks",
+        headers=headers,
+        json={"title": "Secret", "description": "d", "blocks": [block]},
+    )
+    runbook_id = resp.json()["id"]
+
+    with patch("httpx.AsyncClient.request", new_callable=AsyncMock) as request:
+        request.return_value = httpx.Response(200, json={"status": "ok"})
+        job_id = client.post(f"/runbooks/{runbook_id}/execute", headers=headers).json()["job_id"]
+        deadline = time.monotonic() + 10
+        while client.get(f"/executions/{job_id}", headers=headers).json()["status"] != "completed":
+            assert time.monotonic() < deadline, "job did not complete"
+            time.sleep(0.1)
+    assert request.call_args.kwargs["headers"]["Authorization"] == "Bearer SUPERSECRET"
+
+    # A new version is stored from whatever the block store hands out.
+    current = client.get(f"/runbooks/{runbook_id}", headers=headers).json()
+    resp = client.put(
+        f"/runbooks/{runbook_id}",
+        headers=headers,
+        json={"title": "Secret", "description": "v2", "blocks": current["blocks"]},
+    )
+    assert resp.status_code == 200
+
+    async def latest_version():
+        return await RunbookVersion.find_one(
+            RunbookVersion.runbook_id == UUID(runbook_id), RunbookVersion.version_number == 2
+        )
+
+    version = client.portal.call(latest_version)
+    blocks = client.portal.call(load_blocks, version)
+    assert blocks[0].config["headers"] == {"Accept": "application/json"}
+    for path in (
+        f"/runbooks/{runbook_id}/versions",
+        f"/runbooks/{runbook_id}/versions/1",
+        f"/runbooks/{runbook_id}/versions/2",
+        "/runbooks/export",
+    ):
+        resp = client.get(path, headers=headers)
+        assert resp.status_code == 200
+        assert "SUPERSECRET" not in resp.text
+    stored = client.portal.call(BlockContent.find_all().to_list)
+    assert all("SUPERSECRET" not in str(content.config) for content in stored)
+
+
+
+def test_concurrent_save_takes_the_next_version_number(
+    client: TestClient, authenticated_user_token: str, monkeypatch
+):
+    headers = {"X-API-KEY": authenticated_user_token}
+    runbook_id = create_runbook_with_versions(client, headers)
+    real_latest = versions_service.get_latest_version
+
+    async def stale_once(runbook_id):
+        # The first read misses version 2, as if it was saved meanwhile.
+        monkeypatch.setattr(versions_service, "get_latest_version", real_latest)
+        return await RunbookVersion.find_one(
+            RunbookVersion.runbook_id == runbook_id, RunbookVersion.version_number == 1
+        )
+
+    monkeypatch.setattr(versions_service, "get_latest_version", stale_once)
+    update = {
+        "title": "Versioned Runbook",
+        "description": "v3",
+        "blocks": [{"type": "instruction", "config": {"text": "v3"}, "order": 1}],
+    }
+    resp = client.put(f"/runbooks/{runbook_id}", headers=headers, json=update)
+    assert resp.status_code == 200
+    assert resp.json()["version"] == 3
+
+    async def always_stale(runbook_id):
+        # Every read misses the saved versions, so version 1 is always taken.
+        return None
+
+    monkeypatch.setattr(versions_service, "get_latest_version", always_stale)
+    resp = client.put(f"/runbooks/{runbook_id}", headers=headers, json=update)
+    assert resp.status_code == 409
+    resp = client.post(f"/runbooks/{runbook_id}/versions/1/rollback", headers=headers)
+    assert resp.status_code == 409